@@ -0,0 +1,12 @@
+#!/bin/bash
+# Starts WEB_WORKERS uvicorn processes on consecutive ports from 8000. nginx pins each client
+# to one of them, and workers share sessions and emits through SOCKETIO_MESSAGE_QUEUE.
+WEB_WORKERS=${WEB_WORKERS:-1}
+
+for ((i = 0; i < WEB_WORKERS; i++)); do
+    ../venv/bin/uvicorn webapp.asgi:application --host 0.0.0.0 --port $((8000 + i)) &
+done
+
+# Stop the container as soon as any worker exits so it gets restarted as a whole
+wait -n
+exit $?
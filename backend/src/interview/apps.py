@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class InterviewConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "interview"
+
+    def ready(self):
+        from webapp.database import enable_sqlite_wal
+
+        connection_created.connect(enable_sqlite_wal)
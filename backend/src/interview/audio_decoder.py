@@ -0,0 +1,161 @@
+import os
+import shutil
+import asyncio
+import logging
+
+from .metrics import registry, Gauge
+
+# Compressed formats clients may negotiate with the audioFormat query parameter, by the
+# container ffmpeg reads them from. Both carry Opus, as browsers' MediaRecorder produces it.
+AUDIO_CONTAINERS = {"webm": "webm", "ogg": "ogg"}
+# Connections of this process that may send compressed audio, one decoder each while they
+# answer; clients connecting beyond it are asked for pcm
+AUDIO_DECODER_LIMIT = int(os.environ.get("AUDIO_DECODER_LIMIT", 32))
+# Decoders run single-threaded at this niceness, so a burst of answers shares the spare CPU
+# instead of taking it from the event loops
+AUDIO_DECODER_NICE = int(os.environ.get("AUDIO_DECODER_NICE", 10))
+# Compressed bytes an answer may have waiting for its decoder before the client is paused; the
+# frames still arriving are queued all the same
+AUDIO_DECODER_MAX_QUEUED_BYTES = int(os.environ.get("AUDIO_DECODER_MAX_QUEUED_BYTES", 1 << 20))
+AUDIO_DECODER_READ_BYTES = int(os.environ.get("AUDIO_DECODER_READ_BYTES", 8192))
+
+
+logger = logging.getLogger(__name__)
+print = logger.info
+
+
+def decoder_command(container, sampling_rate) -> list[str]:
+    # fmt: off
+    return [
+        "ffmpeg", "-loglevel", "quiet", "-fflags", "+nobuffer", "-f", container, "-i", "pipe:0",
+        "-threads", "1", "-f", "s16le", "-ac", "1", "-ar", str(sampling_rate), "pipe:1",
+    ]
+    # fmt: on
+
+
+def decoding_available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+def lower_priority():
+    # Runs in the forked child before ffmpeg starts
+    os.nice(AUDIO_DECODER_NICE)
+
+
+class AudioDecoder:
+    # Decodes one answer's compressed audio, a complete stream starting with its container
+    # header, to int16 PCM with its own low-priority ffmpeg process. Frames are queued as they
+    # arrive and the PCM is handed to on_pcm in order, whole samples only; queued_bytes is what
+    # ffmpeg has yet to take, for the ingest quota, and on_drain is called whenever it took all
+    # of it. finish() returns once the last of the PCM was handed over.
+    running = 0
+
+    def __init__(self, container, sampling_rate, on_pcm, on_drain=None):
+        self.container = container
+        self.sampling_rate = sampling_rate
+        self.on_pcm = on_pcm
+        self.on_drain = on_drain
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.queued_bytes = 0
+
+        self.failed = False
+        self.compressed_bytes = 0
+        self.pcm_bytes = 0
+        self.task = asyncio.create_task(self._run())
+
+    def write(self, frame: bytes):
+        if self.failed:
+            return
+
+        self.compressed_bytes += len(frame)
+        self.queued_bytes += len(frame)
+        self.queue.put_nowait(frame)
+
+    def backlogged(self) -> bool:
+        return self.queued_bytes > AUDIO_DECODER_MAX_QUEUED_BYTES
+
+    async def finish(self) -> bool:
+        self.queue.put_nowait(None)
+        await self.task
+        return not self.failed
+
+    async def _run(self):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *decoder_command(self.container, self.sampling_rate),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+                preexec_fn=lower_priority,
+            )
+        except OSError as e:
+            print(f"Could not start ffmpeg to decode {self.container} audio: {e!r}")
+            self.failed = True
+            await self._feed(None)
+            return
+
+        AudioDecoder.running += 1
+        try:
+            reader = asyncio.create_task(self._read(process.stdout))
+            await self._feed(process.stdin)
+            await reader
+            return_code = await process.wait()
+        finally:
+            AudioDecoder.running -= 1
+
+        if return_code != 0:
+            print(f"ffmpeg exited with {return_code} while decoding {self.container} audio")
+            self.failed = True
+
+    async def _feed(self, stdin):
+        while True:
+            frame = await self.queue.get()
+            if frame is None:
+                break
+
+            self.queued_bytes -= len(frame)
+            if self.failed:
+                continue
+
+            try:
+                stdin.write(frame)
+                await stdin.drain()
+            except (BrokenPipeError, ConnectionResetError) as e:
+                print(f"ffmpeg stopped accepting {self.container} audio: {e!r}")
+                self.failed = True
+
+            if self.queue.empty() and self.on_drain is not None:
+                self.on_drain()
+
+        if stdin is None:
+            return
+
+        try:
+            stdin.close()
+            await stdin.wait_closed()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    async def _read(self, stdout):
+        # A read may end in the middle of a sample; its first byte waits for the next read
+        carry = b""
+        while True:
+            data = await stdout.read(AUDIO_DECODER_READ_BYTES)
+            if not data:
+                break
+
+            data = carry + data
+            whole = len(data) - len(data) % 2
+            carry = data[whole:]
+            if whole:
+                self.pcm_bytes += whole
+                self.on_pcm(data[:whole])
+
+
+registry.register(
+    Gauge(
+        "interview_audio_decoders",
+        "Compressed audio decoders running in this process",
+        lambda: [({}, AudioDecoder.running)],
+    )
+)
@@ -0,0 +1,130 @@
+"""
+CPU cost of decoding compressed (Opus) answers on the server, per minute of audio.
+
+A minute of Opus at each bitrate is encoded once in WebM and Ogg, the way MediaRecorder would
+send it, and cut into 250 ms frames. Each case runs in a fresh process that decodes it as
+several concurrent streams through AudioDecoder, one ffmpeg process each, feeding the frames as
+fast as ffmpeg takes them. CPU seconds per stream-minute are reported for the ffmpeg processes
+and for the event loop that feeds them, next to how much faster than real time a stream decodes
+and the bandwidth saved against 16 kHz PCM.
+
+Needs ffmpeg with libopus on the PATH. Run from backend/src:
+    python -m interview.benchmarks.audio_decode
+"""
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+
+SAMPLING_RATE = 16000
+SECONDS = 60
+FRAME_SECONDS = 0.25
+BITRATES = ("16k", "32k")
+CONTAINERS = ("webm", "ogg")
+STREAMS = (1, 4, 16)
+
+
+def encode(path, container, bitrate):
+    # Pink noise over a tone keeps the encoder from coasting on silence
+    # fmt: off
+    subprocess.run(
+        [
+            "ffmpeg", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"anoisesrc=d={SECONDS}:c=pink:a=0.05:r=48000",
+            "-f", "lavfi", "-i", f"sine=f=220:d={SECONDS}:r=48000",
+            "-filter_complex", "amix=inputs=2", "-ac", "1",
+            "-c:a", "libopus", "-b:a", bitrate, "-f", container, path,
+        ],
+        check=True,
+    )
+    # fmt: on
+
+
+def cpu_seconds(who) -> float:
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_case(path, container, streams, results):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "webapp.settings")
+    os.environ.setdefault("ANYSCALE_API_KEY", "benchmark")
+    sys.path.insert(0, os.getcwd())
+
+    from interview.audio_decoder import AudioDecoder
+
+    with open(path, "rb") as f:
+        data = f.read()
+    frame_bytes = int(len(data) * FRAME_SECONDS / SECONDS)
+    frames = [data[i : i + frame_bytes] for i in range(0, len(data), frame_bytes)]
+
+    async def decode():
+        decoded = 0
+
+        def on_pcm(pcm):
+            nonlocal decoded
+            decoded += len(pcm)
+
+        decoder = AudioDecoder(container, SAMPLING_RATE, on_pcm)
+        for frame in frames:
+            decoder.write(frame)
+            await asyncio.sleep(0)
+        assert await decoder.finish()
+        return decoded
+
+    async def main():
+        return await asyncio.gather(*(decode() for _ in range(streams)))
+
+    children, own = cpu_seconds(resource.RUSAGE_CHILDREN), cpu_seconds(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    decoded = asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    children = cpu_seconds(resource.RUSAGE_CHILDREN) - children
+    own = cpu_seconds(resource.RUSAGE_SELF) - own
+
+    minutes = sum(decoded) / (2 * SAMPLING_RATE) / 60
+    results.put((children / minutes, own / minutes, SECONDS * streams / elapsed, len(data)))
+
+
+def measure(path, container, streams):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=run_case, args=(path, container, streams, results))
+    process.start()
+    result = results.get(timeout=600)
+    process.join()
+    return result
+
+
+def main():
+    if shutil.which("ffmpeg") is None:
+        sys.exit("ffmpeg is not on the PATH; compressed audio cannot be decoded here")
+
+    temp_dir = tempfile.mkdtemp()
+    pcm_bytes = SECONDS * SAMPLING_RATE * 2
+
+    print(f"cpus: {os.cpu_count()}  {SECONDS} s per stream, {FRAME_SECONDS * 1000:.0f} ms frames")
+    print(
+        f"{'format':>12} {'streams':>8} {'ffmpeg cpu s/min':>17} {'loop cpu s/min':>15}"
+        f" {'x realtime':>11} {'kB/min':>8} {'vs pcm':>7}"
+    )
+    for bitrate in BITRATES:
+        for container in CONTAINERS:
+            path = f"{temp_dir}/{bitrate}.{container}"
+            encode(path, container, bitrate)
+            for streams in STREAMS:
+                ffmpeg_cpu, loop_cpu, realtime, size = measure(path, container, streams)
+                print(
+                    f"{container + ' ' + bitrate:>12} {streams:>8} {ffmpeg_cpu:>17.3f}"
+                    f" {loop_cpu:>15.3f} {realtime:>11.0f} {size / 1000 * 60 / SECONDS:>8.0f}"
+                    f" {pcm_bytes / size:>6.0f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Concurrent interview capacity of the Socket.IO server as the number of worker processes grows.
+
+Each worker process hosts its share of simulated interviews on its own event loop, the way
+run_web.sh starts one uvicorn process per worker. Every interview claims its session in the
+session store and streams audio (100 ms chunks, with voice activity tracking) and video through
+ConnectionHandler, plus a chat message with base64 audio every few seconds through the handler's emit.
+The capacity is the largest number of interviews for which the p99 event loop lag of every
+worker stays within the budget. WebSocket framing and Socket.IO packet decoding are not part
+of the simulation, so the absolute numbers are upper bounds; the trend across workers is the point.
+
+With --fake-redis a fakeredis TCP server stands in for Redis, so the session store and the
+Socket.IO client manager go through a real broker. Run from backend/src:
+    python -m interview.benchmarks.capacity [--fake-redis] [--workers 1 2 4]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+import numpy as np
+
+SAMPLING_RATE = 16000
+CHUNK_SECONDS = 0.1
+VIDEO_BYTES_PER_CHUNK = 12500  # About 1 Mbit/s of webm
+CHAT_INTERVAL = 5
+CHAT_AUDIO_BYTES = 60_000
+DURATION = 4
+LAG_BUDGET = 0.05
+PROBE_INTERVAL = 0.01
+
+
+def run_worker(interviews, barrier, results):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "webapp.settings")
+    os.environ.setdefault("ANYSCALE_API_KEY", "benchmark")
+    sys.path.insert(0, os.getcwd())
+
+    import django
+
+    django.setup()
+    os.chdir(tempfile.mkdtemp())
+
+    import interview.socket_server as socket_server
+    from interview.sessions import session_store
+
+    socket_server.NO_RESPONSES = True
+    socket_server.STREAMING_TRANSCRIPTION = True
+
+    class User:
+        first_name = "Bench"
+        last_name = "Mark"
+        email = "bench@example.com"
+
+    class Interview:
+        def __init__(self, uid):
+            self.uid = uid
+            self.pk = None
+            self.last_turn_index = None
+            self.company_name = "Company"
+            self.job_description = "Job description"
+
+    tone = np.sin(np.arange(int(SAMPLING_RATE * CHUNK_SECONDS)) * 0.05) * 8000
+    audio_chunk = tone.astype(np.int16).tobytes()
+    video_chunk = os.urandom(VIDEO_BYTES_PER_CHUNK)
+    chat_audio = os.urandom(CHAT_AUDIO_BYTES)
+
+    async def interview(sid, deadline):
+        handler = socket_server.ConnectionHandler(sid, Interview(sid), User())
+        handler.stream_video = False
+        handler.is_responding = True
+
+        next_chunk = next_chat = time.perf_counter()
+        while (now := time.perf_counter()) < deadline:
+            if now >= next_chat:
+                chat = {"message": "Question", "audio": handler.encode_audio(chat_audio)}
+                await handler.emit("chat", chat)
+                next_chat += CHAT_INTERVAL
+
+            await handler.process_audio(audio_chunk)
+            await handler.process_video(video_chunk)
+            next_chunk += CHUNK_SECONDS
+            await asyncio.sleep(max(next_chunk - time.perf_counter(), 0))
+
+    async def probe(deadline, lags):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await asyncio.sleep(PROBE_INTERVAL)
+            lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+    async def main():
+        # Stagger the interviews over one chunk interval, as real clients are not in lockstep
+        deadline = time.perf_counter() + DURATION
+        lags = []
+        tasks = [probe(deadline, lags)]
+        sids = [f"{os.getpid()}-{i}" for i in range(interviews)]
+        for sid in sids:
+            await session_store.claim(sid, sid)
+            tasks.append(interview(sid, deadline))
+            await asyncio.sleep(CHUNK_SECONDS / max(interviews, 1))
+        await asyncio.gather(*tasks)
+
+        for sid in sids:
+            await session_store.release(sid, sid)
+        return lags
+
+    barrier.wait()
+    lags = asyncio.run(main())
+    results.put(float(np.percentile(lags, 99)))
+
+
+def measure(workers, interviews):
+    # Returns the worst p99 loop lag over the workers
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+
+    share = [interviews // workers + (i < interviews % workers) for i in range(workers)]
+    processes = [
+        context.Process(target=run_worker, args=(count, barrier, results)) for count in share
+    ]
+    for process in processes:
+        process.start()
+    lags = [results.get(timeout=DURATION + 120) for _ in processes]
+    for process in processes:
+        process.join()
+
+    return max(lags)
+
+
+def capacity(workers):
+    # Double until the lag budget is exceeded, then bisect
+    low, high = 0, workers
+    while (lag := measure(workers, high)) <= LAG_BUDGET:
+        print(f"    {high:>5} interviews  p99 lag {lag * 1000:7.1f} ms")
+        low, high = high, high * 2
+    print(f"    {high:>5} interviews  p99 lag {lag * 1000:7.1f} ms")
+
+    while high - low > max(workers, high // 16):
+        middle = (low + high) // 2
+        lag = measure(workers, middle)
+        print(f"    {middle:>5} interviews  p99 lag {lag * 1000:7.1f} ms")
+        if lag <= LAG_BUDGET:
+            low = middle
+        else:
+            high = middle
+
+    return low
+
+
+def start_fake_redis():
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    # Inherited by the spawned workers
+    os.environ["SOCKETIO_MESSAGE_QUEUE"] = f"redis://{host}:{port}/0"
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fake-redis", action="store_true")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    if args.fake_redis:
+        start_fake_redis()
+
+    broker = os.environ.get("SOCKETIO_MESSAGE_QUEUE", "none (in-process manager)")
+    print(f"cpus: {os.cpu_count()}  broker: {broker}  p99 lag budget: {LAG_BUDGET * 1000:.0f} ms")
+
+    summary = []
+    for workers in args.workers:
+        print(f"{workers} worker(s)")
+        summary.append((workers, capacity(workers)))
+
+    print(f"\n{'workers':>7} {'interviews':>11}")
+    for workers, interviews in summary:
+        print(f"{workers:>7} {interviews:>11}")
+
+
+if __name__ == "__main__":
+    main()
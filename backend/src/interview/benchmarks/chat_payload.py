@@ -0,0 +1,60 @@
+"""
+Bytes on the wire and server encode CPU per emitted question, base64 vs binary audio.
+
+Encodes a chat event the way python-socketio does before handing it to the websocket, for
+typical gTTS mp3 sizes (gTTS produces 32 kbit/s audio).
+
+Run from backend/src:
+    python -m interview.benchmarks.chat_payload
+"""
+
+import os
+import time
+import base64
+from datetime import datetime
+
+from socketio import packet
+
+ROUNDS = 200
+
+
+def encode_chat(audio: bytes, binary: bool):
+    chat_data = {
+        "message": "Tell me about a project you are proud of and the role you played in it.",
+        "role": "assistant",
+        "interview_ended": False,
+        "timestamp": datetime.now().isoformat(),
+        "audio": audio if binary else base64.b64encode(audio).decode("utf-8"),
+    }
+    encoded = packet.Packet(packet.EVENT, data=["chat", chat_data], namespace="/").encode()
+    return encoded if isinstance(encoded, list) else [encoded]
+
+
+def wire_bytes(frames):
+    return sum(len(frame.encode("utf-8") if isinstance(frame, str) else frame) for frame in frames)
+
+
+def measure(audio, binary):
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        frames = encode_chat(audio, binary)
+    cpu = (time.process_time() - start) / ROUNDS
+    return wire_bytes(frames), cpu * 1e6
+
+
+def main():
+    print(
+        f"{'speech s':>9} {'base64 KB':>10} {'binary KB':>10} {'base64 us':>10} {'binary us':>10}"
+    )
+    for seconds in (5, 15, 30, 60):
+        audio = os.urandom(seconds * 32000 // 8)
+        text_size, text_cpu = measure(audio, binary=False)
+        binary_size, binary_cpu = measure(audio, binary=True)
+        print(
+            f"{seconds:>9} {text_size / 1024:>10.1f} {binary_size / 1024:>10.1f} "
+            f"{text_cpu:>10.1f} {binary_cpu:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+CPU cost of server-side end of turn detection, per stream.
+
+Every stream gets its own VoiceActivityTracker and EndOfTurnDetector, as each connection does
+with END_OF_TURN_DETECTION=1, and receives a minute of 100 ms audio chunks: answers of speech-like
+noise separated by pauses long enough to end the turn. The chunks of all streams are
+interleaved the way the event loop receives them. Each case runs in a fresh process and reports
+CPU seconds per stream-minute, the number of streams one core can follow, the p99 time a chunk
+holds the event loop and the turns detected.
+
+The Silero detector is measured when the model at SILERO_VAD_MODEL_PATH exists, the energy
+detector always. Run from backend/src:
+    python -m interview.benchmarks.end_of_turn
+"""
+
+import os
+import sys
+import time
+import multiprocessing
+
+import numpy as np
+
+SAMPLING_RATE = 16000
+WINDOW_SIZE_SAMPLES = 1536
+CHUNK_SECONDS = 0.1
+SECONDS = 60
+SPEECH_SECONDS = 6
+PAUSE_SECONDS = 2
+STREAMS = (1, 16, 64, 256)
+
+
+def stream_chunks() -> list[bytes]:
+    rng = np.random.default_rng(0)
+    t = np.arange(SAMPLING_RATE * SPEECH_SECONDS) / SAMPLING_RATE
+    # A voiced tone with a syllable-rate envelope and some noise
+    speech = np.sin(2 * np.pi * 180 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)) * 6000
+    speech += rng.normal(0, 800, len(t))
+    pause = rng.normal(0, 30, SAMPLING_RATE * PAUSE_SECONDS)
+
+    period = np.concatenate([speech, pause])
+    audio = np.tile(period, SECONDS // (SPEECH_SECONDS + PAUSE_SECONDS) + 1)
+    audio = audio[: SAMPLING_RATE * SECONDS].astype(np.int16).tobytes()
+
+    chunk_bytes = int(SAMPLING_RATE * CHUNK_SECONDS) * 2
+    return [audio[i : i + chunk_bytes] for i in range(0, len(audio), chunk_bytes)]
+
+
+def run_case(detector, streams, results):
+    sys.path.insert(0, os.getcwd())
+
+    from interview.vad import VoiceActivityTracker, EndOfTurnDetector, EnergyVAD, SileroVAD
+
+    chunks = stream_chunks()
+    trackers = [
+        VoiceActivityTracker(
+            SAMPLING_RATE,
+            WINDOW_SIZE_SAMPLES,
+            vad=SileroVAD() if detector == "silero" else EnergyVAD(),
+        )
+        for _ in range(streams)
+    ]
+    end_of_turn = EndOfTurnDetector()
+
+    turns = 0
+    chunk_seconds = []
+    start = time.process_time()
+    for chunk in chunks:
+        for tracker in trackers:
+            chunk_start = time.perf_counter()
+            tracker.feed(chunk)
+            if end_of_turn.ended(tracker):
+                turns += 1
+                tracker.reset()
+            chunk_seconds.append(time.perf_counter() - chunk_start)
+    cpu = time.process_time() - start
+
+    cpu_per_minute = cpu / (streams * SECONDS / 60)
+    p99 = np.percentile(chunk_seconds, 99)
+    results.put((cpu_per_minute, p99, turns / streams))
+
+
+def measure(detector, streams):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=run_case, args=(detector, streams, results))
+    process.start()
+    result = results.get(timeout=600)
+    process.join()
+    return result
+
+
+def main():
+    sys.path.insert(0, os.getcwd())
+    from interview.vad import onnxruntime, SILERO_VAD_MODEL_PATH
+
+    detectors = ["energy"]
+    if onnxruntime is not None and os.path.exists(SILERO_VAD_MODEL_PATH):
+        detectors.append("silero")
+    else:
+        print(f"Silero skipped: no onnxruntime or no model at {SILERO_VAD_MODEL_PATH}")
+
+    print(f"cpus: {os.cpu_count()}  {SECONDS} s per stream, {CHUNK_SECONDS * 1000:.0f} ms chunks")
+    print(
+        f"{'detector':>9} {'streams':>8} {'cpu ms/min':>11} {'streams/core':>13}"
+        f" {'p99 chunk us':>13} {'turns/stream':>13}"
+    )
+    for detector in detectors:
+        for streams in STREAMS:
+            cpu_per_minute, p99, turns = measure(detector, streams)
+            print(
+                f"{detector:>9} {streams:>8} {cpu_per_minute * 1000:>11.2f}"
+                f" {60 / cpu_per_minute:>13.0f} {p99 * 1e6:>13.1f} {turns:>13.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
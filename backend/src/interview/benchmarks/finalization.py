@@ -0,0 +1,189 @@
+"""
+Simultaneous interview finalizations against each database backend.
+
+Every interview goes through the database work of a connect and a disconnect: the update of
+the connect, enqueue_finalization, and the save_results update that stores the
+transcript and feedback. The interviews are split over several processes, the way run_web.sh
+and `manage.py run_jobs` share one database, and all of them finish at the same moment.
+Each configuration reports throughput, latency percentiles and the finalizations that failed,
+e.g. with "database is locked".
+
+By default it compares SQLite as it was configured before (rollback journal, 5 s lock timeout)
+with the current SQLite configuration (WAL, SQLITE_TIMEOUT). Pass a PostgreSQL URL to add it;
+its tables are created with migrate. Run from backend/src:
+    python -m interview.benchmarks.finalization [--database-url postgres://...] [--processes 4]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+TRANSCRIPT_TURNS = 40
+INTERVIEWS = [16, 64, 256]
+
+
+def setup_django(database_url, sqlite_timeout, wal):
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["SQLITE_TIMEOUT"] = str(sqlite_timeout)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "webapp.settings")
+    os.environ.setdefault("ANYSCALE_API_KEY", "benchmark")
+    sys.path.insert(0, os.getcwd())
+
+    import django
+    from django.db.backends.signals import connection_created
+    from webapp.database import enable_sqlite_wal
+
+    django.setup()
+    if not wal:
+        connection_created.disconnect(enable_sqlite_wal)
+
+
+def run_worker(config, uids, barrier, results):
+    setup_django(**config)
+
+    from django.utils import timezone
+    from webapp.database import database_sync_to_async
+    from interview.jobs import enqueue_finalization, get_interviews
+    from interview.models import Interview
+
+    transcript = json.dumps(
+        [{"question": "Question " * 20, "response": "Answer " * 60}] * TRANSCRIPT_TURNS
+    )
+    feedback = json.dumps({"score": 7, "summary": "Feedback " * 100})
+    output_root = tempfile.mkdtemp()
+
+    async def finalize(uid):
+        start = time.perf_counter()
+
+        await database_sync_to_async(Interview.objects.filter(uid=uid).update)(
+            sid=uid, started=True, updated_at=timezone.now()
+        )
+
+        output_dir = f"{output_root}/{uid}"
+        await enqueue_finalization(uid, output_dir, "Bench Mark", 16000)
+        await database_sync_to_async(get_interviews(uid).update)(
+            transcript=transcript,
+            feedback=feedback,
+            completed=True,
+            processing_status=Interview.ProcessingStatus.READY,
+            updated_at=timezone.now(),
+        )
+        return time.perf_counter() - start
+
+    async def main():
+        started = time.time()
+        outcomes = await asyncio.gather(*map(finalize, uids), return_exceptions=True)
+        latencies = [outcome for outcome in outcomes if isinstance(outcome, float)]
+        errors = [repr(outcome) for outcome in outcomes if isinstance(outcome, BaseException)]
+        return latencies, errors, started, time.time()
+
+    barrier.wait()
+    results.put(asyncio.run(main()))
+
+
+def create_interviews(count):
+    from users.models import User
+    from interview.models import Interview
+
+    user = User.objects.create(email=f"bench-{time.time_ns()}@example.com")
+    interviews = Interview.objects.bulk_create(
+        Interview(user=user, company_name="Company", job_description="Job description")
+        for _ in range(count)
+    )
+    return [str(interview.uid) for interview in interviews]
+
+
+def measure(config, processes, interviews):
+    context = multiprocessing.get_context("spawn")
+    # The parent creates the rows, so the workers only time finalization
+    with context.Pool(1, initializer=setup_django, initargs=tuple(config.values())) as pool:
+        uids = pool.apply(create_interviews, (interviews,))
+
+    barrier = context.Barrier(processes)
+    results = context.Queue()
+    workers = [
+        context.Process(target=run_worker, args=(config, uids[i::processes], barrier, results))
+        for i in range(processes)
+    ]
+
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get(timeout=600) for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    latencies = [latency for outcome in outcomes for latency in outcome[0]]
+    errors = [error for outcome in outcomes for error in outcome[1]]
+    # From the first worker starting to the last one finishing
+    elapsed = max(outcome[3] for outcome in outcomes) - min(outcome[2] for outcome in outcomes)
+    return elapsed, latencies, errors
+
+
+def migrate(config):
+    setup_django(**config)
+
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--database-url", help="PostgreSQL database to compare, e.g. postgres://..."
+    )
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--interviews", type=int, nargs="+", default=INTERVIEWS)
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    configs = {
+        "sqlite, rollback journal, 5 s timeout": {
+            "database_url": f"sqlite:///{temp_dir}/journal.sqlite3",
+            "sqlite_timeout": 5,
+            "wal": False,
+        },
+        "sqlite, WAL, 20 s timeout": {
+            "database_url": f"sqlite:///{temp_dir}/wal.sqlite3",
+            "sqlite_timeout": 20,
+            "wal": True,
+        },
+    }
+    if args.database_url:
+        configs["postgresql"] = {
+            "database_url": args.database_url,
+            "sqlite_timeout": 20,
+            "wal": True,
+        }
+
+    context = multiprocessing.get_context("spawn")
+    for config in configs.values():
+        process = context.Process(target=migrate, args=(config,))
+        process.start()
+        process.join()
+
+    print(f"cpus: {os.cpu_count()}  processes: {args.processes}")
+    print(
+        f"{'backend':<38} {'interviews':>10} {'per s':>8} {'p50 ms':>8} {'p99 ms':>9} {'failed':>7}"
+    )
+    for name, config in configs.items():
+        for interviews in args.interviews:
+            elapsed, latencies, errors = measure(config, args.processes, interviews)
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if latencies else (0, 0)
+            print(
+                f"{name:<38} {interviews:>10} {len(latencies) / elapsed:>8.1f}"
+                f" {p50:>8.1f} {p99:>9.1f} {len(errors):>7}"
+            )
+            for error in sorted(set(errors))[:3]:
+                print(f"    {error}")
+
+
+if __name__ == "__main__":
+    main()
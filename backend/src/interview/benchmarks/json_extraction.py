@@ -0,0 +1,118 @@
+"""
+Correctness, fuzzing and speed of the JSON extraction used on LLM responses.
+
+llm_responses.jsonl holds model outputs in the shapes Mixtral gets wrong in practice: code
+fences, prose around the object, trailing commas, braces inside strings, raw newlines, several
+objects, and responses cut off by the token limit. Each is checked against the expected object
+with the previous recursive slicing approach and with extract_json. The fuzz pass feeds every
+response in random chunks, which must give the same result as a single feed, and parses random
+truncations and corruptions, which must never raise.
+
+Run from backend/src:
+    python -m interview.benchmarks.json_extraction
+"""
+
+import json
+import time
+import random
+from pathlib import Path
+
+from interview.json_parser import JSONObjectExtractor, extract_json
+
+CORPUS = Path(__file__).with_name("llm_responses.jsonl")
+FUZZ_ROUNDS = 200
+TIMING_ROUNDS = 2000
+
+
+def legacy_extract(response: str, n=0) -> dict:
+    # The recursive approach extract_json replaced, minus its logging
+    if n > 10:
+        return {}
+
+    try:
+        return json.loads(response)
+    except json.JSONDecodeError:
+        pass
+
+    start_index = response.find("{")
+    end_index = response.rfind("}") + 1
+
+    if start_index == 0 and end_index == len(response):
+        start_index += 1
+        end_index -= 1
+
+    if start_index != -1 and end_index != 0:
+        return legacy_extract(response[start_index:end_index], n + 1)
+
+    return {}
+
+
+def extract_incrementally(response, rng) -> dict:
+    extractor = JSONObjectExtractor()
+    pos = 0
+    while pos < len(response):
+        size = rng.randint(1, 12)
+        data = extractor.feed(response[pos : pos + size])
+        if data is not None:
+            return data
+        pos += size
+
+    return extractor.close() or {}
+
+
+def time_per_call(extract, responses, rounds) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for response in responses:
+            extract(response)
+    return (time.perf_counter() - start) / (rounds * len(responses)) * 1e6
+
+
+def main():
+    corpus = [json.loads(line) for line in CORPUS.read_text().splitlines() if line]
+    responses = [case["response"] for case in corpus]
+
+    legacy_ok = new_ok = 0
+    for case in corpus:
+        expected = case["expected"] or {}
+        legacy_ok += legacy_extract(case["response"]) == expected
+        new_ok += extract_json(case["response"]) == expected
+    print(f"corpus: {len(corpus)} responses")
+    print(f"  correct  legacy {legacy_ok:>3}   extract_json {new_ok:>3}")
+
+    rng = random.Random(0)
+    mismatches = errors = 0
+    for response in responses:
+        expected = extract_json(response)
+        for _ in range(FUZZ_ROUNDS):
+            mismatches += extract_incrementally(response, rng) != expected
+
+            mutated = list(response[: rng.randint(0, len(response))])
+            for _ in range(rng.randint(0, 3)):
+                mutated.insert(rng.randint(0, len(mutated)), rng.choice('{}[]",:\\ \nx'))
+            try:
+                extract_json("".join(mutated))
+            except Exception:
+                errors += 1
+    print(f"fuzz: {len(responses) * FUZZ_ROUNDS} chunked feeds and mutations per response set")
+    print(f"  chunked results differing from one-shot {mismatches}   exceptions {errors}")
+
+    print(f"time per response (us)   legacy   extract_json")
+    legacy_us = time_per_call(legacy_extract, responses, TIMING_ROUNDS)
+    new_us = time_per_call(extract_json, responses, TIMING_ROUNDS)
+    print(f"  corpus average       {legacy_us:>8.1f} {new_us:>14.1f}")
+
+    answer = '{"type": "Question", "text": "Next question?"}'
+    for size in (1_000, 10_000, 100_000):
+        # Long prose with stray braces around the object, which sends the legacy parser through
+        # several rounds of slicing and full re-parsing
+        prose = ("The candidate said {something} about it. " * (size // 40))[:size]
+        response = f"{prose}\n```json\n{answer}\n```\n{prose}"
+        rounds = max(2_000_000 // len(response), 5)
+        legacy_us = time_per_call(legacy_extract, [response], rounds)
+        new_us = time_per_call(extract_json, [response], rounds)
+        print(f"  {len(response):>7} chars        {legacy_us:>8.1f} {new_us:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Micro-benchmark comparing the chunked MediaBuffer against the old bytes-concatenating one.
+
+Run from backend/src:
+    python -m interview.benchmarks.media_buffer
+"""
+
+import time
+import tracemalloc
+
+import numpy as np
+
+from interview.utils import MediaBuffer
+
+SAMPLING_RATE = 16000
+CHUNK_BYTES = SAMPLING_RATE  # 500ms of 16 kHz int16 audio, as sent by the client
+
+
+class LegacyMediaBuffer:
+    def __init__(self, SAMPLING_RATE):
+        self.buffer = b""
+        self.SAMPLING_RATE = SAMPLING_RATE
+
+    def append(self, data):
+        self.buffer += data
+
+    def clear(self):
+        self.buffer = b""
+
+    def get(self):
+        return self.buffer
+
+
+def run_legacy(chunks):
+    buffer = LegacyMediaBuffer(SAMPLING_RATE)
+    for chunk in chunks:
+        buffer.append(chunk)
+    return np.frombuffer(buffer.get(), dtype=np.int16)
+
+
+def run_chunked(chunks):
+    buffer = MediaBuffer(SAMPLING_RATE)
+    for chunk in chunks:
+        buffer.append(chunk)
+    return buffer.as_array()
+
+
+def measure(fn, chunks):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(chunks)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    print(f"{'minutes':>8} {'legacy s':>10} {'chunked s':>10} {'legacy MB':>10} {'chunked MB':>11}")
+    for minutes in (1, 5, 10, 30):
+        n_chunks = minutes * 60 * 2
+        chunks = [np.random.bytes(CHUNK_BYTES) for _ in range(n_chunks)]
+
+        legacy_time, legacy_peak = measure(run_legacy, chunks)
+        chunked_time, chunked_peak = measure(run_chunked, chunks)
+
+        print(
+            f"{minutes:>8} {legacy_time:>10.4f} {chunked_time:>10.4f} "
+            f"{legacy_peak / 2**20:>10.1f} {chunked_peak / 2**20:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
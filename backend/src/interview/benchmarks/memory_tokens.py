@@ -0,0 +1,73 @@
+"""
+Prompt tokens per turn over a long interview with the full buffer and with bounded memory.
+
+The conversation is synthetic: answers of about 120 words and JSON questions of about 25 words.
+The summarizer is a stand-in that returns a summary of MEMORY_SUMMARY_MAX_TOKENS tokens, the
+most the real one may produce, so bounded numbers are an upper bound. Token counts use the same
+estimate LLMClient reports when the provider does not return usage.
+
+Run from backend/src:
+    python -m interview.benchmarks.memory_tokens
+"""
+
+import asyncio
+import random
+
+from interview.llm_client import get_prompt
+from interview.memory import (
+    CHARS_PER_TOKEN,
+    MEMORY_SUMMARY_MAX_TOKENS,
+    ConversationMemory,
+    count_tokens,
+)
+
+TURNS = 40
+REPORT_TURNS = (1, 5, 10, 20, 30, 40)
+JOB_DESCRIPTION_WORDS = 350
+
+WORDS = (
+    "project team python service latency customer design tested deployed database api "
+    "migrated improved reduced incident ownership review mentor scaled queue cache metrics"
+).split()
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+async def fake_summarize(summary, lines):
+    return (summary + " " + lines)[-MEMORY_SUMMARY_MAX_TOKENS * CHARS_PER_TOKEN :]
+
+
+async def run(mode):
+    rng = random.Random(0)
+    prompt = get_prompt("Company", sentence(rng, JOB_DESCRIPTION_WORDS), "Candidate Name")
+    memory = ConversationMemory(summarize=fake_summarize, mode=mode)
+
+    tokens = []
+    for _ in range(TURNS):
+        answer = sentence(rng, 120)
+        tokens.append(count_tokens(prompt.format(history=memory.load(), input=answer)))
+
+        question = sentence(rng, 25)
+        memory.save(answer, f'{{"type": "Question", "text": "{question}"}}')
+
+        # The candidate's next answer takes far longer than summarizing
+        if memory.summarizing is not None:
+            await memory.summarizing
+
+    return tokens
+
+
+def main():
+    buffer = asyncio.run(run("buffer"))
+    bounded = asyncio.run(run("bounded"))
+
+    print(f"{'turn':>5} {'buffer':>8} {'bounded':>8}")
+    for turn in REPORT_TURNS:
+        print(f"{turn:>5} {buffer[turn - 1]:>8} {bounded[turn - 1]:>8}")
+    print(f"{'total':>5} {sum(buffer):>8} {sum(bounded):>8}")
+
+
+if __name__ == "__main__":
+    main()
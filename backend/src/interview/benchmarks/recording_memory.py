@@ -0,0 +1,120 @@
+"""
+Resident memory of an interview's recording buffers, in memory and spill mode, as interviews grow.
+
+Each case runs in a fresh process. It records 100 ms audio chunks and buffered video (about
+1 Mbit/s of webm) for the given length, saves the session the way on_disconnect does and
+exports audio.wav the way the export_audio job does. Anonymous memory (the heap, which only
+swap can reclaim) is reported after recording and at its peak over the whole run, next to the
+peak of file-backed pages (mapped recordings, which the kernel can drop at any time) and the
+time the recording took.
+
+Run from backend/src:
+    python -m interview.benchmarks.recording_memory
+"""
+
+import os
+import time
+import tempfile
+import threading
+import multiprocessing
+
+import numpy as np
+
+SAMPLING_RATE = 16000
+CHUNK_SECONDS = 0.1
+VIDEO_BYTES_PER_CHUNK = 12500
+MINUTES = (5, 15, 30, 60)
+
+
+def rss_mb() -> dict[str, float]:
+    # RssAnon and RssFile of this process
+    with open("/proc/self/status") as f:
+        fields = dict(line.split(":", 1) for line in f)
+    return {key: int(fields[key].split()[0]) / 1024 for key in ("RssAnon", "RssFile")}
+
+
+class PeakSampler(threading.Thread):
+    def __init__(self, interval=0.002):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = rss_mb()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            for key, value in rss_mb().items():
+                self.peak[key] = max(self.peak[key], value)
+
+
+def run_case(minutes, mode, results):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "webapp.settings")
+    os.environ.setdefault("ANYSCALE_API_KEY", "benchmark")
+
+    import django
+
+    django.setup()
+
+    from interview.utils import MediaBuffer, SpillingMediaBuffer
+    from interview.jobs import export_wav
+
+    output_dir = tempfile.mkdtemp()
+    if mode == "spill":
+        audio = SpillingMediaBuffer(SAMPLING_RATE, f"{output_dir}/audio.spill")
+        video = SpillingMediaBuffer(SAMPLING_RATE, f"{output_dir}/video.spill")
+    else:
+        audio = MediaBuffer(SAMPLING_RATE)
+        video = MediaBuffer(SAMPLING_RATE)
+
+    tone = np.sin(np.arange(int(SAMPLING_RATE * CHUNK_SECONDS)) * 0.05) * 8000
+    audio_chunk = tone.astype(np.int16).tobytes()
+    video_chunk = os.urandom(VIDEO_BYTES_PER_CHUNK)
+
+    baseline = rss_mb()
+    sampler = PeakSampler()
+    sampler.start()
+
+    start = time.perf_counter()
+    for _ in range(int(minutes * 60 / CHUNK_SECONDS)):
+        # Chunks arrive from the socket as new objects; bytearrays are copied on append
+        audio.append(bytearray(audio_chunk))
+        video.append(bytearray(video_chunk))
+    record_seconds = time.perf_counter() - start
+    recorded = rss_mb()["RssAnon"] - baseline["RssAnon"]
+
+    audio.write_bytes(f"{output_dir}/audio.raw")
+    video.write_bytes(f"{output_dir}/video.raw")
+    export_wav(f"{output_dir}/audio.raw", f"{output_dir}/audio.wav", SAMPLING_RATE)
+
+    sampler.stopped.set()
+    sampler.join()
+    peak_anon = sampler.peak["RssAnon"] - baseline["RssAnon"]
+    peak_file = sampler.peak["RssFile"] - baseline["RssFile"]
+    results.put((recorded, peak_anon, peak_file, record_seconds))
+
+
+def measure(minutes, mode):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=run_case, args=(minutes, mode, results))
+    process.start()
+    result = results.get(timeout=600)
+    process.join()
+    return result
+
+
+def main():
+    print(
+        f"{'length':>7} {'mode':>7} {'recorded anon MB':>17} {'peak anon MB':>13}"
+        f" {'peak file MB':>13} {'record s':>9}"
+    )
+    for minutes in MINUTES:
+        for mode in ("memory", "spill"):
+            recorded, peak_anon, peak_file, record_seconds = measure(minutes, mode)
+            print(
+                f"{minutes:>5}min {mode:>7} {recorded:>17.1f} {peak_anon:>13.1f}"
+                f" {peak_file:>13.1f} {record_seconds:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
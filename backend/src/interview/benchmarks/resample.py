@@ -0,0 +1,79 @@
+"""
+CPU time and peak RSS of MediaBuffer.create_wav(speed=1.2) for the FFT and polyphase engines.
+
+Every case runs in a fresh process so the peak RSS of one case does not hide another's.
+Lengths are made prime in samples, the worst case for the FFT path.
+
+Run from backend/src:
+    python -m interview.benchmarks.resample
+"""
+
+import os
+import time
+import resource
+import multiprocessing
+
+import numpy as np
+
+SAMPLING_RATE = 16000
+SPEED = 1.2
+
+
+def next_prime(n):
+    def is_prime(k):
+        if k % 2 == 0:
+            return k == 2
+        return all(k % d for d in range(3, int(k**0.5) + 1, 2))
+
+    while not is_prime(n):
+        n += 1
+    return n
+
+
+def run_case(seconds, method, results):
+    from interview.utils import MediaBuffer
+
+    samples = next_prime(SAMPLING_RATE * seconds)
+    audio = (np.random.randn(samples) * 3000).astype(np.int16).tobytes()
+
+    buffer = MediaBuffer(SAMPLING_RATE)
+    for i in range(0, len(audio), SAMPLING_RATE):
+        buffer.append(audio[i : i + SAMPLING_RATE])
+    del audio
+
+    # The wav is written to a sink that discards data, so only the engine is measured
+    sink = open(os.devnull, "wb")
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.process_time()
+    buffer.create_wav(sink, speed=SPEED, method=method)
+    cpu = time.process_time() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss
+
+    results.put((cpu, peak_rss / 1024))
+
+
+def measure(seconds, method):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=run_case, args=(seconds, method, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    print(
+        f"{'answer':>7} {'fft cpu s':>10} {'poly cpu s':>11} {'fft +RSS MB':>12} {'poly +RSS MB':>13}"
+    )
+    for seconds in (5, 30, 60, 180, 600):
+        fft_cpu, fft_rss = measure(seconds, "fft")
+        poly_cpu, poly_rss = measure(seconds, "poly")
+        print(
+            f"{seconds:>6}s {fft_cpu:>10.3f} {poly_cpu:>11.3f} {fft_rss:>12.1f} {poly_rss:>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
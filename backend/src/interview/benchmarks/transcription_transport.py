@@ -0,0 +1,112 @@
+"""
+Per-turn latency of the two transcription transports against local stand-in services.
+
+The stand-in Whisper service either downloads the wav from a stand-in nginx (url transport)
+or decodes the data URI from the request body (bytes transport). Whisper itself is not
+measured, only the cost of getting the audio to it.
+
+Run from backend/src:
+    python -m interview.benchmarks.transcription_transport
+"""
+
+import os
+import json
+import time
+import base64
+import asyncio
+import tempfile
+import threading
+import statistics
+import urllib.request
+from functools import partial
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+SAMPLING_RATE = 16000
+TURNS = 10
+
+
+class QuietStaticHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class StandInWhisperHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        audio_file = payload["input"]["audio_file"]
+
+        if audio_file.startswith("data:"):
+            audio = base64.b64decode(audio_file.split(",", 1)[1])
+        else:
+            with urllib.request.urlopen(audio_file) as response:
+                audio = response.read()
+
+        body = json.dumps({"output": {"segments": [{"text": f" {len(audio)} bytes"}]}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run(transcript_helper, output_dir):
+    from interview.utils import MediaBuffer
+
+    print(f"{'answer s':>9} {'url p50 ms':>11} {'bytes p50 ms':>13}")
+    for seconds in (10, 30, 60, 120):
+        audio = (np.random.randn(SAMPLING_RATE * seconds) * 3000).astype(np.int16).tobytes()
+        results = {}
+
+        for transport in ("url", "bytes"):
+            timings = []
+            for turn in range(TURNS):
+                buffer = MediaBuffer(SAMPLING_RATE)
+                buffer.append(audio)
+                wav_file = f"{output_dir}/latest_question-{turn}.wav"
+
+                start = time.perf_counter()
+                await transcript_helper.transcribe_buffer(buffer, wav_file, transport=transport)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            results[transport] = statistics.median(timings)
+
+        print(f"{seconds:>9} {results['url']:>11.1f} {results['bytes']:>13.1f}")
+
+    await transcript_helper.transcription_client.close()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as root:
+        output_dir = os.path.join(root, "output")
+        os.makedirs(output_dir)
+
+        nginx = serve(partial(QuietStaticHandler, directory=root))
+        whisper = serve(StandInWhisperHandler)
+
+        os.environ["WHISPER_SERVICE_URL"] = f"http://127.0.0.1:{whisper.server_port}"
+        os.environ["WEB_SERVICE_URL"] = f"http://127.0.0.1:{nginx.server_port}"
+
+        from interview import transcript_helper
+
+        # wav paths are resolved relative to the stand-in nginx root, like output/ in compose
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            asyncio.run(run(transcript_helper, "output"))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
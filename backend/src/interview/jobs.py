@@ -0,0 +1,268 @@
+import os
+import json
+import uuid
+import asyncio
+import logging
+from datetime import timedelta
+
+from django.db import IntegrityError
+from django.db.models import F, Q
+from django.utils import timezone
+from webapp.database import database_sync_to_async
+
+from .models import Interview, Job
+from .metrics import span
+from .recorder import encode_file
+from .llm_client import get_feedback
+from .utils import SpillingMediaBuffer
+
+# Background workers started with each web process; set to 0 when `manage.py run_jobs` runs them
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_BACKOFF = float(os.environ.get("JOB_RETRY_BACKOFF", 5))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1))
+# A running job is handed to another worker once its lease expires, e.g. after a crash
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 900))
+
+
+logger = logging.getLogger(__name__)
+print = logger.info
+
+# kind -> (handler, whether a permanent failure means the interview results are incomplete)
+handlers = {}
+workers: list[asyncio.Task] = []
+
+
+def job_handler(kind, required=True):
+    def register(handler):
+        handlers[kind] = (handler, required)
+        return handler
+
+    return register
+
+
+async def enqueue(kind, interview_uid, output_dir, **payload) -> Job:
+    # Jobs are keyed by their output directory, so enqueueing the same step twice is a no-op
+    defaults = {
+        "kind": kind,
+        "interview_uid": str(interview_uid),
+        "payload": {"output_dir": output_dir, **payload},
+        "max_attempts": JOB_MAX_ATTEMPTS,
+        "run_after": timezone.now(),
+    }
+    key = f"{kind}:{output_dir}"
+
+    try:
+        return (
+            await database_sync_to_async(Job.objects.get_or_create)(key=key, defaults=defaults)
+        )[0]
+    except IntegrityError:
+        return await database_sync_to_async(Job.objects.get)(key=key)
+
+
+def get_interviews(interview_uid):
+    try:
+        uuid.UUID(str(interview_uid))
+    except ValueError:
+        # Sessions without a stored interview have nothing to track
+        return Interview.objects.none()
+
+    return Interview.objects.filter(uid=interview_uid)
+
+
+def set_processing_status(interview_uid, status):
+    get_interviews(interview_uid).update(processing_status=status, updated_at=timezone.now())
+
+
+async def enqueue_finalization(interview_uid, output_dir, user_name, sampling_rate, feedback=True):
+    # Called once the raw session data is on disk; every step below is safe to run again
+    await enqueue("export_audio", interview_uid, output_dir, sampling_rate=sampling_rate)
+
+    if os.path.exists(f"{output_dir}/video.raw"):
+        await enqueue("encode_video", interview_uid, output_dir)
+
+    if feedback:
+        await database_sync_to_async(get_interviews(interview_uid).update)(
+            processing_status=Interview.ProcessingStatus.PROCESSING, updated_at=timezone.now()
+        )
+        await enqueue("generate_feedback", interview_uid, output_dir, user_name=user_name)
+
+
+def claim_job() -> Job | None:
+    now = timezone.now()
+    claimable = Q(status=Job.Status.PENDING, run_after__lte=now) | Q(
+        status=Job.Status.RUNNING, locked_until__lt=now
+    )
+
+    for candidate in Job.objects.filter(claimable).order_by("run_after")[:10]:
+        # Only one worker wins the conditional update, the others move on to the next job
+        claimed = Job.objects.filter(
+            pk=candidate.pk, status=candidate.status, attempts=candidate.attempts
+        ).update(
+            status=Job.Status.RUNNING,
+            attempts=F("attempts") + 1,
+            locked_until=now + timedelta(seconds=JOB_LEASE_SECONDS),
+        )
+        if claimed:
+            candidate.refresh_from_db()
+            return candidate
+
+    return None
+
+
+def complete_job(job: Job):
+    job.status = Job.Status.DONE
+    job.locked_until = None
+    job.save(update_fields=["status", "locked_until", "updated_at"])
+
+
+def fail_job(job: Job, error):
+    job.last_error = repr(error)
+    job.locked_until = None
+
+    if job.attempts < job.max_attempts:
+        delay = JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+        job.status = Job.Status.PENDING
+        job.run_after = timezone.now() + timedelta(seconds=delay)
+        print(f"Job {job} failed, retrying in {delay:.0f}s: {error!r}")
+    else:
+        job.status = Job.Status.FAILED
+        logger.error(f"Job {job} failed after {job.attempts} attempts: {error!r}")
+
+        if handlers.get(job.kind, (None, True))[1]:
+            set_processing_status(job.interview_uid, Interview.ProcessingStatus.FAILED)
+
+    job.save(update_fields=["status", "run_after", "last_error", "locked_until", "updated_at"])
+
+
+async def run_job(job: Job):
+    with span(f"job_{job.kind}", interview=job.interview_uid) as run:
+        try:
+            if job.kind not in handlers:
+                raise ValueError(f"Unknown job kind {job.kind}")
+            if job.attempts > job.max_attempts:
+                # The lease of the last attempt ran out without the job finishing
+                raise RuntimeError("Job did not finish before its lease expired")
+
+            handler, _ = handlers[job.kind]
+            await handler(job)
+        except Exception as e:
+            run.outcome = "error"
+            await database_sync_to_async(fail_job)(job, e)
+            return
+
+    await database_sync_to_async(complete_job)(job)
+
+
+async def worker():
+    while True:
+        try:
+            job = await database_sync_to_async(claim_job)()
+        except Exception as e:
+            logger.error(f"Could not claim a job: {e!r}")
+            job = None
+
+        if job is None:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            continue
+
+        await run_job(job)
+
+
+def start_workers(count=None):
+    # Needs a running event loop; jobs left over by a previous process are picked up too
+    count = JOB_WORKERS if count is None else count
+    while len(workers) < count:
+        workers.append(asyncio.create_task(worker()))
+
+
+async def run_workers(count=None):
+    start_workers(count)
+    await asyncio.gather(*workers)
+
+
+def write_atomic(file_path, data: str):
+    # Readers never see a half-written file, and a rerun simply overwrites it
+    temp_path = f"{file_path}.part"
+    with open(temp_path, "w") as f:
+        f.write(data)
+    os.replace(temp_path, file_path)
+
+
+def export_wav(raw_file, wav_file, sampling_rate):
+    # The recording is memory-mapped and converted block by block, never loaded whole
+    buffer = SpillingMediaBuffer.open(raw_file, sampling_rate)
+    buffer.create_wav(f"{wav_file}.part")
+    os.replace(f"{wav_file}.part", wav_file)
+    os.remove(raw_file)
+
+
+@job_handler("export_audio", required=False)
+async def export_audio(job: Job):
+    output_dir = job.payload["output_dir"]
+    raw_file = f"{output_dir}/audio.raw"
+    if not os.path.exists(raw_file):
+        # Exported by an earlier attempt
+        return
+
+    await asyncio.to_thread(
+        export_wav, raw_file, f"{output_dir}/audio.wav", job.payload["sampling_rate"]
+    )
+
+
+@job_handler("encode_video", required=False)
+async def encode_video(job: Job):
+    output_dir = job.payload["output_dir"]
+    raw_file = f"{output_dir}/video.raw"
+    if not os.path.exists(raw_file):
+        return
+
+    video_file = f"{output_dir}/video.mp4"
+    if os.path.exists(video_file) and os.path.getsize(video_file) > 0:
+        # Streaming stopped partway and the raw file holds the rest. The part ffmpeg wrote is
+        # kept as it was; frames in flight when it stopped may be missing between the two.
+        logger.error(f"The video of {output_dir} is incomplete, encoding the rest separately")
+        with open(f"{output_dir}/video-parts.json", "w") as f:
+            json.dump({"complete": False, "parts": ["video.mp4", "video-rest.mp4"]}, f)
+        video_file = f"{output_dir}/video-rest.mp4"
+
+    if not await encode_file(raw_file, f"{video_file}.part"):
+        raise RuntimeError(f"ffmpeg could not encode {raw_file}")
+
+    os.replace(f"{video_file}.part", video_file)
+    os.remove(raw_file)
+
+
+@job_handler("generate_feedback")
+async def generate_feedback(job: Job):
+    output_dir = job.payload["output_dir"]
+    feedback_file = f"{output_dir}/feedback.json"
+
+    if not os.path.exists(feedback_file):
+        with open(f"{output_dir}/transcript.json") as f:
+            chats_data = json.load(f)
+
+        feedback = await get_feedback(job.payload["user_name"], chats_data)
+        if not feedback:
+            raise ValueError("The feedback response did not contain valid JSON")
+
+        write_atomic(feedback_file, json.dumps(feedback))
+
+    await enqueue("save_results", job.interview_uid, output_dir)
+
+
+@job_handler("save_results")
+async def save_results(job: Job):
+    output_dir = job.payload["output_dir"]
+    with open(f"{output_dir}/transcript.json") as f:
+        transcript = f.read()
+    with open(f"{output_dir}/feedback.json") as f:
+        feedback = f.read()
+
+    await database_sync_to_async(get_interviews(job.interview_uid).update)(
+        transcript=transcript,
+        feedback=feedback,
+        completed=True,
+        processing_status=Interview.ProcessingStatus.READY,
+        updated_at=timezone.now(),
+    )
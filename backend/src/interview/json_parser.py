@@ -0,0 +1,262 @@
+import re
+import json
+
+
+class StreamingFieldExtractor:
+    # Pulls the value of one top-level string field out of a JSON object while the object is
+    # still being generated, e.g. the "text" of {"type": "Question", "text": "..."}.
+    # Anything before the opening brace, such as prose or a code fence, is skipped.
+    def __init__(self, field):
+        self.field = field
+
+        self.depth = 0
+        self.in_string = False
+        self.escape = ""
+        self.string = []
+
+        # "colon" after a top-level string that may be a key, "value" after the field's colon
+        self.expect = None
+        self.last_string = None
+
+        self.streaming = False
+        self.done = False
+
+    def feed(self, text: str) -> str:
+        # Returns the newly decoded characters of the field value
+        output = []
+
+        for char in text:
+            if self.done:
+                break
+
+            if self.streaming:
+                self._feed_value(char, output)
+            elif self.in_string:
+                self._feed_string(char)
+            else:
+                self._feed_structure(char)
+
+        return "".join(output)
+
+    def _feed_value(self, char, output):
+        if self.escape:
+            self.escape += char
+            if self.escape[1] == "u" and len(self.escape) < 6:
+                return
+
+            try:
+                output.append(json.loads(f'"{self.escape}"'))
+            except json.JSONDecodeError:
+                output.append(self.escape[1:])
+            self.escape = ""
+        elif char == "\\":
+            self.escape = char
+        elif char == '"':
+            self.streaming = False
+            self.done = True
+        else:
+            output.append(char)
+
+    def _feed_string(self, char):
+        if self.escape:
+            self.escape = ""
+        elif char == "\\":
+            self.escape = char
+        elif char == '"':
+            self.in_string = False
+            if self.depth == 1 and self.expect is None:
+                self.last_string = "".join(self.string)
+                self.expect = "colon"
+            return
+
+        self.string.append(char)
+
+    def _feed_structure(self, char):
+        if char.isspace():
+            return
+
+        if self.expect == "colon":
+            self.expect = "value" if char == ":" and self.last_string == self.field else None
+            if char == ":":
+                return
+        elif self.expect == "value":
+            self.expect = None
+            if char == '"':
+                self.streaming = True
+                return
+
+        if char in "{[":
+            self.depth += 1
+        elif char in "}]":
+            self.depth = max(self.depth - 1, 0)
+        elif char == '"' and self.depth:
+            self.in_string = True
+            self.string = []
+
+
+# Characters that matter outside and inside strings; everything else is skipped by the regex
+STRUCTURE = re.compile(r'[{}\[\]",]')
+STRING_SPECIAL = re.compile(r'["\\]')
+# An object opens with a key or closes right away; prose such as {name} is passed over
+OBJECT_START = re.compile(r'\{\s*(?:["}]|\Z)')
+CLOSING = {"{": "}", "[": "]"}
+
+
+class JSONObjectExtractor:
+    """
+    Finds the first balanced JSON object in text that may arrive in pieces, in a single pass.
+
+    Anything before the opening brace, such as prose or a code fence, is skipped, braces inside
+    strings are ignored, and trailing commas are dropped. An object that does not parse is
+    skipped and the search continues after it. close() repairs an object that was cut off, e.g.
+    by the token limit, by closing its open string, arrays and objects.
+    """
+
+    def __init__(self):
+        self.done = False
+        self.reset()
+
+    def reset(self):
+        self.started = False
+        self.chunks = []
+        self.length = 0
+
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        # Position of the last comma outside a string with only whitespace after it
+        self.comma = None
+        self.trailing_commas = []
+
+    def feed(self, text: str) -> dict | None:
+        # Returns the object once its closing brace arrives, None until then
+        pos = 0
+        while not self.done and pos is not None:
+            data, pos = self.scan(text, pos)
+            if data is not None:
+                self.done = True
+                return data
+
+        return None
+
+    def scan(self, text, pos) -> tuple[dict | None, int | None]:
+        # Returns the parsed object if it completes in text, and where to continue searching
+        # when an object turns out to be invalid
+        if not self.started:
+            match = OBJECT_START.search(text, pos)
+            if match is None:
+                return None, None
+            pos = match.start()
+            self.started = True
+
+        store_start = pos
+        base = self.length - store_start
+        end = len(text)
+
+        while pos < end:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                    pos += 1
+                    continue
+
+                match = STRING_SPECIAL.search(text, pos)
+                if match is None:
+                    break
+                pos = match.end()
+                if match.group() == "\\":
+                    self.escape = True
+                else:
+                    self.in_string = False
+                continue
+
+            match = STRUCTURE.search(text, pos)
+            stop = match.start() if match else end
+            if self.comma is not None and text[pos:stop].strip():
+                self.comma = None
+            if match is None:
+                break
+
+            char = match.group()
+            pos = match.end()
+
+            if char == ",":
+                self.comma = base + match.start()
+                continue
+
+            if char in "}]" and self.comma is not None:
+                self.trailing_commas.append(self.comma)
+            self.comma = None
+
+            if char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.stack.append(char)
+            else:
+                if self.stack:
+                    self.stack.pop()
+                if not self.stack:
+                    self.store(text[store_start:pos])
+                    data = self.parse()
+                    if data is None:
+                        # Not valid even after the repairs, look for the next object
+                        self.reset()
+                    return data, pos
+
+        self.store(text[store_start:])
+        return None, None
+
+    def store(self, text):
+        self.chunks.append(text)
+        self.length += len(text)
+
+    def parse(self, suffix="") -> dict | None:
+        raw = "".join(self.chunks)
+
+        if self.trailing_commas:
+            pieces = []
+            last = 0
+            for comma in self.trailing_commas:
+                pieces.append(raw[last:comma])
+                last = comma + 1
+            pieces.append(raw[last:])
+            raw = "".join(pieces)
+
+        try:
+            # strict=False accepts raw newlines and tabs inside strings
+            data = json.loads(raw + suffix, strict=False)
+        except json.JSONDecodeError:
+            return None
+
+        return data if isinstance(data, dict) else None
+
+    def close(self) -> dict | None:
+        # End of the text: returns a repaired object if one was left open
+        if self.done or not self.started:
+            return None
+
+        suffix = ""
+        if self.in_string:
+            if self.escape:
+                self.chunks[-1] = self.chunks[-1][:-1]
+            suffix += '"'
+        elif self.comma is not None:
+            self.trailing_commas.append(self.comma)
+        suffix += "".join(CLOSING[char] for char in reversed(self.stack))
+
+        data = self.parse(suffix)
+        self.done = data is not None
+        return data
+
+
+def extract_json(text: str) -> dict:
+    # Most responses are exactly the object, which json.loads settles fastest
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return data
+    except json.JSONDecodeError:
+        pass
+
+    extractor = JSONObjectExtractor()
+    return extractor.feed(text) or extractor.close() or {}
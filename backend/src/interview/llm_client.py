@@ -1,12 +1,14 @@
-import json
+import asyncio
 import logging
+from contextlib import aclosing
 
-from langchain_community.chat_models import ChatAnyscale
 from langchain.prompts.prompt import PromptTemplate
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
 
 from .utils import Chat
+from .json_parser import StreamingFieldExtractor, JSONObjectExtractor, extract_json
+from .memory import ConversationMemory, MEMORY_SUMMARY_MAX_TOKENS, count_tokens
+from .metrics import interview_label, prompt_tokens, span
+from .llm_pool import chat_models, prompt_cache
 from . import prompts
 
 
@@ -19,63 +21,140 @@ logger = logging.getLogger(__name__)
 print = logger.info
 
 
+def get_prompt(company_name, job_description, user_name) -> PromptTemplate:
+    return prompt_cache.get(company_name, job_description, user_name)
+
+
+def parse_response(response: str) -> dict:
+    data = extract_json(response)
+    if not data:
+        print(f"Could not extract JSON from the response: {response[:500]!r}")
+    return data
+
+
+def warm_up():
+    chat_models.warm_up(
+        [
+            (MODEL, MAX_TOKENS_PER_QUESTION),
+            (MODEL, MEMORY_SUMMARY_MAX_TOKENS),
+            (FEEDBACK_MODEL, None),
+        ]
+    )
+
+
 class LLMClient:
     def __init__(self, interview_data, user_name):
-        self.llm = ChatAnyscale(model_name=MODEL, max_tokens=MAX_TOKENS_PER_QUESTION)
+        # Shared by every interview in the process; only the memory is per session
+        self.llm = chat_models.get(MODEL, MAX_TOKENS_PER_QUESTION)
+        self.summary_llm = None
 
-        prompt_template = (
-            prompts.SYSTEM_PROMPT.replace("{company_name}", interview_data["company_name"])
-            .replace("{job_description}", interview_data["job_description"])
-            .replace("{user_name}", user_name)
+        self.prompt = get_prompt(
+            interview_data["company_name"], interview_data["job_description"], user_name
         )
-        memory = ConversationBufferMemory()
-        self.prompt = PromptTemplate(input_variables=["history", "input"], template=prompt_template)
-
-        self.conversation = ConversationChain(llm=self.llm, memory=memory, prompt=self.prompt)
-
-    async def get_json_from_response(self, response: str, n=0) -> dict:
-        if n > 10:
-            print("Recursion limit reached. Potential issue with deeply nested or malformed JSON.")
-            return {}
-
-        try:
-            print(f"Initial JSON loading attempt (recursion level: {n})")
-            data = json.loads(response)
-            print("JSON loading successful!")
-            return data  # Success!
-        except json.JSONDecodeError as e:
-            print(f"JSON decoding error: {e}")
-            print(f"Response content:\n{response}")
-
-        # More refined string manipulation (if necessary)
-        try:
-            start_index = response.find("{")
-            end_index = response.rfind("}") + 1
-
-            if start_index == 0 and end_index == len(response):  # Check if entire string is JSON
-                start_index += 1
-                end_index -= 1
-
-            if start_index != -1 and end_index != 0:  # Check if indices are valid
-                potential_json = response[start_index:end_index]
-                print(f"Extracted potential JSON:\n{potential_json}")
-                return await self.get_json_from_response(potential_json, n + 1)
-            else:
-                print("Unable to extract valid JSON substring.")
-        except IndexError:
-            print("Error during string manipulation.")
-
-        print("Failed to extract JSON.")
-        return {}
+        self.memory = ConversationMemory(summarize=self.summarize)
+
+        # Prompt size of every turn, to keep an eye on how the history grows
+        self.prompt_tokens: list[int] = []
+
+    @classmethod
+    async def create(cls, interview_data, user_name) -> "LLMClient":
+        # Getting the shared chat model can wait on the warm-up or on the model list request,
+        # so the client is built off the event loop
+        return await asyncio.to_thread(cls, interview_data, user_name)
 
     async def start_interview(self) -> tuple[bool, str]:
         first_chat = "Hi, let's start the interview."
         interview_ended, response = await self.get_question(first_chat)
         return interview_ended, response
 
+    def format_prompt(self, question: str) -> str:
+        return self.prompt.format(history=self.memory.load(), input=question)
+
+    def record_prompt_tokens(self, prompt: str, message=None):
+        # The provider's count when the response carries usage, otherwise an estimate
+        usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+        tokens = usage.get("prompt_tokens") or count_tokens(prompt)
+
+        self.prompt_tokens.append(tokens)
+        prompt_tokens.observe(tokens, interview=interview_label(), memory=self.memory.mode)
+        print(f"Turn {len(self.prompt_tokens)} prompt tokens: {tokens}")
+
+    async def summarize(self, summary: str, lines: str) -> str:
+        # Runs in the background between turns
+        if self.summary_llm is None:
+            self.summary_llm = await asyncio.to_thread(
+                chat_models.get, MODEL, MEMORY_SUMMARY_MAX_TOKENS
+            )
+
+        with span("summarize"):
+            prompt = prompts.SUMMARY_PROMPT.format(summary=summary or "(none)", lines=lines)
+            message = await self.summary_llm.ainvoke(prompt)
+        return message.content
+
     async def get_question(self, question: str) -> tuple[bool, str]:
-        data = await self.conversation.ainvoke(input=question)
-        data = await self.get_json_from_response(data["response"])
+        prompt = self.format_prompt(question)
+        message = await self.llm.ainvoke(prompt)
+        self.record_prompt_tokens(prompt, message)
+        self.memory.save(question, message.content)
+
+        data = parse_response(message.content)
+
+        interview_ended = data.get("type", "") == "Interview Ended"
+        text = data.get("text", "")
+
+        return interview_ended, text
+
+    async def get_question_streaming(self, question: str, on_text) -> tuple[bool, str]:
+        # Same as get_question, but awaits on_text with every new piece of the "text" field
+        # while the model is still generating the rest of the response
+        prompt = self.format_prompt(question)
+        self.record_prompt_tokens(prompt)
+
+        extractor = StreamingFieldExtractor("text")
+        parser = JSONObjectExtractor()
+        response = []
+        data = None
+        async with aclosing(self.llm.astream(prompt)) as stream:
+            async for chunk in stream:
+                response.append(chunk.content)
+                text = extractor.feed(chunk.content)
+                if text:
+                    await on_text(text)
+
+                data = parser.feed(chunk.content)
+                if data is not None:
+                    # Whatever the model adds after the object is never used, stop generating
+                    break
+
+        response = "".join(response)
+        self.memory.save(question, response)
+
+        if data is None:
+            data = parser.close() or parse_response(response)
+
+        interview_ended = data.get("type", "") == "Interview Ended"
+        text = data.get("text", "")
+
+        return interview_ended, text
+
+    async def draft_question(self, prompt: str, response: list[str]) -> str:
+        # Generates a question without saving the turn. The pieces are collected in response as
+        # they arrive, so what a cancelled draft cost is known.
+        parser = JSONObjectExtractor()
+        async with aclosing(self.llm.astream(prompt)) as stream:
+            async for chunk in stream:
+                response.append(chunk.content)
+                if parser.feed(chunk.content) is not None:
+                    break
+
+        return "".join(response)
+
+    def commit_question(self, question: str, prompt: str, response: str) -> tuple[bool, str]:
+        # Saves a drafted response as the turn that answers question
+        self.record_prompt_tokens(prompt)
+        self.memory.save(question, response)
+
+        data = parse_response(response)
 
         interview_ended = data.get("type", "") == "Interview Ended"
         text = data.get("text", "")
@@ -83,17 +162,19 @@ class LLMClient:
         return interview_ended, text
 
     async def get_feedback(self, user_name: str, chats: list[Chat]) -> dict:
-        chats_data = [chat.to_dict() for chat in chats]
-        text = (
-            f"The interview has finished. Candidate name: {user_name}. Chat History: {chats_data}"
-        )
-        text = f"{prompts.ANALYSIS_PROMPT}\n\n{text}"
+        return await get_feedback(user_name, [chat.to_dict() for chat in chats])
+
+
+async def get_feedback(user_name: str, chats_data: list[dict]) -> dict:
+    # Needs no interview session, so background jobs can call it with the saved transcript
+    text = f"The interview has finished. Candidate name: {user_name}. Chat History: {chats_data}"
+    text = f"{prompts.ANALYSIS_PROMPT}\n\n{text}"
 
-        llm = ChatAnyscale(model_name=FEEDBACK_MODEL)
-        response = await llm.ainvoke(input=text)
-        response = await self.get_json_from_response(response.content)
+    llm = await asyncio.to_thread(chat_models.get, FEEDBACK_MODEL)
+    response = await llm.ainvoke(input=text)
+    response = parse_response(response.content)
 
-        return response
+    return response
 
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import httpx
+import openai
+from langchain_community.chat_models import ChatAnyscale
+from langchain_community.chat_models.anyscale import DEFAULT_API_BASE
+from langchain.prompts.prompt import PromptTemplate
+
+from . import prompts
+
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 64))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", 60))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", 5))
+PROMPT_CACHE_SIZE = int(os.environ.get("PROMPT_CACHE_SIZE", 256))
+
+
+logger = logging.getLogger(__name__)
+print = logger.info
+
+
+class ChatModelPool:
+    # One chat model per (model, max_tokens) for the whole process. They all share a single
+    # AsyncOpenAI client, so every interview's LLM calls go over the same keep-alive connections,
+    # and the available-models lookup ChatAnyscale does on construction happens once per model.
+    def __init__(self, max_connections=LLM_MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self.models: dict[tuple, ChatAnyscale] = {}
+        self.lock = threading.Lock()
+
+        self.sync_client = None
+        self.async_client = None
+
+    def create_clients(self):
+        api_key = os.environ.get("ANYSCALE_API_KEY")
+        base_url = os.environ.get("ANYSCALE_API_BASE", DEFAULT_API_BASE)
+        timeout = httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+        )
+
+        self.sync_client = openai.OpenAI(api_key=api_key, base_url=base_url, timeout=timeout)
+        self.async_client = openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=timeout,
+            http_client=httpx.AsyncClient(timeout=timeout, limits=limits),
+        )
+
+    def get(self, model_name, max_tokens=None) -> ChatAnyscale:
+        key = (model_name, max_tokens)
+        model = self.models.get(key)
+        if model is not None:
+            return model
+
+        with self.lock:
+            if key not in self.models:
+                if self.async_client is None:
+                    self.create_clients()
+
+                self.models[key] = ChatAnyscale(
+                    model_name=model_name,
+                    max_tokens=max_tokens,
+                    client=self.sync_client.chat.completions,
+                    async_client=self.async_client.chat.completions,
+                )
+            return self.models[key]
+
+    def warm_up(self, models):
+        # Builds the models up front so the first interviews do not pay for it
+        for model_name, max_tokens in models:
+            try:
+                self.get(model_name, max_tokens)
+            except Exception as e:
+                logger.error(f"Could not create the {model_name} client: {e!r}")
+
+
+chat_models = ChatModelPool()
+
+
+class PromptCache:
+    # Interview prompt templates with the company, job description and candidate filled in,
+    # keyed by a hash of the job description so keys stay small
+    def __init__(self, max_size=PROMPT_CACHE_SIZE):
+        self.max_size = max_size
+        self.prompts: OrderedDict[tuple, PromptTemplate] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, company_name, job_description, user_name) -> PromptTemplate:
+        job_hash = hashlib.sha256(job_description.encode()).hexdigest()
+        key = (company_name, job_hash, user_name)
+
+        with self.lock:
+            prompt = self.prompts.get(key)
+            if prompt is not None:
+                self.prompts.move_to_end(key)
+                return prompt
+
+        prompt_template = (
+            prompts.SYSTEM_PROMPT.replace("{company_name}", company_name)
+            .replace("{job_description}", job_description)
+            .replace("{user_name}", user_name)
+        )
+        prompt = PromptTemplate(input_variables=["history", "input"], template=prompt_template)
+
+        with self.lock:
+            self.prompts[key] = prompt
+            while len(self.prompts) > self.max_size:
+                self.prompts.popitem(last=False)
+        return prompt
+
+
+prompt_cache = PromptCache()
@@ -0,0 +1,15 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from interview.jobs import run_workers
+
+
+class Command(BaseCommand):
+    help = "Run the post-interview job workers outside the web process"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+
+    def handle(self, *args, **options):
+        asyncio.run(run_workers(options["workers"]))
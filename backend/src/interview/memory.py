@@ -0,0 +1,100 @@
+import os
+import asyncio
+import logging
+
+# "buffer": resend the whole conversation every turn
+# "bounded": keep the last turns verbatim and fold older ones into a rolling summary
+MEMORY_MODE = os.environ.get("MEMORY_MODE", "bounded")
+MEMORY_MAX_TURNS = int(os.environ.get("MEMORY_MAX_TURNS", 6))
+# Estimated tokens for the summary plus the verbatim turns
+MEMORY_TOKEN_BUDGET = int(os.environ.get("MEMORY_TOKEN_BUDGET", 1500))
+MEMORY_SUMMARY_MAX_TOKENS = int(os.environ.get("MEMORY_SUMMARY_MAX_TOKENS", 256))
+
+CHARS_PER_TOKEN = 4
+
+
+logger = logging.getLogger(__name__)
+print = logger.info
+
+
+def count_tokens(text: str) -> int:
+    # A cheap estimate; Mixtral's tokenizer averages close to four characters per token on English
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def format_turn(question, response) -> str:
+    return f"Human: {question}\nAI: {response}"
+
+
+class ConversationMemory:
+    # Conversation history for the interview prompt, formatted like ConversationBufferMemory.
+    # In bounded mode, turns that fall out of the window are summarized by a background task
+    # between turns and stay verbatim until the summary is in, so a question never waits on it.
+    def __init__(
+        self,
+        summarize=None,
+        mode=MEMORY_MODE,
+        max_turns=MEMORY_MAX_TURNS,
+        token_budget=MEMORY_TOKEN_BUDGET,
+    ):
+        # summarize(summary, lines) -> new summary
+        self.summarize = summarize
+        self.mode = mode
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+
+        self.turns: list[tuple[str, str]] = []
+        self.summary = ""
+        self.summarizing: asyncio.Task = None
+
+    def load(self) -> str:
+        lines = []
+        if self.summary:
+            lines.append(f"Summary of the earlier conversation: {self.summary}")
+        lines.extend(format_turn(question, response) for question, response in self.turns)
+        return "\n".join(lines)
+
+    def save(self, question, response):
+        self.turns.append((question, response))
+        if self.mode == "bounded":
+            self.compact()
+
+    def overflow(self) -> int:
+        # Number of the oldest turns that no longer fit; the latest turn is always kept
+        kept = 0
+        tokens = count_tokens(self.summary)
+        for question, response in reversed(self.turns):
+            tokens += count_tokens(format_turn(question, response))
+            if kept and (kept >= self.max_turns or tokens > self.token_budget):
+                break
+            kept += 1
+
+        return len(self.turns) - kept
+
+    def compact(self):
+        if self.summarize is None:
+            return
+        if self.summarizing is not None and not self.summarizing.done():
+            return
+
+        count = self.overflow()
+        if count:
+            self.summarizing = asyncio.create_task(self.fold(count))
+
+    async def fold(self, count):
+        lines = "\n".join(
+            format_turn(question, response) for question, response in self.turns[:count]
+        )
+        try:
+            summary = await self.summarize(self.summary, lines)
+        except Exception as e:
+            # The turns stay verbatim and are retried after the next turn
+            logger.error(f"Could not summarize the conversation: {e!r}")
+            return
+
+        # Turns saved while the summary was generated come after the folded ones
+        self.summary = summary.strip()
+        del self.turns[:count]
+
+        self.summarizing = None
+        self.compact()
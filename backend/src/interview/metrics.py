@@ -0,0 +1,214 @@
+import os
+import time
+import asyncio
+import bisect
+import threading
+import contextvars
+from collections import OrderedDict, deque
+
+# Tag latencies by interview uid; turn off to keep a single series per stage and outcome
+METRICS_PER_INTERVIEW = bool(int(os.environ.get("METRICS_PER_INTERVIEW", 1)))
+# Series of the least recently active interviews are dropped beyond this many
+METRICS_MAX_INTERVIEWS = int(os.environ.get("METRICS_MAX_INTERVIEWS", 200))
+METRICS_RESERVOIR_SIZE = int(os.environ.get("METRICS_RESERVOIR_SIZE", 1024))
+# Bearer token scrapers must send to /interview/metrics/; the endpoint is off without one
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 16000)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# The interview whose work the current task is doing, so spans deep in helpers get tagged
+current_interview = contextvars.ContextVar("current_interview", default="none")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Series:
+    def __init__(self, buckets):
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.reservoir = deque(maxlen=METRICS_RESERVOIR_SIZE)
+
+    def observe(self, buckets, value):
+        self.bucket_counts[bisect.bisect_left(buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.reservoir.append(value)
+
+    def quantile(self, q):
+        values = sorted(self.reservoir)
+        if not values:
+            return float("nan")
+        return values[min(int(q * len(values)), len(values) - 1)]
+
+
+class Histogram:
+    # Rendered twice: as a Prometheus histogram (cumulative buckets, aggregatable across
+    # workers) and as a summary with p50/p95/p99 over the most recent observations
+    def __init__(self, name, help, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+
+        self.series: dict[tuple, Series] = {}
+        self.interviews = OrderedDict()
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = Series(self.buckets)
+            series.observe(self.buckets, value)
+
+            if "interview" in labels:
+                self._touch_interview(str(labels["interview"]))
+
+    def _touch_interview(self, interview):
+        self.interviews[interview] = True
+        self.interviews.move_to_end(interview)
+
+        while len(self.interviews) > METRICS_MAX_INTERVIEWS:
+            stale, _ = self.interviews.popitem(last=False)
+            index = self.label_names.index("interview")
+            for key in [key for key in self.series if key[index] == stale]:
+                del self.series[key]
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} histogram",
+        ]
+
+        with self.lock:
+            series = [(dict(zip(self.label_names, key)), s) for key, s in self.series.items()]
+
+        for labels, s in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), s.bucket_counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(
+                    f"{self.name}_bucket{format_labels({**labels, 'le': le})} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{format_labels(labels)} {s.sum}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {s.count}")
+
+        if self.name.endswith("_seconds"):
+            summary = f"{self.name.removesuffix('_seconds')}_quantile_seconds"
+        else:
+            summary = f"{self.name}_quantile"
+        lines.append(f"# HELP {summary} {self.help} (recent observations)")
+        lines.append(f"# TYPE {summary} summary")
+        for labels, s in series:
+            for q in QUANTILES:
+                lines.append(f"{summary}{format_labels({**labels, 'quantile': q})} {s.quantile(q)}")
+            lines.append(f"{summary}_sum{format_labels(labels)} {s.sum}")
+            lines.append(f"{summary}_count{format_labels(labels)} {s.count}")
+
+        return lines
+
+
+class Gauge:
+    # Current values, read from collect() -> [(labels, value)] whenever the metrics are scraped
+    def __init__(self, name, help, collect):
+        self.name = name
+        self.help = help
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} gauge",
+        ]
+        for labels, value in self.collect():
+            lines.append(f"{self.name}{format_labels(labels)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_latency = registry.register(
+    Histogram(
+        "interview_stage_duration_seconds",
+        "Time spent in each stage of an interview turn",
+        ("interview", "stage", "outcome"),
+    )
+)
+
+prompt_tokens = registry.register(
+    Histogram(
+        "interview_prompt_tokens",
+        "Prompt tokens sent to the LLM per interview turn",
+        ("interview", "memory"),
+        buckets=TOKEN_BUCKETS,
+    )
+)
+
+
+def bind_interview(interview_id):
+    current_interview.set(str(interview_id))
+
+
+def interview_label(interview=None) -> str:
+    if not METRICS_PER_INTERVIEW:
+        return "all"
+    return str(interview or current_interview.get())
+
+
+class span:
+    # Times a block as one stage; the outcome is "error" if it raises unless set explicitly
+    def __init__(self, stage, interview=None):
+        self.stage = stage
+        self.interview = interview
+        self.outcome = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        if self.outcome:
+            outcome = self.outcome
+        elif exc_type is None:
+            outcome = "ok"
+        elif issubclass(exc_type, asyncio.CancelledError):
+            outcome = "cancelled"
+        else:
+            outcome = "error"
+        stage_latency.observe(
+            duration,
+            interview=interview_label(self.interview),
+            stage=self.stage,
+            outcome=outcome,
+        )
+        return False
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.3 on 2026-10-18 11:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("interview", "0002_job_queue"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="interview",
+            index=models.Index(
+                fields=["user", "created_at"], name="interview_i_user_id_2be6d3_idx"
+            ),
+        ),
+    ]
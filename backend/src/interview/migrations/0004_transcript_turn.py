@@ -0,0 +1,46 @@
+# Generated by Django 5.0.3 on 2026-10-18 12:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("interview", "0003_interview_user_created_at_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TranscriptTurn",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("index", models.PositiveIntegerField()),
+                ("chat_id", models.CharField(blank=True, max_length=32)),
+                ("role", models.CharField(max_length=20)),
+                ("text", models.TextField()),
+                ("interview_ended", models.BooleanField(default=False)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("ended_at", models.DateTimeField(blank=True, null=True)),
+                ("audio_start_ms", models.PositiveIntegerField(blank=True, null=True)),
+                ("audio_end_ms", models.PositiveIntegerField(blank=True, null=True)),
+                (
+                    "interview",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="turns",
+                        to="interview.interview",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["index"],
+                "unique_together": {("interview", "index")},
+            },
+        ),
+    ]
@@ -0,0 +1,75 @@
+import json
+import logging
+from datetime import datetime
+
+from django.db import migrations
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def parse_timestamp(value):
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+
+def backfill_turns(apps, schema_editor):
+    Interview = apps.get_model("interview", "Interview")
+    TranscriptTurn = apps.get_model("interview", "TranscriptTurn")
+
+    interviews = (
+        Interview.objects.exclude(transcript__isnull=True)
+        .exclude(transcript="")
+        .filter(turns__isnull=True)
+        .only("pk", "transcript")
+    )
+
+    batch = []
+    for interview in interviews.iterator(chunk_size=100):
+        try:
+            chats = json.loads(interview.transcript)
+        except ValueError:
+            continue
+
+        chats = chats if isinstance(chats, list) else []
+        skipped = sum(not isinstance(chat, dict) for chat in chats)
+        if skipped:
+            logger.warning(f"Skipping {skipped} malformed chats of interview {interview.pk}")
+
+        for index, chat in enumerate(chat for chat in chats if isinstance(chat, dict)):
+            timestamp = parse_timestamp(chat.get("timestamp"))
+            batch.append(
+                TranscriptTurn(
+                    interview_id=interview.pk,
+                    index=index,
+                    role=chat.get("role", ""),
+                    text=chat.get("message") or "",
+                    interview_ended=bool(chat.get("interview_ended")),
+                    ended_at=timestamp,
+                )
+            )
+
+        if len(batch) >= BATCH_SIZE:
+            TranscriptTurn.objects.bulk_create(batch)
+            batch = []
+
+    TranscriptTurn.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("interview", "0004_transcript_turn"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_turns, migrations.RunPython.noop),
+    ]
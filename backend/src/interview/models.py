@@ -7,6 +7,12 @@ User = get_user_model()
 
 # Create your models here.
 class Interview(models.Model):
+    class ProcessingStatus(models.TextChoices):
+        NOT_STARTED = "not_started"
+        PROCESSING = "processing"
+        READY = "ready"
+        FAILED = "failed"
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
     sid = models.CharField(max_length=100)
@@ -20,12 +26,73 @@ class Interview(models.Model):
 
     started = models.BooleanField(default=False)
     completed = models.BooleanField(default=False)
+    # Progress of the post-interview jobs, so clients can poll until the feedback is ready
+    processing_status = models.CharField(
+        max_length=20, choices=ProcessingStatus.choices, default=ProcessingStatus.NOT_STARTED
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ["user", "uid"]
+        indexes = [models.Index(fields=["user", "created_at"])]
 
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name} - {self.created_at.date()}"
+
+
+class Job(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    kind = models.CharField(max_length=50)
+    # One job per kind and interview output, so enqueueing the same step twice is a no-op
+    key = models.CharField(max_length=255, unique=True)
+    interview_uid = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    last_error = models.TextField(null=True, blank=True)
+
+    run_after = models.DateTimeField()
+    # A running job whose lease has expired belonged to a worker that died and is retried
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+    def __str__(self):
+        return f"{self.kind} - {self.interview_uid} ({self.status})"
+
+
+class TranscriptTurn(models.Model):
+    # One chat of an interview, written as the interview goes so a crash loses at most one turn
+    interview = models.ForeignKey(Interview, on_delete=models.CASCADE, related_name="turns")
+    index = models.PositiveIntegerField()
+    chat_id = models.CharField(max_length=32, blank=True)
+
+    role = models.CharField(max_length=20)
+    text = models.TextField()
+    interview_ended = models.BooleanField(default=False)
+
+    started_at = models.DateTimeField(null=True, blank=True)
+    ended_at = models.DateTimeField(null=True, blank=True)
+    # Position of an answer in the interview's audio recording
+    audio_start_ms = models.PositiveIntegerField(null=True, blank=True)
+    audio_end_ms = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ["interview", "index"]
+        ordering = ["index"]
+
+    def __str__(self):
+        return f"{self.interview_id} #{self.index} ({self.role})"
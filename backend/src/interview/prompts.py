@@ -73,3 +73,16 @@ Format your response as follows:
 ]
 }}
 """
+
+
+SUMMARY_PROMPT = """
+Progressively summarize the interview below, adding onto the previous summary and returning a new summary. Keep the facts about the candidate's experience, skills and answers, and the topics that have already been covered, so that they are not asked about again. Be concise.
+
+Previous summary:
+{summary}
+
+New lines of conversation:
+{lines}
+
+New summary:
+"""
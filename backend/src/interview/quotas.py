@@ -0,0 +1,126 @@
+import os
+import threading
+
+from .metrics import registry, Gauge
+
+# Largest single audio or video frame accepted; bigger ones are dropped and reported to the client
+MAX_AUDIO_FRAME_BYTES = int(os.environ.get("MAX_AUDIO_FRAME_BYTES", 64 << 10))
+MAX_VIDEO_FRAME_BYTES = int(os.environ.get("MAX_VIDEO_FRAME_BYTES", 1 << 20))
+# Bytes of media a single connection may hold in memory
+CONNECTION_BUFFER_BUDGET = int(os.environ.get("CONNECTION_BUFFER_BUDGET", 512 << 20))
+# Bytes of media all connections of this process may hold in memory together
+PROCESS_BUFFER_BUDGET = int(os.environ.get("PROCESS_BUFFER_BUDGET", 4 << 30))
+# Fraction of a budget at which clients are asked to slow down
+SLOW_DOWN_RATIO = float(os.environ.get("SLOW_DOWN_RATIO", 0.8))
+
+OK = "ok"
+SLOW_DOWN = "slowDown"
+PAUSE = "pause"
+
+
+class IngestQuota:
+    # Media bytes buffered by each connection of this process, as last reported by its handler.
+    # Connections over their own budget, or any connection while the process is over its
+    # budget, are paused; past SLOW_DOWN_RATIO of either budget they are asked to slow down.
+    def __init__(
+        self,
+        connection_budget=CONNECTION_BUFFER_BUDGET,
+        process_budget=PROCESS_BUFFER_BUDGET,
+        slow_down_ratio=SLOW_DOWN_RATIO,
+    ):
+        self.connection_budget = connection_budget
+        self.process_budget = process_budget
+        self.slow_down_ratio = slow_down_ratio
+
+        self.usage: dict[str, int] = {}
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def state(self, connection_bytes, process_bytes) -> str:
+        if connection_bytes > self.connection_budget or process_bytes > self.process_budget:
+            return PAUSE
+
+        if (
+            connection_bytes > self.connection_budget * self.slow_down_ratio
+            or process_bytes > self.process_budget * self.slow_down_ratio
+        ):
+            return SLOW_DOWN
+
+        return OK
+
+    def admit(self, sid, buffered, incoming=0) -> str:
+        # Records the connection's usage, including the incoming frame unless it is refused
+        with self.lock:
+            others = self.total - self.usage.get(sid, 0)
+            state = self.state(buffered + incoming, others + buffered + incoming)
+            if state == PAUSE:
+                incoming = 0
+
+            self.usage[sid] = buffered + incoming
+            self.total = others + buffered + incoming
+
+        return state
+
+    def move(self, sid, new_sid):
+        with self.lock:
+            if sid in self.usage:
+                self.usage[new_sid] = self.usage.pop(sid)
+
+    def release(self, sid):
+        with self.lock:
+            self.total -= self.usage.pop(sid, 0)
+
+    def snapshot(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.usage)
+
+
+class FrameSequence:
+    # Numbers of one kind of frame on a connection, so a refused frame can be named to the client.
+    # Clients may number their frames, counting up by one from any start: a refused frame is then
+    # expected again, after "resume", and the frames sent behind it are refused until it comes.
+    # Frames without a number are counted here instead, and a refused one is lost.
+    def __init__(self):
+        self.next = None
+
+    def number(self, number=None) -> int:
+        if number is not None:
+            return number
+        return self.next or 0
+
+    def expects(self, number) -> bool:
+        return self.next is None or number == self.next
+
+    def accepted(self, number):
+        self.next = number + 1
+
+    def refused(self, number, numbered):
+        self.next = number if numbered else number + 1
+
+
+ingest_quota = IngestQuota()
+
+registry.register(
+    Gauge(
+        "interview_buffer_bytes",
+        "Media bytes each connection holds in memory",
+        lambda: [({"sid": sid}, usage) for sid, usage in ingest_quota.snapshot().items()],
+    )
+)
+registry.register(
+    Gauge(
+        "interview_buffer_process_bytes",
+        "Media bytes all connections of this process hold in memory",
+        lambda: [({}, ingest_quota.total)],
+    )
+)
+registry.register(
+    Gauge(
+        "interview_buffer_budget_bytes",
+        "Media bytes a connection or the whole process may hold in memory",
+        lambda: [
+            ({"scope": "connection"}, ingest_quota.connection_budget),
+            ({"scope": "process"}, ingest_quota.process_budget),
+        ],
+    )
+)
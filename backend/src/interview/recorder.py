@@ -0,0 +1,125 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+print = logger.info
+
+
+def ffmpeg_command(source, video_file) -> list[str]:
+    # fmt: off
+    return [
+        "ffmpeg", "-loglevel", "quiet", "-y", "-i", source,
+        "-vcodec", "libx264", "-crf", "23", "-f", "mp4", "-r", "30", video_file,
+    ]
+    # fmt: on
+
+
+async def encode_file(raw_file, video_file) -> bool:
+    # Encode recorded video that was buffered instead of streamed, without blocking the loop
+    process = await asyncio.create_subprocess_exec(
+        *ffmpeg_command(raw_file, video_file),
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    return await process.wait() == 0
+
+
+class VideoRecorder:
+    # Encodes the candidate's video while the interview is running by feeding the incoming
+    # chunks to a long-running ffmpeg process, started in the background on creation. Writes
+    # never wait, so chunks stay in arrival order; queued_bytes is what ffmpeg has yet to take,
+    # for the ingest quota to hold clients back when it falls behind, and on_drain is called
+    # whenever it took all of it.
+    # If ffmpeg fails, the rest of the video goes to the fallback buffer in order, behind the
+    # stream's first chunk, which carries the container header the later chunks need.
+    def __init__(self, video_file, fallback=None, on_drain=None):
+        self.video_file = video_file
+        self.fallback = fallback
+        self.on_drain = on_drain
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.queued_bytes = 0
+
+        self.process = None
+        self.failed = False
+        self.header = None
+        self.feeder = asyncio.create_task(self._run())
+
+    def write(self, chunk: bytes):
+        if self.failed and self.fallback is None:
+            return
+
+        self.queued_bytes += len(chunk)
+        self.queue.put_nowait(chunk)
+
+    async def finish(self) -> bool:
+        # Flush the queued chunks and wait for ffmpeg to write the trailer
+        self.queue.put_nowait(None)
+        await self.feeder
+
+        if self.process is None:
+            return False
+
+        return_code = await self.process.wait()
+        if return_code != 0:
+            print(f"ffmpeg exited with {return_code} while writing {self.video_file}")
+
+        return not self.failed and return_code == 0
+
+    async def _run(self):
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *ffmpeg_command("pipe:0", self.video_file),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except OSError as e:
+            print(f"Could not start ffmpeg, buffering video instead: {e!r}")
+            self.failed = True
+
+        await self._feed()
+
+    async def _feed(self):
+        stdin = self.process.stdin if self.process is not None else None
+
+        while True:
+            chunk = await self.queue.get()
+            if chunk is None:
+                break
+
+            self.queued_bytes -= len(chunk)
+            if self.failed:
+                self.keep(chunk)
+            else:
+                await self._write(stdin, chunk)
+
+            if self.queue.empty() and self.on_drain is not None:
+                self.on_drain()
+
+        if stdin is None:
+            return
+
+        try:
+            stdin.close()
+            await stdin.wait_closed()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    async def _write(self, stdin, chunk: bytes):
+        if self.header is None:
+            self.header = chunk
+
+        try:
+            stdin.write(chunk)
+            await stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            print(f"ffmpeg stopped accepting video for {self.video_file}: {e!r}")
+            self.failed = True
+            if self.header is not chunk:
+                self.keep(self.header)
+            self.keep(chunk)
+
+    def keep(self, chunk: bytes):
+        if self.fallback is not None:
+            self.fallback.append(chunk)
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import logging
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import WatchError
+except ImportError:  # pragma: no cover
+    aioredis = None
+
+# Shared by every worker, e.g. redis://redis:6379/0. Without it sessions are tracked per process.
+SESSION_STORE_URL = os.environ.get("SESSION_STORE_URL", os.environ.get("SOCKETIO_MESSAGE_QUEUE"))
+SESSION_STORE_PREFIX = os.environ.get("SESSION_STORE_PREFIX", "interview")
+# Sessions of a worker that stops refreshing them expire after this long
+SESSION_TTL = int(os.environ.get("SESSION_TTL", 60))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+logger = logging.getLogger(__name__)
+print = logger.info
+
+
+class LocalSessionStore:
+    # Live interview sessions of this process only, for single-worker deployments
+    def __init__(self):
+        self.sessions: dict[str, dict] = {}
+
+    async def claim(self, interview_uid, sid) -> bool:
+        owner = self.sessions.setdefault(str(interview_uid), {"sid": sid, "worker": WORKER_ID})
+        return owner["sid"] == sid
+
+    async def transfer(self, interview_uid, sid, new_sid) -> bool:
+        # Hands a live session over to the reconnected socket
+        owner = self.sessions.get(str(interview_uid))
+        if owner is None or owner["sid"] != sid:
+            return False
+
+        owner["sid"] = new_sid
+        return True
+
+    async def release(self, interview_uid, sid):
+        if self.sessions.get(str(interview_uid), {}).get("sid") == sid:
+            del self.sessions[str(interview_uid)]
+
+    async def owner(self, interview_uid) -> dict | None:
+        return self.sessions.get(str(interview_uid))
+
+    async def count(self) -> int:
+        return len(self.sessions)
+
+
+class RedisSessionStore:
+    # Live interview sessions of every worker. Each session is a key with a TTL that the owning
+    # worker keeps refreshing, so sessions of a crashed worker free themselves.
+    def __init__(self, url, prefix=SESSION_STORE_PREFIX, ttl=SESSION_TTL):
+        self.redis = aioredis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.ttl = ttl
+
+        self.local: dict[str, str] = {}
+        self.heartbeat = None
+
+    def key(self, interview_uid):
+        return f"{self.prefix}:session:{interview_uid}"
+
+    @property
+    def index(self):
+        return f"{self.prefix}:sessions"
+
+    async def claim(self, interview_uid, sid) -> bool:
+        interview_uid = str(interview_uid)
+        value = json.dumps({"sid": sid, "worker": WORKER_ID})
+
+        claimed = await self.redis.set(self.key(interview_uid), value, nx=True, ex=self.ttl)
+        if not claimed:
+            owner = await self.owner(interview_uid)
+            if owner is None or owner["sid"] != sid:
+                return False
+
+        await self.redis.zadd(self.index, {interview_uid: time.time() + self.ttl})
+        self.local[interview_uid] = sid
+        self.start_heartbeat()
+        return True
+
+    async def transfer(self, interview_uid, sid, new_sid) -> bool:
+        interview_uid = str(interview_uid)
+        key = self.key(interview_uid)
+        value = json.dumps({"sid": new_sid, "worker": WORKER_ID})
+
+        async with self.redis.pipeline() as pipe:
+            try:
+                await pipe.watch(key)
+                owner = await pipe.get(key)
+                if owner is None or json.loads(owner)["sid"] != sid:
+                    return False
+
+                pipe.multi()
+                pipe.set(key, value, ex=self.ttl)
+                await pipe.execute()
+            except WatchError:
+                return False
+
+        self.local[interview_uid] = new_sid
+        return True
+
+    async def release(self, interview_uid, sid):
+        interview_uid = str(interview_uid)
+        key = self.key(interview_uid)
+        if self.local.get(interview_uid) == sid:
+            del self.local[interview_uid]
+
+        # Only the owner may delete the session; a concurrent change aborts the transaction
+        async with self.redis.pipeline() as pipe:
+            try:
+                await pipe.watch(key)
+                owner = await pipe.get(key)
+                if owner is None or json.loads(owner)["sid"] != sid:
+                    return
+
+                pipe.multi()
+                pipe.delete(key)
+                pipe.zrem(self.index, interview_uid)
+                await pipe.execute()
+            except WatchError:
+                pass
+
+    async def owner(self, interview_uid) -> dict | None:
+        owner = await self.redis.get(self.key(interview_uid))
+        return json.loads(owner) if owner else None
+
+    async def count(self) -> int:
+        # Live sessions across all workers, dropping those that expired without a release
+        await self.redis.zremrangebyscore(self.index, "-inf", time.time())
+        return await self.redis.zcard(self.index)
+
+    def start_heartbeat(self):
+        if self.heartbeat is None or self.heartbeat.done():
+            self.heartbeat = asyncio.create_task(self.refresh())
+
+    async def refresh(self):
+        while self.local:
+            await asyncio.sleep(self.ttl / 3)
+
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for interview_uid in list(self.local):
+                        pipe.expire(self.key(interview_uid), self.ttl)
+                        pipe.zadd(self.index, {interview_uid: time.time() + self.ttl})
+                    await pipe.execute()
+            except Exception as e:
+                logger.error(f"Could not refresh interview sessions: {e!r}")
+
+
+def get_session_store():
+    if SESSION_STORE_URL:
+        if aioredis is None:
+            raise ImportError("SESSION_STORE_URL is set but the redis package is not installed")
+        return RedisSessionStore(SESSION_STORE_URL)
+
+    return LocalSessionStore()
+
+
+session_store = get_session_store()
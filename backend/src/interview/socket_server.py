@@ -1,31 +1,95 @@
-import copy
+import re
 import json
 import os
-import io
+import uuid
+import time
+import asyncio
 import base64
 import threading
 import logging
 
 import jwt
 import socketio
-import ffmpeg
 from urllib.parse import parse_qs
-from asgiref.sync import sync_to_async
-from gtts import gTTS
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from webapp.database import database_sync_to_async
 
 from users.models import User
-from .models import Interview
+from users.secret_keys import secret_key_cache, SECRET_KEY_RECHECK_AFTER
+from .models import Interview, TranscriptTurn
 from .views import JWT_ALGORITHM
-from .transcript_helper import get_transcript
+from .transcript_helper import transcribe_buffer, TranscriptionError
+from .streaming_transcriber import StreamingTranscriber
+from .vad import VoiceActivityTracker, EndOfTurnDetector
+from .recorder import VideoRecorder
+from .audio_decoder import (
+    AudioDecoder,
+    AUDIO_CONTAINERS,
+    AUDIO_DECODER_LIMIT,
+    decoding_available,
+)
+from .tts import synthesize, synthesize_stream, TTSError
+from .metrics import bind_interview, span, stage_latency, interview_label
+from .jobs import enqueue_finalization
+from .sessions import session_store
+from .transcripts import TranscriptWriter
+from .quotas import (
+    ingest_quota,
+    FrameSequence,
+    MAX_AUDIO_FRAME_BYTES,
+    MAX_VIDEO_FRAME_BYTES,
+    OK,
+    PAUSE,
+)
 from .llm_client import LLMClient
-from .utils import MediaBuffer, Chat
+from .speculation import Speculation, CANCELLED
+from .utils import MediaBuffer, SpillingMediaBuffer, Chat
 
 # Constants
 SAMPLING_RATE = 16000
 WINDOW_SIZE_SAMPLES = 1536  # Number of samples in a single audio chunk
 
-mgr = socketio.AsyncManager()
-sio = socketio.AsyncServer(client_manager=mgr, async_mode="asgi", cors_allowed_origins="*")
+# Transcribe answers segment by segment at pauses while the candidate is still speaking
+STREAMING_TRANSCRIPTION = bool(int(os.environ.get("STREAMING_TRANSCRIPTION", 0)))
+
+# End the answer once the candidate falls silent (END_OF_TURN_SILENCE_MS) instead of waiting for
+# the client to stop responding
+END_OF_TURN_DETECTION = bool(int(os.environ.get("END_OF_TURN_DETECTION", 0)))
+
+# Draft the next question from the partial transcript whenever the candidate pauses, so it is
+# ready when the answer ends the way it was at the pause. Needs STREAMING_TRANSCRIPTION.
+SPECULATIVE_QUESTIONS = bool(int(os.environ.get("SPECULATIVE_QUESTIONS", 0)))
+
+# "spill": recordings continue in a file under the output directory past MEDIA_SPILL_THRESHOLD,
+# "memory": the whole recording stays in memory until the interview ends
+RECORDING_BUFFER = os.environ.get("RECORDING_BUFFER", "spill")
+
+# "stream": encode video with ffmpeg while the interview runs, "buffer": encode in a job afterwards
+VIDEO_RECORDING = os.environ.get("VIDEO_RECORDING", "stream")
+
+# Stream questions sentence by sentence to clients that negotiated audioStreaming
+STREAMING_LLM = bool(int(os.environ.get("STREAMING_LLM", 1)))
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Seconds a dropped connection's session is kept for the candidate to reconnect, 0 to end it at once
+SESSION_RESUME_GRACE = float(os.environ.get("SESSION_RESUME_GRACE", 30))
+
+# Pub/sub between workers, e.g. redis://redis:6379/0, so any worker can emit to any client
+SOCKETIO_MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE")
+
+if SOCKETIO_MESSAGE_QUEUE:
+    mgr = socketio.AsyncRedisManager(SOCKETIO_MESSAGE_QUEUE)
+else:
+    mgr = socketio.AsyncManager()
+# Frames a little over the frame limits are refused with a flowControl event; engine.io cuts off
+# far bigger messages before they are buffered
+sio = socketio.AsyncServer(
+    client_manager=mgr,
+    async_mode="asgi",
+    cors_allowed_origins="*",
+    max_http_buffer_size=2 * max(MAX_AUDIO_FRAME_BYTES, MAX_VIDEO_FRAME_BYTES),
+)
 
 
 logger = logging.getLogger(__name__)
@@ -33,9 +97,22 @@ print = logger.info
 
 NO_RESPONSES = False
 
+# Columns a connection needs from the interview and its user
+CONNECT_FIELDS = (
+    "uid",
+    "sid",
+    "started",
+    "company_name",
+    "job_description",
+    "user__email",
+    "user__first_name",
+    "user__last_name",
+    "user__secret_key",
+)
+
 
 class ConnectionHandler:
-    def __init__(self, sid, interview: Interview, user: User):
+    def __init__(self, sid, interview: Interview, user: User, client_options=None):
 
         # Set the time gap threshold in seconds
         self.threshold = 5
@@ -44,11 +121,21 @@ class ConnectionHandler:
         # Store important details
         self.sid = sid
         self.interview_id = interview.uid
+        self.interview_pk = interview.pk
         self.interview_data = interview.__dict__
+        self.user_email = user.email
         self.user_name = f"{user.first_name} {user.last_name}"
+        self.client_options = client_options or get_client_options({})
 
         # Disconnector
         self.disconnecting = False
+        self.interview_ended = False
+        # Expires the session while it waits for the candidate to reconnect, or ends it when
+        # another session of the interview is parked in its place
+        self.expiry: asyncio.Task = None
+        # Decodes the rest of the stream an answer was sent in when the connection dropped
+        self.decoder_finishing: asyncio.Task = None
+        self.parked_at = None
 
         self.output_dir = f"output/{self.interview_id}-{sid}"
         if not os.path.exists(self.output_dir):
@@ -56,8 +143,31 @@ class ConnectionHandler:
 
         # Initialize buffers
         self.current_question_audio_buffer = MediaBuffer(SAMPLING_RATE)
-        self.total_audio_buffer = MediaBuffer(SAMPLING_RATE)
-        self.total_video_bytes = MediaBuffer(SAMPLING_RATE)
+        self.total_audio_buffer = self.recording_buffer("audio")
+        self.total_video_bytes = self.recording_buffer("video")
+        self.video_recorder: VideoRecorder = None
+        # Decodes the current answer when the client sends compressed audio
+        self.audio_decoder: AudioDecoder = None
+        self.stream_video = VIDEO_RECORDING == "stream"
+        # Last flow control state sent to the client
+        self.flow_state = OK
+        self.frames = {"audio": FrameSequence(), "video": FrameSequence()}
+        # Events sent without holding up the frame that caused them
+        self.background_emits: set[asyncio.Task] = set()
+
+        # Incremental transcription and end of turn detection of the current answer
+        self.vad_tracker = None
+        self.transcriber = None
+        self.end_of_turn = None
+        if STREAMING_TRANSCRIPTION or END_OF_TURN_DETECTION:
+            self.vad_tracker = VoiceActivityTracker(SAMPLING_RATE, WINDOW_SIZE_SAMPLES)
+        if STREAMING_TRANSCRIPTION:
+            self.transcriber = StreamingTranscriber(self.output_dir)
+        if END_OF_TURN_DETECTION:
+            self.end_of_turn = EndOfTurnDetector()
+        self.end_of_turn_task: asyncio.Task = None
+        self.speculative = SPECULATIVE_QUESTIONS and self.transcriber is not None
+        self.speculation: Speculation = None
 
         # Initialize flags
         self.getting_next_question = False
@@ -66,20 +176,40 @@ class ConnectionHandler:
         if NO_RESPONSES:
             return
 
-        # Chats
+        # Chats, stored turn by turn as the interview goes
         self.chats: list[Chat] = []
-        self.llm_client = LLMClient(interview_data=self.interview_data, user_name=self.user_name)
+        # A new session of an interview, e.g. after its session expired, goes on after its turns
+        last_turn_index = interview.last_turn_index
+        start_index = 0 if last_turn_index is None else last_turn_index + 1
+        self.transcript = TranscriptWriter(self.interview_pk, start_index)
+        self.answer_started_at = None
+        self.answer_audio_start_ms = None
+        # Created in on_connect
+        self.llm_client: LLMClient = None
+
+    def recording_buffer(self, kind) -> MediaBuffer:
+        if RECORDING_BUFFER == "spill":
+            return SpillingMediaBuffer(
+                SAMPLING_RATE, f"{self.output_dir}/{kind}.spill", on_spill=self.buffers_freed
+            )
+        return MediaBuffer(SAMPLING_RATE)
 
     async def on_connect(self):
         print("Client connected:", self.sid)
+        bind_interview(self.interview_id)
+        await self.send_audio_format()
 
         if NO_RESPONSES:
             return
 
-        interview_done, first_question = await self.llm_client.start_interview()
-        first_chat = Chat(first_question, "assistant", interview_done)
-        self.chats.append(first_chat)
-        await self.send_chat(first_chat)
+        with span("connect"):
+            started_at = timezone.now()
+            self.llm_client = await LLMClient.create(self.interview_data, self.user_name)
+            interview_done, first_question = await self.llm_client.start_interview()
+            first_chat = Chat(first_question, "assistant", interview_done)
+            self.add_chat(first_chat, started_at=started_at)
+            self.transcript.flush()
+            await self.send_chat(first_chat)
 
     async def on_disconnect(self):
         if self.disconnecting:
@@ -88,112 +218,468 @@ class ConnectionHandler:
         self.disconnecting = True
 
         print("Client disconnecting:", self.sid)
-
-        try:
-            # Save the audio to a wav file
-            wav_file = f"{self.output_dir}/audio.wav"
-            self.total_audio_buffer.create_wav(wav_file)
-
-            # Save the video buffer to a file
-            raw_video_file = f"{self.output_dir}/video.raw"
-            self.total_video_bytes.write_bytes(raw_video_file)
-
-            # Convert the raw video to mp4
-            video_file = f"{self.output_dir}/video.mp4"
-            ffmpeg.input(raw_video_file).output(
-                video_file, vcodec="libx264", crf=23, f="mp4", r=30, loglevel="quiet"
-            ).run()
-            os.remove(raw_video_file)
-
-            if not NO_RESPONSES:
-                feedback = await self.llm_client.get_feedback(self.user_name, self.chats)
-
-                with open(f"{self.output_dir}/feedback.json", "w") as f:
-                    json.dump(feedback, f)
-
-                with open(f"{self.output_dir}/transcript.json", "w") as f:
-                    json.dump([i.to_dict() for i in self.chats], f)
-
-                # Check whether the interview object exists
-                interview_exists = await sync_to_async(
-                    Interview.objects.filter(uid=self.interview_id).exists
-                )()
-                if not interview_exists:
-                    return
-
-                interview: Interview = await sync_to_async(Interview.objects.get)(
-                    uid=self.interview_id
+        bind_interview(self.interview_id)
+
+        with span("disconnect") as finalize:
+            try:
+                if self.video_recorder is not None:
+                    # The video was encoded while streaming, only the tail is left. If ffmpeg
+                    # failed, the rest of the video was buffered for the encode_video job.
+                    if not await self.video_recorder.finish():
+                        finalize.outcome = "video_failed"
+
+                await self.finish_audio_decoder()
+                self.cancel_speculation()
+
+                if not NO_RESPONSES:
+                    # The last turns may still be on their way to the database
+                    await self.transcript.close()
+
+                # Persist the raw session and leave the slow steps to the job workers
+                await asyncio.to_thread(self.save_session)
+                await enqueue_finalization(
+                    self.interview_id,
+                    self.output_dir,
+                    self.user_name,
+                    SAMPLING_RATE,
+                    feedback=not NO_RESPONSES,
                 )
-                interview.transcript = json.dumps([i.to_dict() for i in self.chats])
-                interview.feedback = json.dumps(feedback)
-                interview.completed = True
-                await sync_to_async(interview.save)()
 
-        except Exception as e:
-            print(e)
+            except Exception as e:
+                finalize.outcome = "error"
+                print(e)
+
+        await session_store.release(self.interview_id, self.sid)
 
         print("Client disconnected:", self.sid)
         self.disconnecting = False
-        del active_connections[self.sid]
+        active_connections.pop(self.sid, None)
+        if parked_sessions.get(str(self.interview_id)) is self:
+            # The interview ended while the candidate was away
+            del parked_sessions[str(self.interview_id)]
+
+        # The buffers are freed with the handler, which may let paused connections resume
+        ingest_quota.release(self.sid)
+        resume_paused_connections()
+
+    def park(self, grace=SESSION_RESUME_GRACE):
+        # Keeps the session, its chats, buffers and LLM memory, for a reconnect to pick up.
+        # The session stays claimed in the session store meanwhile.
+        print("Client dropped, parking the session:", self.sid)
+        active_connections.pop(self.sid, None)
+        displaced = parked_sessions.get(str(self.interview_id))
+        if displaced is not None and displaced is not self:
+            # Only the latest session can be resumed, the one parked before is finalized now
+            print("Ending the session parked before:", displaced.sid)
+            displaced.expiry.cancel()
+            displaced.observe_parked("replaced")
+            displaced.expiry = asyncio.create_task(displaced.on_disconnect())
+        parked_sessions[str(self.interview_id)] = self
+
+        # Audio of an answer in progress is kept and continued after the reconnect
+        self.is_responding = False
+        if self.audio_decoder is not None:
+            # The client starts a new stream for the rest of the answer
+            decoder, self.audio_decoder = self.audio_decoder, None
+            self.decoder_finishing = asyncio.create_task(self.finish_decoder(decoder))
+        self.parked_at = time.perf_counter()
+        self.expiry = asyncio.create_task(self.expire(grace))
+
+    async def expire(self, grace):
+        await asyncio.sleep(grace)
+
+        if parked_sessions.get(str(self.interview_id)) is not self:
+            return
+
+        del parked_sessions[str(self.interview_id)]
+        self.observe_parked("expired")
+        await self.on_disconnect()
+
+    async def resume(self, sid, client_options):
+        # The reconnected socket takes over; the interview carries on where it stopped
+        print("Client reconnected:", self.sid, "->", sid)
+        bind_interview(self.interview_id)
+
+        ingest_quota.move(self.sid, sid)
+        self.sid = sid
+        self.client_options = client_options
+        active_connections[sid] = self
+        await self.send_audio_format()
+
+        # The new socket has not been told to hold back yet, and numbers its frames afresh
+        self.flow_state = OK
+        self.frames = {"audio": FrameSequence(), "video": FrameSequence()}
+        self.update_flow()
+
+        chats = [{**chat.to_dict(), "id": chat.id} for chat in getattr(self, "chats", [])]
+        await self.emit(
+            "sessionResumed",
+            {"chats": chats, "gettingNextQuestion": self.getting_next_question},
+        )
+
+    def observe_parked(self, outcome):
+        stage_latency.observe(
+            time.perf_counter() - self.parked_at,
+            interview=interview_label(self.interview_id),
+            stage="parked",
+            outcome=outcome,
+        )
+
+    def add_chat(self, chat: Chat, **timing):
+        self.chats.append(chat)
+        self.transcript.add(chat, **timing)
+
+    def audio_offset_ms(self) -> int:
+        # 16-bit mono samples recorded so far
+        return len(self.total_audio_buffer) * 1000 // (2 * SAMPLING_RATE)
+
+    def save_session(self):
+        self.total_audio_buffer.write_bytes(f"{self.output_dir}/audio.raw")
+
+        if len(self.total_video_bytes):
+            self.total_video_bytes.write_bytes(f"{self.output_dir}/video.raw")
+
+        if not NO_RESPONSES:
+            with open(f"{self.output_dir}/transcript.json", "w") as f:
+                json.dump([i.to_dict() for i in self.chats], f)
+
+    def encode_audio(self, audio: bytes):
+        if self.client_options["binary_audio"]:
+            return audio
+
+        return base64.b64encode(audio).decode("utf-8")
 
     async def send_chat(self, chat: Chat):
         chat_data = chat.to_dict()
+        chat_data["id"] = chat.id
+
+        if self.client_options["audio_streaming"]:
+            # Send the text right away and follow up with the audio as it is synthesized
+            chat_data["audio"] = None
+            await self.emit("chat", chat_data)
+
+            sentences = asyncio.Queue()
+            sentences.put_nowait(chat.message)
+            sentences.put_nowait(None)
+            await self.send_chat_audio(chat.id, sentences)
+            return
+
+        try:
+            with span("tts"):
+                audio = await synthesize(chat.message)
+            chat_data["audio"] = self.encode_audio(audio)
+        except TTSError as e:
+            logger.error(f"Speech synthesis failed for {self.sid}: {e!r}")
+            chat_data["audio"] = None
+
+        with span("emit"):
+            await self.emit("chat", chat_data)
+
+    async def send_chat_audio(self, chat_id, sentences: asyncio.Queue):
+        # Synthesizes queued sentences in order until None is queued
+        index = 0
+        while (sentence := await sentences.get()) is not None:
+            try:
+                with span("tts"):
+                    async for audio in synthesize_stream(sentence):
+                        await self.emit(
+                            "chatAudio",
+                            {
+                                "id": chat_id,
+                                "index": index,
+                                "audio": self.encode_audio(audio),
+                                "final": False,
+                            },
+                        )
+                        index += 1
+            except TTSError as e:
+                logger.error(f"Speech synthesis failed for {self.sid}: {e!r}")
+
+        await self.emit(
+            "chatAudio",
+            {"id": chat_id, "index": index, "audio": None, "final": True},
+        )
 
-        tts = gTTS(chat_data["message"], lang="en")
-        audio_buffer = io.BytesIO()
-        tts.write_to_fp(audio_buffer)
-        audio_buffer.seek(0)
+    async def stream_next_question(self, transcript) -> Chat:
+        # Each finished sentence is sent as chatText and queued for speech while the LLM
+        # is still generating the rest of the question
+        chat_id = uuid.uuid4().hex
+        sentences = asyncio.Queue()
+        speaker = asyncio.create_task(self.send_chat_audio(chat_id, sentences))
 
-        audio_base64 = base64.b64encode(audio_buffer.read()).decode("utf-8")
-        chat_data["audio"] = audio_base64
+        pending = ""
+        index = 0
 
-        await sio.emit("chat", chat_data, to=self.sid)
+        async def send_sentence(sentence):
+            nonlocal index
+            await self.emit("chatText", {"id": chat_id, "index": index, "text": sentence})
+            sentences.put_nowait(sentence)
+            index += 1
+
+        async def on_text(text):
+            nonlocal pending
+            *finished, pending = SENTENCE_END.split(pending + text)
+            for sentence in finished:
+                await send_sentence(sentence)
+
+        try:
+            interview_ended, text = await self.llm_client.get_question_streaming(
+                transcript, on_text
+            )
+            if pending.strip():
+                await send_sentence(pending.strip())
+        finally:
+            sentences.put_nowait(None)
+
+        chat = Chat(text, "assistant", interview_ended, chat_id=chat_id)
+
+        chat_data = chat.to_dict()
+        chat_data["id"] = chat.id
+        chat_data["audio"] = None
+        await self.emit("chat", chat_data)
 
-    async def process_video(self, message):
+        await speaker
+        return chat
+
+    async def process_video(self, message, number=None):
         if not self.is_responding:
             return
 
-        # Append video data to the buffer
-        if isinstance(message, bytes):
+        if not isinstance(message, bytes):
+            return
+
+        # Nothing below may await: every frame is its own task, and a frame that yields before it
+        # is queued can be overtaken by the next one
+        if not self.admit("video", message, number, MAX_VIDEO_FRAME_BYTES):
+            return
+
+        if self.stream_video and self.video_recorder is None:
+            self.video_recorder = VideoRecorder(
+                f"{self.output_dir}/video.mp4",
+                fallback=self.total_video_bytes,
+                on_drain=self.resume_flow,
+            )
+
+        if self.video_recorder is not None:
+            # Streamed video is held only until ffmpeg takes it
+            self.video_recorder.write(message)
+        else:
+            # Append video data to the buffer
             self.total_video_bytes.append(message)
 
-    async def process_audio(self, message):
+    async def process_audio(self, message, number=None):
         if not self.is_responding:
             return
 
         if isinstance(message, bytes):
-            self.total_audio_buffer.append(message)
-            self.current_question_audio_buffer.append(message)
+            # As for video, the frame is queued without yielding to the next one
+            if not self.admit("audio", message, number, MAX_AUDIO_FRAME_BYTES):
+                return
+
+            if self.client_options["audio_format"] == "pcm":
+                self._ingest_pcm(message)
+                return
+
+            if self.audio_decoder is None:
+                self.audio_decoder = AudioDecoder(
+                    AUDIO_CONTAINERS[self.client_options["audio_format"]],
+                    SAMPLING_RATE,
+                    self._ingest_pcm,
+                    self.resume_flow,
+                )
+            self.audio_decoder.write(message)
+
+            if self.audio_decoder.backlogged():
+                # ffmpeg has fallen behind this answer. The frame is queued, and so are the ones
+                # sent before the client hears "pause"; "resume" follows once ffmpeg caught up.
+                self.signal_flow(PAUSE)
+
+    def _ingest_pcm(self, pcm: bytes):
+        # The answer first, so it is counted if the recording spills to disk
+        self.current_question_audio_buffer.append(pcm)
+        self.total_audio_buffer.append(pcm)
+
+        if self.vad_tracker is not None:
+            self.vad_tracker.feed(pcm)
+
+        if (
+            self.speculation is not None
+            and self.vad_tracker.last_speech_bytes > self.speculation.speech_bytes
+        ):
+            # The candidate went on after the pause the question was drafted at
+            self.cancel_speculation()
+
+        if self.transcriber is not None:
+            segments = len(self.transcriber.segments)
+            self.transcriber.update(self.current_question_audio_buffer, self.vad_tracker)
+            if self.speculative and len(self.transcriber.segments) > segments:
+                self.cancel_speculation()
+                self.speculation = Speculation(
+                    self.llm_client,
+                    self.transcriber.partial(),
+                    self.vad_tracker.last_speech_bytes,
+                    interview_label(self.interview_id),
+                )
+
+        if (
+            self.end_of_turn is not None
+            and self.is_responding
+            and self.end_of_turn.ended(self.vad_tracker)
+        ):
+            # Audio that is still arriving is dropped like after respondingStatus false
+            self.is_responding = False
+            self.end_of_turn_task = asyncio.create_task(self.end_turn())
+
+    def cancel_speculation(self, outcome=CANCELLED):
+        speculation, self.speculation = self.speculation, None
+        if speculation is not None:
+            speculation.discard(outcome)
+
+    async def end_turn(self):
+        print("End of turn detected:", self.sid)
+        await self.emit(
+            "getRespondingStatus",
+            {"status": False, "message": "End of turn detected", "endOfTurn": True},
+        )
+        await self.ask_next_question()
+
+    async def finish_audio_decoder(self):
+        # Waits for the PCM of the frames already received, including those of the stream that
+        # was finishing when the connection dropped
+        finishing, self.decoder_finishing = self.decoder_finishing, None
+        if finishing is not None:
+            await finishing
+        decoder, self.audio_decoder = self.audio_decoder, None
+        await self.finish_decoder(decoder)
+
+    async def finish_decoder(self, decoder: AudioDecoder | None):
+        if decoder is not None and not await decoder.finish():
+            logger.error(f"Could not decode all {decoder.container} audio of {self.sid}")
+
+    async def emit(self, event, data):
+        # Every event goes to this handler's own socket, which is connected to this worker, so it
+        # skips the message queue that would copy it to every other worker
+        await sio.emit(event, data, to=self.sid, ignore_queue=True)
+
+    def emit_soon(self, event, data):
+        # For callers that must not yield, e.g. while a frame is being queued
+        task = asyncio.create_task(self.emit(event, data))
+        self.background_emits.add(task)
+        task.add_done_callback(self.background_emits.discard)
+
+    async def send_audio_format(self):
+        # The format the server accepts, which falls back to pcm when the requested one is not
+        await self.emit("audioFormat", {"format": self.client_options["audio_format"]})
+
+    def buffered_bytes(self) -> int:
+        # The current answer shares its chunks with the whole recording while that is in memory;
+        # once the recording has spilled to disk, the answer is the only copy left in memory
+        buffered = (
+            self.total_audio_buffer.resident_bytes() + self.total_video_bytes.resident_bytes()
+        )
+        if getattr(self.total_audio_buffer, "spilled", False):
+            buffered += self.current_question_audio_buffer.resident_bytes()
+        if self.video_recorder is not None:
+            buffered += self.video_recorder.queued_bytes
+        if self.audio_decoder is not None:
+            buffered += self.audio_decoder.queued_bytes
+        return buffered
+
+    def admit(self, kind, frame: bytes, number, max_bytes) -> bool:
+        # A frame is never dropped without a "reject" naming it: one in the middle of a WebM or
+        # Opus stream leaves the rest undecodable unless it is sent again
+        sequence = self.frames[kind]
+        numbered = number is not None
+        number = sequence.number(number)
+
+        if not sequence.expects(number):
+            self.reject(kind, number, "outOfOrder", resendFrom=sequence.next)
+            return False
+
+        if len(frame) > max_bytes:
+            # It can never be taken, so the stream goes on without it
+            sequence.accepted(number)
+            self.reject(kind, number, "frameTooLarge", maxFrameBytes=max_bytes)
+            return False
+
+        state = ingest_quota.admit(self.sid, self.buffered_bytes(), len(frame))
+        self.signal_flow(state)
+        if state == PAUSE:
+            sequence.refused(number, numbered)
+            self.reject(kind, number, "overBudget", resendFrom=number if numbered else None)
+            return False
+
+        sequence.accepted(number)
+        return True
+
+    def reject(self, kind, number, reason, **details):
+        self.emit_soon(
+            "flowControl",
+            {"action": "reject", "reason": reason, "stream": kind, "frame": number, **details},
+        )
+
+    def update_flow(self):
+        self.signal_flow(ingest_quota.admit(self.sid, self.buffered_bytes()))
+
+    def resume_flow(self):
+        # Lets a paused client go on once what held it back was taken off its buffers
+        if self.flow_state != OK:
+            self.update_flow()
+
+    def buffers_freed(self):
+        # Memory was given back, which may let this client and others held back by the process
+        # budget go on
+        self.update_flow()
+        resume_paused_connections()
+
+    def signal_flow(self, state):
+        # Sent on changes only: "slowDown" near a budget, "pause" over it, "resume" once below
+        if self.audio_decoder is not None and self.audio_decoder.backlogged():
+            state = PAUSE
+
+        if state == self.flow_state:
+            return
+
+        self.flow_state = state
+        self.emit_soon(
+            "flowControl",
+            {
+                "action": "resume" if state == OK else state,
+                "bufferedBytes": self.buffered_bytes(),
+                "budgetBytes": ingest_quota.connection_budget,
+            },
+        )
 
     async def manage_responding_status(self, message):
         if self.getting_next_question:
-            await sio.emit(
+            await self.emit(
                 "getRespondingStatus",
                 {
                     "status": self.is_responding,
                     "message": "Please wait for the next question before answering",
                 },
-                to=self.sid,
             )
             return
 
         if message == self.is_responding:
-            await sio.emit(
+            await self.emit(
                 "getRespondingStatus",
                 {
                     "status": self.is_responding,
                     "message": f"You are {'already responding' if self.is_responding else 'not responding'}",
                 },
-                to=self.sid,
             )
+            # e.g. a late click after the server ended the turn, which must not start another
+            return
 
         self.is_responding = message
+        if self.is_responding:
+            self.answer_started_at = timezone.now()
+            self.answer_audio_start_ms = self.audio_offset_ms()
 
-        await sio.emit(
-            event="getRespondingStatus",
-            data={"status": self.is_responding, "message": "Success"},
-            to=self.sid,
-            ignore_queue=True,
+        await self.emit(
+            "getRespondingStatus",
+            {"status": self.is_responding, "message": "Success"},
         )
 
         if not self.is_responding:
@@ -208,42 +694,210 @@ class ConnectionHandler:
             return
 
         self.getting_next_question = True
+        bind_interview(self.interview_id)
+
+        with span("turn") as turn:
+            # Create a transcript from the audio
+            try:
+                with span("transcription"):
+                    transcript = await self.transcribe_answer()
+            except TranscriptionError as e:
+                turn.outcome = "transcription_failed"
+                logger.error(f"Transcription failed for {self.sid}: {e!r}")
+                self.cancel_speculation()
+                await self.emit(
+                    "getRespondingStatus",
+                    {
+                        "status": self.is_responding,
+                        "message": "Sorry, we could not process your answer. Please answer again.",
+                    },
+                )
+                self.getting_next_question = False
+                return
+
+            print("Transcript:", transcript)
+            chat = Chat(transcript, "user", False)
+            question_started_at = timezone.now()
+            self.add_chat(
+                chat,
+                started_at=self.answer_started_at,
+                audio_start_ms=self.answer_audio_start_ms,
+                audio_end_ms=self.audio_offset_ms(),
+            )
+
+            # A question drafted at the candidate's last pause is used if the answer ended there
+            response = None
+            speculation, self.speculation = self.speculation, None
+            if speculation is not None:
+                with span("speculation"):
+                    response = await speculation.resolve(transcript)
+
+            # Get the next question from the LLM
+            if response is not None:
+                interview_ended, text = self.llm_client.commit_question(
+                    transcript, speculation.prompt, response
+                )
+                chat = Chat(text, "assistant", interview_ended)
+                self.add_chat(chat, started_at=question_started_at)
+                await self.send_chat(chat)
+            elif STREAMING_LLM and self.client_options["audio_streaming"]:
+                with span("llm_stream"):
+                    chat = await self.stream_next_question(transcript)
+                self.add_chat(chat, started_at=question_started_at)
+            else:
+                with span("llm"):
+                    interview_ended, text = await self.llm_client.get_question(transcript)
+                chat = Chat(text, "assistant", interview_ended)
+                self.add_chat(chat, started_at=question_started_at)
+
+                # Send the chat to the client
+                await self.send_chat(chat)
+
+            # The answer and the question are stored together
+            self.transcript.flush()
+
+        self.interview_ended = chat.interview_ended
+        print("Question:", chat.message)
+
+        if self.interview_ended:
+            await self.on_disconnect()
+
+        self.getting_next_question = False
+
+    async def transcribe_answer(self) -> str:
+        # The last frames of a compressed answer may still be decoding
+        await self.finish_audio_decoder()
+
+        if self.transcriber is not None:
+            # Only the audio after the last pause still needs transcribing
+            try:
+                return await self.transcriber.finish(
+                    self.current_question_audio_buffer, self.vad_tracker
+                )
+            finally:
+                self.current_question_audio_buffer.clear()
+                self.vad_tracker.reset()
+                self.buffers_freed()
 
-        # Save the audio to a wav file
         wav_file = f"{self.output_dir}/latest_question.wav"
-        latest_audio = copy.deepcopy(self.current_question_audio_buffer)
-        self.current_question_audio_buffer.clear()
-        latest_audio.create_wav(wav_file, speed=1.2)
-
-        # Create a transcript from the audio
-        transcript = get_transcript(wav_file)
-        print("Transcript:", transcript)
-        chat = Chat(transcript, "user", False)
-        self.chats.append(chat)
+        latest_audio = self.current_question_audio_buffer.take()
+        if self.vad_tracker is not None:
+            self.vad_tracker.reset()
+        self.buffers_freed()
+        return await transcribe_buffer(latest_audio, wav_file, speed=1.2)
 
-        os.remove(wav_file)
 
-        # Get the next question from the LLM
-        interview_ended, text = await self.llm_client.get_question(transcript)
-        print("Question:", text)
-        chat = Chat(text, "assistant", interview_ended)
-        self.chats.append(chat)
+active_connections: dict[str, ConnectionHandler] = {}
+# Sessions of dropped connections by interview uid, waiting for the candidate to reconnect
+parked_sessions: dict[str, ConnectionHandler] = {}
 
-        # Send the chat to the client
-        await self.send_chat(chat)
 
-        if interview_ended:
-            await self.on_disconnect()
+def resume_paused_connections():
+    for handler in list(active_connections.values()):
+        handler.resume_flow()
 
-        self.getting_next_question = False
-        print()
 
+def compressed_audio_connections() -> int:
+    handlers = [*active_connections.values(), *parked_sessions.values()]
+    return sum(handler.client_options["audio_format"] != "pcm" for handler in handlers)
 
-active_connections: dict[str, ConnectionHandler] = {}
+
+def get_query_params(environ) -> dict:
+    query = environ.get("asgi.scope", {}).get("query_string")
+    if not query:
+        return {}
+
+    return parse_qs(query.decode("utf-8"))
+
+
+def verify_cached_token(token, email) -> dict | None:
+    # The claims of a token signed with the user's cached key, without a query. None when the key
+    # is not cached, or when the token fails against a key that may have been regenerated since.
+    entry = secret_key_cache.entry(email)
+    if entry is None:
+        return None
+
+    secret_key, age = entry
+    try:
+        return jwt.decode(token, secret_key, algorithms=[JWT_ALGORITHM])
+    except jwt.InvalidSignatureError:
+        if age < SECRET_KEY_RECHECK_AFTER:
+            # The key was just loaded from the database, so the token is forged or outdated
+            raise
+        return None
+
+
+async def authenticate_interview(token, email, claims=None) -> Interview:
+    # One joined query loads the interview, its user and the index of its last stored turn. The
+    # token is checked with the user's secret key loaded alongside, unless claims were already
+    # verified with the cached key.
+    last_turn = TranscriptTurn.objects.filter(interview=OuterRef("pk")).order_by("-index")
+    interviews = (
+        Interview.objects.select_related("user")
+        .only(*CONNECT_FIELDS)
+        .annotate(last_turn_index=Subquery(last_turn.values("index")[:1]))
+    )
+
+    if claims is not None:
+        return await database_sync_to_async(interviews.get)(
+            uid=claims["interviewId"], user__email=email
+        )
+
+    # Nothing is trusted until the signature is verified with the key loaded alongside
+    claims = jwt.decode(token, options={"verify_signature": False})
+    interview = await database_sync_to_async(interviews.get)(
+        uid=claims["interviewId"], user__email=email
+    )
+    # Cached either way, so the next forged token is refused without a query
+    secret_key_cache.set(email, interview.user.secret_key)
+    jwt.decode(token, interview.user.secret_key, algorithms=[JWT_ALGORITHM])
+    return interview
+
+
+def find_parked_session(claims, email) -> ConnectionHandler | None:
+    # A session parked on this worker already holds everything a reconnect needs
+    if claims is None:
+        return None
+
+    parked = parked_sessions.get(str(claims["interviewId"]))
+    if parked is None or parked.user_email != email:
+        return None
+    return parked
+
+
+def get_client_options(query_params) -> dict:
+    # Capabilities the client negotiates through the connection query string
+    return {
+        "audio_streaming": query_params.get("audioStreaming", ["0"])[0] == "1",
+        # "binary" sends audio as socket.io binary attachments instead of base64 strings
+        "binary_audio": query_params.get("audioTransport", ["base64"])[0] == "binary",
+        "audio_format": get_audio_format(query_params),
+    }
+
+
+def get_audio_format(query_params) -> str:
+    # Audio the client sends: "pcm" (int16 at SAMPLING_RATE) or Opus in a "webm" or "ogg" stream,
+    # one stream per answer, decoded here
+    audio_format = query_params.get("audioFormat", ["pcm"])[0]
+    if audio_format not in AUDIO_CONTAINERS:
+        return "pcm"
+
+    if not decoding_available():
+        print(f"ffmpeg is not available to decode {audio_format} audio, asking for pcm")
+        return "pcm"
+
+    if compressed_audio_connections() >= AUDIO_DECODER_LIMIT:
+        # Caps the ffmpeg processes of this worker, as every such connection may run one
+        print(f"{AUDIO_DECODER_LIMIT} connections already send compressed audio, asking for pcm")
+        return "pcm"
+
+    return audio_format
 
 
 @sio.event
 async def connect(sid, environ):
+    query_params = get_query_params(environ)
+    client_options = get_client_options(query_params)
 
     if True:
 
@@ -251,28 +905,27 @@ async def connect(sid, environ):
             def __init__(self):
                 self.first_name = "Rushil"
                 self.last_name = "Gupta"
+                self.email = "test@example.com"
 
         class I:
             def __init__(self):
                 self.company_name = "Mecha Tech"
                 self.job_description = "Job brief We are looking for a passionate Software Engineer to design, develop and install software solutions. Software Engineer responsibilities include gathering user requirements, defining system functionality and writing code in various languages, like Java, Ruby on Rails or .NET programming languages (e.g. C++ or JScript.NET.) Our ideal candidates are familiar with the software development life cycle (SDLC) from preliminary system analysis to tests and deployment. Ultimately, the role of the Software Engineer is to build high-quality, innovative and fully performing software that complies with coding standards and technical design. Responsibilities Execute full software development life cycle (SDLC) Develop flowcharts, layouts and documentation to identify requirements and solutions Write well-designed, testable code Produce specifications and determine operational feasibility Integrate software components into a fully functional software system Develop software verification plans and quality assurance procedures Document and maintain software functionality Troubleshoot, debug and upgrade existing systems Deploy programs and evaluate user feedback Comply with project plans and industry standards Ensure software is updated with latest features Requirements and skills Proven work experience as a Software Engineer or Software Developer Experience designing interactive applications Ability to develop software in Java, Ruby on Rails, C++ or other programming languages Excellent knowledge of relational databases, SQL and ORM technologies (JPA2, Hibernate) Experience developing web applications using at least one popular web framework (JSF, Wicket, GWT, Spring MVC) Experience with test-driven development Proficiency in software engineering tools Ability to document requirements and specifications BSc degree in Computer Science, Engineering or relevant field"
                 self.uid = "test"
+                self.pk = None
+                self.last_turn_index = None
                 self.user = U()
                 self.sid = "asmdkasndajsnd"
 
-        active_connections[sid] = ConnectionHandler(sid, I(), U())
+        active_connections[sid] = ConnectionHandler(sid, I(), U(), client_options)
         await active_connections[sid].on_connect()
         return
 
     try:
-        query = environ.get("asgi.scope").get("query_string")
-        if not query:
+        if not query_params:
             await sio.disconnect(sid)
             return
 
-        query = query.decode("utf-8")
-        query_params = parse_qs(query)
-
         token = query_params.get("interviewToken")[0]
         email = query_params.get("email")[0]
 
@@ -284,61 +937,84 @@ async def connect(sid, environ):
         await sio.disconnect(sid)
         return
 
-    user_exists = await sync_to_async(User.objects.filter(email=email).exists)()
-    if not user_exists:
-        await sio.disconnect(sid)
-        return
-
-    user: User = await sync_to_async(User.objects.get)(email=email)
-
-    # Validate the token
     try:
-        payload = jwt.decode(token, user.secret_key, algorithms=[JWT_ALGORITHM])
-        interview_id = payload["interviewId"]
-    except:
+        # A candidate reconnecting within the key cache's TTL to a session parked here, e.g. in a
+        # reconnect storm, is resumed without a query
+        claims = verify_cached_token(token, email)
+        interview = None
+        if find_parked_session(claims, email) is None:
+            interview = await authenticate_interview(token, email, claims)
+    except Exception as e:
+        # Invalid token or no such interview
+        print("Error:", str(e))
         await sio.disconnect(sid)
         return
 
+    interview_uid = claims["interviewId"] if interview is None else interview.uid
+    # Taken before any await, so the parked session cannot expire while it is resumed
+    parked = parked_sessions.pop(str(interview_uid), None)
+    if parked is not None:
+        parked.expiry.cancel()
+
     try:
-        interview_exists = await sync_to_async(
-            Interview.objects.filter(uid=interview_id, user=user).exists
-        )()
-        if not interview_exists:
-            raise ValueError("Invalid interview token.")
-
-        interview: Interview = await sync_to_async(Interview.objects.get)(
-            uid=interview_id, user=user
+        # Only one live session per interview across all workers
+        if parked is not None:
+            claimed = await session_store.transfer(interview_uid, parked.sid, sid)
+        else:
+            claimed = await session_store.claim(interview_uid, sid)
+        if not claimed:
+            owner = await session_store.owner(interview_uid)
+            raise ValueError(f"Interview already in progress on {owner and owner['worker']}")
+
+        if interview is not None:
+            interview.sid = sid
+            interview.started = True
+        await database_sync_to_async(Interview.objects.filter(uid=interview_uid).update)(
+            sid=sid, started=True, updated_at=timezone.now()
         )
-        interview.sid = sid
-        interview.started = True
-        await sync_to_async(interview.save)()
+
+        if parked is not None:
+            parked.observe_parked("resumed")
+            await parked.resume(sid, client_options)
+            return
 
         # Proceed with creating a connection handler
-        active_connections[sid] = ConnectionHandler(sid, interview)
+        active_connections[sid] = ConnectionHandler(sid, interview, interview.user, client_options)
         await active_connections[sid].on_connect()
 
     except Exception as e:
-        # Invalid token
         print("Error:", str(e))
+        await session_store.release(interview_uid, sid)
         await sio.disconnect(sid)
 
+        if parked is not None:
+            # The session could not be handed over, so it ends now
+            await parked.on_disconnect()
+
 
 @sio.event
 async def disconnect(sid):
-    if sid in active_connections:
-        await active_connections[sid].on_disconnect()
+    handler = active_connections.get(sid)
+    if handler is None:
+        return
+
+    if SESSION_RESUME_GRACE > 0 and not handler.interview_ended and not handler.disconnecting:
+        handler.park()
+    else:
+        await handler.on_disconnect()
 
 
+# Media frames may carry their number as a second argument, see FrameSequence
 @sio.on("audioData")
-async def process_audio(sid, data):
+async def process_audio(sid, data, number=None):
     if sid in active_connections:
-        await active_connections[sid].process_audio(data)
+        await active_connections[sid].process_audio(data, number)
 
 
 @sio.on("videoData")
-async def process_video(sid, data):
+async def process_video(sid, data, number=None):
     if sid in active_connections:
-        await active_connections[sid].process_video(data)
+        await active_connections[sid].process_video(data, number)
 
 
 @sio.on("respondingStatus")
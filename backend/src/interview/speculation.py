@@ -0,0 +1,108 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from difflib import SequenceMatcher
+
+from .memory import count_tokens
+from .metrics import registry, Histogram, TOKEN_BUCKETS
+
+# How close the final transcript must be to the one a question was drafted from, in words
+SPECULATION_MIN_SIMILARITY = float(os.environ.get("SPECULATION_MIN_SIMILARITY", 0.9))
+
+HIT = "hit"
+MISS = "miss"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+
+logger = logging.getLogger(__name__)
+print = logger.info
+
+# Every draft is observed once here, so the count by outcome gives the hit rate
+speculation_saved = registry.register(
+    Histogram(
+        "interview_speculation_saved_seconds",
+        "Question latency saved by drafting it while the candidate paused, 0 unless it was used",
+        ("interview", "outcome"),
+    )
+)
+speculation_wasted_tokens = registry.register(
+    Histogram(
+        "interview_speculation_wasted_tokens",
+        "Prompt and completion tokens of drafted questions that were thrown away",
+        ("interview", "outcome"),
+        buckets=TOKEN_BUCKETS,
+    )
+)
+
+
+def words(text: str) -> list[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def similarity(a: str, b: str) -> float:
+    return SequenceMatcher(None, words(a), words(b), autojunk=False).ratio()
+
+
+class Speculation:
+    # The next question, drafted from the answer transcribed up to a pause while the candidate
+    # may still go on. Speech after speech_bytes cancels it; once the answer is over it is used
+    # only if the final transcript is close enough to the partial one.
+    def __init__(self, llm_client, partial_transcript, speech_bytes, interview):
+        self.llm_client = llm_client
+        self.speech_bytes = speech_bytes
+        self.interview = interview
+
+        self.prompt = None
+        self.response: list[str] = []
+        self.draft_started = None
+        self.draft_finished = None
+
+        self.partial = asyncio.ensure_future(partial_transcript)
+        self.task = asyncio.create_task(self._draft())
+
+    async def _draft(self) -> str:
+        transcript = await self.partial
+        self.prompt = self.llm_client.format_prompt(transcript)
+
+        self.draft_started = time.perf_counter()
+        response = await self.llm_client.draft_question(self.prompt, self.response)
+        self.draft_finished = time.perf_counter()
+        return response
+
+    async def resolve(self, transcript) -> str:
+        # The drafted response if it answers transcript, otherwise None
+        waiting_since = time.perf_counter()
+        try:
+            speculated = await asyncio.shield(self.partial)
+            if similarity(speculated, transcript) < SPECULATION_MIN_SIMILARITY:
+                self.discard(MISS)
+                return None
+
+            response = await self.task
+        except Exception as e:
+            logger.error(f"Speculative question failed: {e!r}")
+            self.discard(FAILED)
+            return None
+
+        # The draft ran for as long as the question would have taken; only the wait is left
+        saved = max(
+            self.draft_finished - self.draft_started - (time.perf_counter() - waiting_since), 0
+        )
+        speculation_saved.observe(saved, interview=self.interview, outcome=HIT)
+        print(f"Speculative question used, {saved:.2f}s saved")
+        return response
+
+    def discard(self, outcome):
+        self.partial.cancel()
+        self.task.cancel()
+
+        tokens = count_tokens("".join(self.response))
+        if self.prompt is not None:
+            tokens += count_tokens(self.prompt)
+
+        speculation_saved.observe(0, interview=self.interview, outcome=outcome)
+        speculation_wasted_tokens.observe(tokens, interview=self.interview, outcome=outcome)
+        print(f"Speculative question {outcome}, {tokens} tokens wasted")
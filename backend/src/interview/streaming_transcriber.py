@@ -0,0 +1,85 @@
+import os
+import asyncio
+import logging
+
+from .transcript_helper import transcribe_buffer
+from .utils import MediaBuffer
+
+MIN_SILENCE_MS = int(os.environ.get("STREAMING_MIN_SILENCE_MS", 700))
+MIN_SEGMENT_MS = int(os.environ.get("STREAMING_MIN_SEGMENT_MS", 2000))
+
+
+logger = logging.getLogger(__name__)
+print = logger.info
+
+
+class StreamingTranscriber:
+    # Cuts the answer at pauses reported by a VoiceActivityTracker and transcribes every
+    # finished segment in the background while the candidate keeps talking.
+    def __init__(
+        self, output_dir, speed=1.2, min_silence_ms=MIN_SILENCE_MS, min_segment_ms=MIN_SEGMENT_MS
+    ):
+        self.output_dir = output_dir
+        self.speed = speed
+        self.min_silence_ms = min_silence_ms
+        self.min_segment_ms = min_segment_ms
+
+        self.turn = 0
+        self.segments: list[asyncio.Task] = []
+        self.segment_start = 0
+
+    def update(self, buffer: MediaBuffer, tracker):
+        # Called after every audio chunk; the buffer and tracker must share the same origin
+        if tracker.trailing_silence_ms < self.min_silence_ms:
+            return
+
+        if tracker.last_speech_bytes <= self.segment_start:
+            return
+
+        segment_end = tracker.processed_bytes
+        min_segment_bytes = self.min_segment_ms * buffer.SAMPLING_RATE * 2 // 1000
+        if segment_end - self.segment_start < min_segment_bytes:
+            return
+
+        self._start_segment(buffer, segment_end)
+
+    async def finish(self, buffer: MediaBuffer, tracker) -> str:
+        # Transcribe whatever is left after the last pause and assemble the answer in order
+        tail_has_speech = tracker.last_speech_bytes > self.segment_start
+        if len(buffer) > self.segment_start and (not self.segments or tail_has_speech):
+            self._start_segment(buffer, len(buffer))
+
+        try:
+            texts = await asyncio.gather(*self.segments)
+        finally:
+            self.reset()
+
+        return " ".join(text for text in texts if text)
+
+    async def partial(self) -> str:
+        # Text of the segments started so far; waiting for it leaves them running for finish()
+        texts = await asyncio.shield(asyncio.gather(*self.segments))
+        return " ".join(text for text in texts if text)
+
+    def reset(self):
+        for task in self.segments:
+            task.cancel()
+
+        self.turn += 1
+        self.segments = []
+        self.segment_start = 0
+
+    def _start_segment(self, buffer: MediaBuffer, segment_end):
+        segment = MediaBuffer(buffer.SAMPLING_RATE)
+        segment.append(buffer.read(self.segment_start, segment_end))
+
+        wav_file = f"{self.output_dir}/segment-{self.turn}-{len(self.segments)}.wav"
+        task = asyncio.create_task(self._transcribe(segment, wav_file))
+
+        self.segments.append(task)
+        self.segment_start = segment_end
+
+    async def _transcribe(self, segment: MediaBuffer, wav_file) -> str:
+        transcript = await transcribe_buffer(segment, wav_file, self.speed)
+        print(f"Segment transcript: {transcript}")
+        return transcript
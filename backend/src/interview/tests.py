@@ -1,3 +1,980 @@
-from django.test import TestCase
+import os
+import json
+import importlib
+import asyncio
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import scipy.signal
+import jwt
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.db import OperationalError, connections, transaction
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .json_parser import JSONObjectExtractor, StreamingFieldExtractor, extract_json
+from .memory import ConversationMemory, count_tokens, format_turn
+from .quotas import IngestQuota, OK, PAUSE, SLOW_DOWN
+from . import jobs, socket_server
+from .models import Interview, Job, TranscriptTurn
+from users.models import User
+from users.secret_keys import secret_key_cache
+from webapp.database import close_old_connections, database_sync_to_async
+from .transcripts import TranscriptWriter
+from .views import decode_cursor, encode_cursor
+from .utils import Chat, MediaBuffer, SpillingMediaBuffer, resample_poly_blocks, speed_ratio
+
+
+def split(text, size):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+class ResamplePolyBlocksTests(SimpleTestCase):
+    def whole(self, audio, speed):
+        up, down = speed_ratio(speed)
+        resampled = scipy.signal.resample_poly(audio.astype(np.float32), up, down)
+        return np.clip(resampled, -32768, 32767).astype(np.int16)
+
+    def test_matches_resampling_the_whole_signal(self):
+        rng = np.random.default_rng(0)
+        audio = (rng.standard_normal(50_000) * 6000).astype(np.int16)
+        # Uneven input blocks, so the internal blocks never line up with them
+        blocks = [audio[i : i + 7919] for i in range(0, len(audio), 7919)]
+
+        for speed in (0.8, 1.25, 1.5):
+            for block_samples in (4096, 10_000):
+                expected = self.whole(audio, speed)
+                resampled = np.concatenate(
+                    list(resample_poly_blocks(iter(blocks), speed, block_samples))
+                )
+                self.assertEqual(len(resampled), len(expected))
+                # Float rounding may move a sample by one step at most
+                difference = np.abs(resampled.astype(np.int32) - expected.astype(np.int32))
+                self.assertLessEqual(difference.max(), 1, (speed, block_samples))
+
+    def test_short_signal(self):
+        audio = np.arange(100, dtype=np.int16)
+        resampled = np.concatenate(list(resample_poly_blocks([audio], 1.5)))
+        self.assertEqual(len(resampled), len(self.whole(audio, 1.5)))
+
+
+class StreamingFieldExtractorTests(SimpleTestCase):
+    def extract(self, text, size, field="text"):
+        extractor = StreamingFieldExtractor(field)
+        return "".join(extractor.feed(chunk) for chunk in split(text, size))
+
+    def test_same_value_for_any_chunking(self):
+        text = (
+            'Sure, here it is:\n```json\n{"type": "Question", "meta": {"text": "nested"}, '
+            '"text": "Tell me about \\"Project {X}\\",\\nand caf\\u00e9 [plans]."}\n```'
+        )
+        expected = 'Tell me about "Project {X}",\nand café [plans].'
+        for size in range(1, len(text) + 1):
+            self.assertEqual(self.extract(text, size), expected, size)
+
+    def test_ignores_the_field_name_as_a_value(self):
+        text = '{"type": "text", "text": "value"}'
+        for size in range(1, len(text) + 1):
+            self.assertEqual(self.extract(text, size), "value", size)
+
+    def test_stops_after_the_value(self):
+        extractor = StreamingFieldExtractor("text")
+        self.assertEqual(extractor.feed('{"text": "a"} {"text": "b"}'), "a")
+        self.assertTrue(extractor.done)
+        self.assertEqual(extractor.feed('{"text": "c"}'), "")
+
+    def test_missing_field(self):
+        self.assertEqual(self.extract('{"type": "Question"}', 3), "")
+
+
+class ConversationMemoryTests(SimpleTestCase):
+    def memory(self, turns, **kwargs):
+        memory = ConversationMemory(mode="buffer", **kwargs)
+        for i in range(turns):
+            memory.save(f"Question {i}", f"Answer {i}")
+        return memory
+
+    def test_overflow_by_turns(self):
+        self.assertEqual(self.memory(3, max_turns=4).overflow(), 0)
+        self.assertEqual(self.memory(6, max_turns=4).overflow(), 2)
+
+    def test_overflow_by_tokens(self):
+        turn_tokens = count_tokens(format_turn("Question 0", "Answer 0"))
+        memory = self.memory(5, max_turns=10, token_budget=turn_tokens * 2)
+        self.assertEqual(memory.overflow(), 3)
+
+        # The summary counts against the budget too
+        memory.summary = "x" * turn_tokens * 4
+        self.assertEqual(memory.overflow(), 4)
+
+    def test_overflow_keeps_the_latest_turn(self):
+        memory = ConversationMemory(mode="buffer", token_budget=1)
+        memory.save("A long question " * 10, "A long answer " * 10)
+        self.assertEqual(memory.overflow(), 0)
+
+    async def test_fold(self):
+        calls = []
+
+        async def summarize(summary, lines):
+            calls.append((summary, lines))
+            return f" folded {len(calls)} "
+
+        memory = self.memory(5, summarize=summarize, max_turns=2)
+        await memory.fold(3)
+
+        self.assertEqual(
+            calls, [("", "\n".join(format_turn(f"Question {i}", f"Answer {i}") for i in range(3)))]
+        )
+        self.assertEqual(memory.summary, "folded 1")
+        self.assertEqual(memory.turns, [("Question 3", "Answer 3"), ("Question 4", "Answer 4")])
+        self.assertTrue(memory.load().startswith("Summary of the earlier conversation: folded 1\n"))
+
+    async def test_fold_keeps_turns_when_summarizing_fails(self):
+        async def summarize(summary, lines):
+            raise RuntimeError("model unavailable")
+
+        memory = self.memory(4, summarize=summarize, max_turns=2)
+        with self.assertLogs("interview.memory", "ERROR"):
+            await memory.fold(2)
+
+        self.assertEqual(memory.summary, "")
+        self.assertEqual(len(memory.turns), 4)
+
+    async def test_bounded_mode_folds_in_the_background(self):
+        async def summarize(summary, lines):
+            return f"{summary} +{lines.count('Human:')}".strip()
+
+        memory = ConversationMemory(summarize, mode="bounded", max_turns=2, token_budget=10_000)
+        for i in range(4):
+            memory.save(f"Question {i}", f"Answer {i}")
+        # The turns saved while the first summary ran are folded after it
+        while memory.summarizing is not None:
+            await memory.summarizing
+
+        self.assertEqual(memory.summary, "+1 +1")
+        self.assertEqual(memory.turns, [("Question 2", "Answer 2"), ("Question 3", "Answer 3")])
+
+
+class JSONObjectExtractorTests(SimpleTestCase):
+    def extract(self, text, size):
+        extractor = JSONObjectExtractor()
+        for chunk in split(text, size):
+            data = extractor.feed(chunk)
+            if data is not None:
+                return data
+        return extractor.close()
+
+    def test_same_object_for_any_chunking(self):
+        text = (
+            'Here is {name}, the feedback:\n```json\n{"score": 7, "notes": ["clear", "brief",], '
+            '"quote": "a \\"}\\" inside", "nested": {"ok": true,},}\n```\nThanks {'
+        )
+        expected = {
+            "score": 7,
+            "notes": ["clear", "brief"],
+            "quote": 'a "}" inside',
+            "nested": {"ok": True},
+        }
+        for size in range(1, len(text) + 1):
+            self.assertEqual(self.extract(text, size), expected, size)
+
+    def test_skips_invalid_objects(self):
+        text = '{"a": nope} then {"b": 2}'
+        for size in range(1, len(text) + 1):
+            self.assertEqual(self.extract(text, size), {"b": 2}, size)
+
+    def test_close_repairs_a_cut_off_object(self):
+        text = '{"summary": "Good", "points": [1, 2, {"x": "unfinished \\'
+        for size in range(1, len(text) + 1):
+            self.assertEqual(
+                self.extract(text, size),
+                {"summary": "Good", "points": [1, 2, {"x": "unfinished "}]},
+                size,
+            )
+
+    def test_no_object(self):
+        self.assertIsNone(self.extract("no json here", 4))
+        self.assertEqual(extract_json("no json here"), {})
+
+
+class IngestQuotaTests(SimpleTestCase):
+    def setUp(self):
+        self.quota = IngestQuota(connection_budget=1000, process_budget=1500, slow_down_ratio=0.8)
+
+    def test_connection_budget(self):
+        self.assertEqual(self.quota.admit("a", 0, 800), OK)
+        self.assertEqual(self.quota.admit("a", 800, 100), SLOW_DOWN)
+        self.assertEqual(self.quota.usage["a"], 900)
+
+        self.assertEqual(self.quota.admit("a", 900, 200), PAUSE)
+        # A refused frame is not recorded
+        self.assertEqual(self.quota.usage["a"], 900)
+
+        self.assertEqual(self.quota.admit("a", 100), OK)
+        self.assertEqual(self.quota.total, 100)
+
+    def test_process_budget(self):
+        self.assertEqual(self.quota.admit("a", 700), OK)
+        self.assertEqual(self.quota.admit("b", 600), SLOW_DOWN)
+        self.assertEqual(self.quota.admit("b", 600, 300), PAUSE)
+        self.assertEqual(self.quota.total, 1300)
+
+        # Other connections are paused too until the process is back under its budget
+        self.assertEqual(self.quota.admit("c", 0, 300), PAUSE)
+        self.quota.release("a")
+        self.assertEqual(self.quota.total, 600)
+        self.assertEqual(self.quota.admit("c", 0, 300), OK)
+
+    def test_move_and_release(self):
+        self.quota.admit("old", 500)
+        self.quota.move("old", "new")
+        self.assertEqual(self.quota.snapshot(), {"new": 500})
+
+        self.quota.release("new")
+        self.quota.release("unknown")
+        self.assertEqual(self.quota.snapshot(), {})
+        self.assertEqual(self.quota.total, 0)
+
+
+class SpillingMediaBufferTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.spill_path = os.path.join(self.dir.name, "audio.raw")
+
+        self.data = os.urandom(10_000)
+        self.buffer = SpillingMediaBuffer(16000, self.spill_path, threshold=4096)
+        self.addCleanup(self.buffer.close)
+
+    def fill(self, buffer, size=1000):
+        for chunk in split(self.data, size):
+            buffer.append(chunk)
+
+    def test_spills_past_the_threshold(self):
+        self.buffer.append(self.data[:4096])
+        self.assertFalse(self.buffer.spilled)
+        self.assertEqual(self.buffer.resident_bytes(), 4096)
+
+        self.buffer.append(self.data[4096:])
+        self.assertTrue(self.buffer.spilled)
+        self.assertEqual(self.buffer.resident_bytes(), 0)
+        self.assertEqual(len(self.buffer), len(self.data))
+        self.assertEqual(self.buffer.get(), self.data)
+
+    def test_read_matches_memory_buffer(self):
+        memory = MediaBuffer(16000)
+        self.fill(memory)
+        self.fill(self.buffer)
+        self.assertTrue(self.buffer.spilled)
+
+        for start, end in ((0, None), (0, 10), (999, 1001), (4000, 9000), (9990, 20_000), (50, 50)):
+            expected = self.data[start:end]
+            self.assertEqual(memory.read(start, end), expected, (start, end))
+            self.assertEqual(self.buffer.read(start, end), expected, (start, end))
+
+    def test_read_after_further_appends(self):
+        self.fill(self.buffer)
+        self.assertEqual(self.buffer.read(0), self.data)
+
+        self.buffer.append(b"tail")
+        self.assertEqual(self.buffer.read(len(self.data)), b"tail")
+
+    def test_iter_blocks(self):
+        memory = MediaBuffer(16000)
+        self.fill(memory, 333)
+        self.fill(self.buffer, 333)
+
+        for buffer in (memory, self.buffer):
+            blocks = list(buffer.iter_blocks(4096))
+            self.assertEqual([len(block) for block in blocks], [4096, 4096, 1808])
+            self.assertEqual(b"".join(blocks), self.data)
+
+    def test_write_bytes_in_memory(self):
+        self.buffer.append(self.data[:1000])
+        output = os.path.join(self.dir.name, "out.raw")
+        self.buffer.write_bytes(output)
+
+        with open(output, "rb") as f:
+            self.assertEqual(f.read(), self.data[:1000])
+
+    def test_write_bytes_moves_the_spill_file(self):
+        self.fill(self.buffer)
+        output = os.path.join(self.dir.name, "out.raw")
+        self.buffer.write_bytes(output)
+
+        self.assertFalse(os.path.exists(self.spill_path))
+        with open(output, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(SpillingMediaBuffer.open(output, 16000).get(), self.data)
+
+    def test_clear_removes_the_spill_file(self):
+        self.fill(self.buffer)
+        self.buffer.clear()
+
+        self.assertFalse(self.buffer.spilled)
+        self.assertFalse(os.path.exists(self.spill_path))
+        self.assertEqual(len(self.buffer), 0)
+
+
+class FakeUser:
+    first_name = "Test"
+    last_name = "Candidate"
+    email = "candidate@example.com"
+
+
+class FakeInterview:
+    def __init__(self, uid="interview"):
+        self.uid = uid
+        self.pk = None
+        self.last_turn_index = None
+        self.company_name = "Company"
+        self.job_description = "Job description"
+
+
+class HandlerTestCase(SimpleTestCase):
+    # ConnectionHandlers without a socket, LLM or transcription service, writing their output
+    # under a temporary directory
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        cwd = os.getcwd()
+        os.chdir(self.dir.name)
+        self.addCleanup(os.chdir, cwd)
+
+        self.emit = self.patch("sio.emit", mock.AsyncMock())
+        self.patch("NO_RESPONSES", True)
+        self.patch("transcribe_buffer", mock.AsyncMock(return_value="Answer"))
+        self.quota = self.patch(
+            "ingest_quota", IngestQuota(connection_budget=1000, process_budget=10_000)
+        )
+        self.patch("active_connections", {})
+        self.patch("parked_sessions", {})
+
+    def patch(self, name, value):
+        target, _, attribute = name.rpartition(".")
+        owner = socket_server
+        if target:
+            owner = getattr(socket_server, target)
+
+        patcher = mock.patch.object(owner, attribute, value)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def handler(self, sid="sid", interview=None):
+        handler = socket_server.ConnectionHandler(sid, interview or FakeInterview(), FakeUser())
+        socket_server.active_connections[sid] = handler
+        return handler
+
+    def events(self, name):
+        return [call.args[1] for call in self.emit.call_args_list if call.args[0] == name]
+
+
+class FlowControlTests(HandlerTestCase):
+    async def test_resumes_once_the_answer_is_taken(self):
+        handler = self.handler()
+        # The recording is on disk, so the answer is all the connection holds in memory
+        handler.total_audio_buffer = SpillingMediaBuffer(
+            16000, "recording.spill", threshold=0, on_spill=handler.buffers_freed
+        )
+        self.addCleanup(handler.total_audio_buffer.close)
+
+        handler.is_responding = True
+        for _ in range(3):
+            await handler.process_audio(bytes(400))
+        self.assertEqual(handler.flow_state, PAUSE)
+
+        handler.is_responding = False
+        await handler.transcribe_answer()
+        self.assertEqual(handler.flow_state, OK)
+        self.assertEqual(self.quota.usage["sid"], 0)
+        await asyncio.gather(*handler.background_emits)
+        self.assertEqual(
+            [event["action"] for event in self.events("flowControl")], [PAUSE, "reject", "resume"]
+        )
+
+    async def test_spilling_resumes_the_client(self):
+        handler = self.handler()
+        handler.total_audio_buffer.threshold = 600
+
+        handler.is_responding = True
+        await handler.process_audio(bytes(500))
+        handler.is_responding = False
+        await handler.transcribe_answer()
+
+        # The next answer takes the recording past its threshold, and once it is on disk only
+        # the answer is left in memory
+        handler.is_responding = True
+        await handler.process_audio(bytes(300))
+        self.assertTrue(handler.total_audio_buffer.spilled)
+        self.assertEqual(self.quota.usage["sid"], 300)
+        self.assertEqual(handler.flow_state, OK)
+
+    def free(self, handler):
+        handler.total_audio_buffer.clear()
+        handler.current_question_audio_buffer.clear()
+        handler.buffers_freed()
+
+    async def rejects(self, handler):
+        await asyncio.gather(*handler.background_emits)
+        return [event for event in self.events("flowControl") if event["action"] == "reject"]
+
+    async def test_refused_numbered_frame_is_expected_again(self):
+        handler = self.handler()
+        handler.is_responding = True
+        for number in range(4):
+            await handler.process_audio(bytes([number]) * 400, number)
+
+        self.assertEqual(
+            [
+                (event["reason"], event["frame"], event["resendFrom"])
+                for event in await self.rejects(handler)
+            ],
+            [("overBudget", 2, 2), ("outOfOrder", 3, 2)],
+        )
+
+        self.free(handler)
+        self.assertEqual(handler.flow_state, OK)
+        for number in (2, 3):
+            await handler.process_audio(bytes([number]) * 400, number)
+        self.assertEqual(handler.total_audio_buffer.get(), bytes([2]) * 400 + bytes([3]) * 400)
+
+    async def test_refused_unnumbered_frame_is_named(self):
+        handler = self.handler()
+        handler.stream_video = False
+        handler.is_responding = True
+        for _ in range(3):
+            await handler.process_video(bytes(400))
+        self.free(handler)
+        handler.total_video_bytes.clear()
+        await handler.process_video(bytes(2000))
+
+        self.assertEqual(
+            [
+                (event["stream"], event["reason"], event["frame"])
+                for event in await self.rejects(handler)
+            ],
+            [("video", "overBudget", 2), ("video", "overBudget", 3)],
+        )
+
+    async def test_resume_starts_afresh_on_the_new_socket(self):
+        handler = self.handler()
+        handler.flow_state = PAUSE
+        await handler.resume("new-sid", socket_server.get_client_options({}))
+
+        self.assertEqual(handler.flow_state, OK)
+        await asyncio.gather(*handler.background_emits)
+        self.assertEqual(self.events("flowControl"), [])
+
+
+class StalledDecoder:
+    container = "webm"
+
+    def __init__(self):
+        self.frames = []
+        self.queued_bytes = 0
+
+    def write(self, frame):
+        self.frames.append(frame)
+        self.queued_bytes += len(frame)
+
+    def backlogged(self):
+        return self.queued_bytes > 1000
+
+    async def finish(self):
+        return True
+
+
+class CompressedAudioTests(HandlerTestCase):
+    async def test_backlogged_decoder_queues_and_pauses(self):
+        self.quota.connection_budget = 10_000
+        handler = self.handler()
+        handler.client_options["audio_format"] = "webm"
+        handler.audio_decoder = decoder = StalledDecoder()
+
+        handler.is_responding = True
+        for number in range(3):
+            await handler.process_audio(bytes(600), number)
+        self.assertEqual(len(decoder.frames), 3)
+        self.assertEqual(handler.flow_state, PAUSE)
+
+        decoder.queued_bytes = 0
+        handler.resume_flow()
+        await asyncio.gather(*handler.background_emits)
+        self.assertEqual(
+            [event["action"] for event in self.events("flowControl")], [PAUSE, "resume"]
+        )
+
+    async def test_pcm_once_the_decoder_limit_is_reached(self):
+        self.patch("AUDIO_DECODER_LIMIT", 1)
+        self.patch("decoding_available", lambda: True)
+        query = {"audioFormat": ["webm"]}
+
+        self.assertEqual(socket_server.get_audio_format(query), "webm")
+        handler = self.handler()
+        handler.client_options = socket_server.get_client_options(query)
+        self.assertEqual(socket_server.get_audio_format(query), "pcm")
+
+        # A parked session keeps its place until it ends
+        handler.park(grace=60)
+        handler.expiry.cancel()
+        self.assertEqual(socket_server.get_audio_format(query), "pcm")
+
+
+class ParkedSessionTests(HandlerTestCase):
+    def handler(self, sid="sid", interview=None):
+        handler = super().handler(sid, interview)
+        # Finalizing is left out, only whether and when it happens is checked
+        handler.on_disconnect = mock.AsyncMock()
+        return handler
+
+    async def test_expires_after_the_grace_period(self):
+        handler = self.handler()
+        handler.park(grace=0)
+        self.assertIs(socket_server.parked_sessions["interview"], handler)
+        self.assertNotIn("sid", socket_server.active_connections)
+
+        await handler.expiry
+        self.assertEqual(socket_server.parked_sessions, {})
+        handler.on_disconnect.assert_awaited_once()
+
+    async def test_resume_moves_the_session_to_the_new_socket(self):
+        handler = self.handler()
+        self.quota.admit("sid", 100)
+        handler.park(grace=60)
+        handler.expiry.cancel()
+
+        await handler.resume("new-sid", socket_server.get_client_options({}))
+
+        self.assertEqual(handler.sid, "new-sid")
+        self.assertIs(socket_server.active_connections["new-sid"], handler)
+        self.assertEqual(list(self.quota.snapshot()), ["new-sid"])
+        self.assertEqual(self.events("sessionResumed")[0]["chats"], [])
+        handler.on_disconnect.assert_not_awaited()
+
+    async def test_parking_another_session_ends_the_first(self):
+        first = self.handler("first")
+        first.park(grace=60)
+        second = self.handler("second")
+        second.park(grace=60)
+        self.addCleanup(second.expiry.cancel)
+
+        await first.expiry
+        first.on_disconnect.assert_awaited_once()
+        self.assertIs(socket_server.parked_sessions["interview"], second)
+        second.on_disconnect.assert_not_awaited()
+
+    async def test_decodes_the_rest_of_the_dropped_stream(self):
+        handler = self.handler()
+        handler.audio_decoder = decoder = mock.Mock(finish=mock.AsyncMock(return_value=True))
+        handler.park(grace=60)
+        handler.expiry.cancel()
+        self.assertIsNone(handler.audio_decoder)
+
+        await handler.finish_audio_decoder()
+        decoder.finish.assert_awaited_once()
+        self.assertIsNone(handler.decoder_finishing)
+
+
+class AuthenticateInterviewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("candidate@example.com", first_name="Test")
+        self.interview = Interview.objects.create(
+            user=self.user, company_name="Company", job_description="Job description"
+        )
+        self.token = self.sign(self.user.secret_key)
+        secret_key_cache.keys.clear()
+        self.addCleanup(secret_key_cache.keys.clear)
+
+    def sign(self, secret_key):
+        return jwt.encode({"interviewId": str(self.interview.uid)}, secret_key, algorithm="HS256")
+
+    def authenticate(self, token, email="candidate@example.com"):
+        claims = socket_server.verify_cached_token(token, email)
+        return async_to_sync(socket_server.authenticate_interview)(token, email, claims)
+
+    def test_cold_and_warm_connects(self):
+        with self.assertNumQueries(1):
+            interview = self.authenticate(self.token)
+        self.assertEqual(interview.pk, self.interview.pk)
+        self.assertEqual(interview.user.first_name, "Test")
+        self.assertIsNone(interview.last_turn_index)
+        self.assertEqual(secret_key_cache.get("candidate@example.com"), self.user.secret_key)
+
+        TranscriptTurn.objects.create(
+            interview=self.interview, index=4, chat_id="a", role="user", text="Hi"
+        )
+        with self.assertNumQueries(1):
+            interview = self.authenticate(self.token)
+        self.assertEqual(interview.last_turn_index, 4)
+
+    def test_forged_token_against_a_fresh_key(self):
+        self.authenticate(self.token)
+
+        with self.assertNumQueries(0), self.assertRaises(jwt.InvalidSignatureError):
+            self.authenticate(self.sign("forged"))
+        # The good key stays cached
+        self.assertEqual(secret_key_cache.get("candidate@example.com"), self.user.secret_key)
+
+    def test_regenerated_key_is_reloaded(self):
+        self.authenticate(self.token)
+        # Regenerated on another worker, whose cache drop this one does not see
+        self.user.secret_key = "regenerated"
+        self.user.save(update_fields=["secret_key"])
+        new_token = self.sign("regenerated")
+
+        with self.assertRaises(jwt.InvalidSignatureError):
+            self.authenticate(new_token)
+
+        with mock.patch.object(socket_server, "SECRET_KEY_RECHECK_AFTER", 0):
+            with self.assertNumQueries(1):
+                interview = self.authenticate(new_token)
+            self.assertEqual(interview.pk, self.interview.pk)
+            with self.assertRaises(jwt.InvalidSignatureError):
+                self.authenticate(self.token)
+
+    def test_other_users_email(self):
+        other = User.objects.create(email="other@example.com")
+        with self.assertRaises(Interview.DoesNotExist):
+            self.authenticate(self.sign(other.secret_key), "other@example.com")
+        with self.assertRaises(Interview.DoesNotExist):
+            self.authenticate(self.token, "other@example.com")
+
+    def test_parked_session_is_found_without_a_query(self):
+        with mock.patch.object(socket_server, "parked_sessions", {}):
+            self.authenticate(self.token)
+            parked = mock.Mock(user_email="candidate@example.com")
+            socket_server.parked_sessions[str(self.interview.uid)] = parked
+
+            with self.assertNumQueries(0):
+                claims = socket_server.verify_cached_token(self.token, "candidate@example.com")
+                found = socket_server.find_parked_session(claims, "candidate@example.com")
+            self.assertIs(found, parked)
+            self.assertIsNone(socket_server.find_parked_session(claims, "other@example.com"))
+            self.assertIsNone(socket_server.find_parked_session(None, "candidate@example.com"))
+
+
+class DatabaseSyncToAsyncTests(TestCase):
+    def test_closes_old_connections_around_the_call(self):
+        calls = []
+        with mock.patch("webapp.database.close_old_connections", lambda: calls.append("close")):
+            async_to_sync(database_sync_to_async(lambda: calls.append("query")))()
+
+        self.assertEqual(calls, ["close", "query", "close"])
+
+    def test_keeps_connections_inside_a_transaction(self):
+        user = User.objects.create_user("a@example.com")
+        with mock.patch.object(
+            connections["default"], "close_if_unusable_or_obsolete"
+        ) as close_if_unusable_or_obsolete:
+            close_old_connections()
+
+        close_if_unusable_or_obsolete.assert_not_called()
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
+
+
+class JobTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("candidate@example.com")
+        self.interview = Interview.objects.create(
+            user=user, company_name="Company", job_description="Job description"
+        )
+
+    def job(self, kind="generate_feedback", seconds_ago=0, **fields):
+        return Job.objects.create(
+            kind=kind,
+            key=f"{kind}:{Job.objects.count()}",
+            interview_uid=str(self.interview.uid),
+            run_after=timezone.now() - timedelta(seconds=seconds_ago),
+            **fields,
+        )
+
+    def test_enqueue_is_idempotent(self):
+        first = async_to_sync(jobs.enqueue)("export_audio", self.interview.uid, "output/a")
+        second = async_to_sync(jobs.enqueue)("export_audio", self.interview.uid, "output/a")
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(first.payload, {"output_dir": "output/a"})
+
+    def test_claims_the_job_that_is_due_first(self):
+        later = self.job(seconds_ago=1)
+        first = self.job(seconds_ago=2)
+        self.job(seconds_ago=-60)
+
+        claimed = jobs.claim_job()
+        self.assertEqual(claimed.pk, first.pk)
+        self.assertEqual(claimed.status, Job.Status.RUNNING)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertGreater(claimed.locked_until, timezone.now())
+
+        self.assertEqual(jobs.claim_job().pk, later.pk)
+        # Neither a leased job nor one that is not due yet is claimed
+        self.assertIsNone(jobs.claim_job())
+
+    def test_reclaims_a_job_whose_lease_expired(self):
+        expired = timezone.now() - timedelta(seconds=1)
+        job = self.job(status=Job.Status.RUNNING, attempts=1, locked_until=expired)
+
+        claimed = jobs.claim_job()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.attempts, 2)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        self.job()
+        job = jobs.claim_job()
+        with mock.patch.object(jobs, "JOB_RETRY_BACKOFF", 10):
+            jobs.fail_job(job, ValueError("boom"))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.PENDING)
+        self.assertEqual(job.last_error, "ValueError('boom')")
+        self.assertIsNone(job.locked_until)
+        delay = (job.run_after - job.updated_at).total_seconds()
+        self.assertAlmostEqual(delay, 10, delta=1)
+        self.assertIsNone(jobs.claim_job())
+
+    def test_last_failure_marks_the_results_failed(self):
+        self.job(attempts=2, max_attempts=3)
+        job = jobs.claim_job()
+        jobs.fail_job(job, ValueError("boom"))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.interview.refresh_from_db()
+        self.assertEqual(self.interview.processing_status, Interview.ProcessingStatus.FAILED)
+
+    def test_optional_job_failure_leaves_the_results_alone(self):
+        self.job("encode_video", max_attempts=1)
+        jobs.fail_job(jobs.claim_job(), ValueError("boom"))
+
+        self.interview.refresh_from_db()
+        self.assertEqual(self.interview.processing_status, Interview.ProcessingStatus.NOT_STARTED)
+
+    def test_run_job_fails_a_job_past_its_attempts(self):
+        job = self.job(status=Job.Status.RUNNING, attempts=3, max_attempts=2)
+        async_to_sync(jobs.run_job)(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertIn("lease expired", job.last_error)
+
+    def test_complete_job(self):
+        self.job()
+        job = jobs.claim_job()
+        jobs.complete_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.DONE)
+        self.assertIsNone(job.locked_until)
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        created_at = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 42)), (created_at, 42))
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("candidate@example.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_interviews(self, count, created_at=None):
+        interviews = [
+            Interview.objects.create(
+                user=self.user, company_name=f"Company {i}", job_description="x" * 500
+            )
+            for i in range(count)
+        ]
+        if created_at is not None:
+            Interview.objects.filter(user=self.user).update(created_at=created_at)
+        return interviews
+
+    def pages(self, url, limit):
+        cursor, pages = None, []
+        while True:
+            params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json()["results"])
+            cursor = response.json()["nextCursor"]
+            if cursor is None:
+                return pages
+
+    def test_interviews_newest_first(self):
+        interviews = self.create_interviews(5)
+        other = User.objects.create_user("other@example.com")
+        Interview.objects.create(user=other, company_name="Other", job_description="")
+
+        pages = self.pages(reverse("interview:get_interview"), limit=2)
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        ids = [interview["interviewId"] for page in pages for interview in page]
+        self.assertEqual(ids, [str(interview.uid) for interview in reversed(interviews)])
+        self.assertEqual(len(pages[0][0]["job_description"]), 200)
+
+    def test_interviews_created_at_the_same_time(self):
+        # The primary key orders interviews with the same created_at
+        interviews = self.create_interviews(5, created_at=timezone.now())
+
+        pages = self.pages(reverse("interview:get_interview"), limit=2)
+
+        ids = [interview["interviewId"] for page in pages for interview in page]
+        self.assertEqual(ids, [str(interview.uid) for interview in reversed(interviews)])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("interview:get_interview"), {"cursor": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_turns_in_order(self):
+        (interview,) = self.create_interviews(1)
+        TranscriptTurn.objects.bulk_create(
+            TranscriptTurn(interview=interview, index=index, role="user", text=str(index))
+            for index in range(5)
+        )
+        url = reverse("interview:get_interview_turns", args=[interview.uid])
+
+        pages = self.pages(url, limit=2)
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual([turn["index"] for page in pages for turn in page], list(range(5)))
+
+    def test_turns_of_another_users_interview(self):
+        other = User.objects.create_user("other@example.com")
+        interview = Interview.objects.create(user=other, company_name="", job_description="")
+
+        response = self.client.get(reverse("interview:get_interview_turns", args=[interview.uid]))
+        self.assertEqual(response.status_code, 404)
+
+
+class TranscriptTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("candidate@example.com")
+        self.interview = Interview.objects.create(
+            user=user, company_name="Company", job_description="Job description"
+        )
+
+    def indices(self):
+        return list(self.interview.turns.values_list("index", flat=True))
+
+    def test_continues_after_the_stored_turns(self):
+        writer = TranscriptWriter(self.interview.pk, start_index=3)
+        writer.add(Chat("Question", "assistant", False))
+        writer.add(Chat("Answer", "user", False))
+        async_to_sync(writer.close)()
+
+        self.assertEqual(self.indices(), [3, 4])
+        self.assertEqual(writer.pending, [])
+
+    def test_retries_a_batch_that_only_looked_failed(self):
+        bulk_create = TranscriptTurn.objects.bulk_create
+
+        def stored_then_failed(batch, **kwargs):
+            bulk_create(batch, **kwargs)
+            raise OperationalError("connection lost")
+
+        writer = TranscriptWriter(self.interview.pk)
+        writer.add(Chat("Question", "assistant", False))
+        with mock.patch.object(TranscriptTurn.objects, "bulk_create", stored_then_failed):
+            async_to_sync(writer.write)()
+        self.assertTrue(writer.retrying)
+        self.assertEqual(len(writer.pending), 1)
+
+        writer.add(Chat("Answer", "user", False))
+        async_to_sync(writer.close)()
+
+        self.assertEqual(self.indices(), [0, 1])
+        self.assertEqual(writer.pending, [])
+        self.assertFalse(writer.retrying)
+
+    def test_drops_turns_another_session_stored(self):
+        TranscriptTurn.objects.create(interview=self.interview, index=0, role="user", text="")
+
+        writer = TranscriptWriter(self.interview.pk)
+        writer.add(Chat("Question", "assistant", False))
+        with transaction.atomic():
+            async_to_sync(writer.close)()
+
+        self.assertEqual(writer.pending, [])
+        self.assertFalse(writer.retrying)
+        self.assertEqual(self.interview.turns.get().text, "")
+
+    def test_backfill(self):
+        backfill = importlib.import_module("interview.migrations.0005_backfill_transcript_turns")
+        chats = [
+            {"message": "Question", "role": "assistant", "timestamp": "2024-01-01T10:00:00"},
+            "not a chat",
+            None,
+            {"message": "Answer", "role": "user", "interview_ended": True},
+        ]
+        self.interview.transcript = json.dumps(chats)
+        self.interview.save()
+        invalid = Interview.objects.create(
+            user=self.interview.user, company_name="", job_description="", transcript="{"
+        )
+
+        backfill.backfill_turns(apps, None)
+
+        turns = list(self.interview.turns.all())
+        self.assertEqual(
+            [(turn.index, turn.text) for turn in turns], [(0, "Question"), (1, "Answer")]
+        )
+        self.assertEqual(turns[0].ended_at.year, 2024)
+        self.assertTrue(turns[1].interview_ended)
+        self.assertFalse(invalid.turns.exists())
+
+        # Interviews whose turns are stored are left alone
+        backfill.backfill_turns(apps, None)
+        self.assertEqual(self.indices(), [0, 1])
+
+
+class EncodeVideoTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        with open(self.path("video.raw"), "wb") as f:
+            f.write(b"raw video")
+
+        async def encode_file(raw_file, video_file):
+            with open(video_file, "wb") as f:
+                f.write(b"encoded")
+            return True
+
+        patcher = mock.patch.object(jobs, "encode_file", encode_file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def path(self, name):
+        return os.path.join(self.dir.name, name)
+
+    def read(self, name):
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+    def encode(self):
+        async_to_sync(jobs.encode_video)(Job(payload={"output_dir": self.dir.name}))
+
+    def test_buffered_video(self):
+        self.encode()
+
+        self.assertEqual(self.read("video.mp4"), b"encoded")
+        self.assertFalse(os.path.exists(self.path("video.raw")))
+        self.assertFalse(os.path.exists(self.path("video-parts.json")))
+
+    def test_keeps_the_part_streamed_before_ffmpeg_failed(self):
+        with open(self.path("video.mp4"), "wb") as f:
+            f.write(b"streamed")
+
+        self.encode()
+
+        self.assertEqual(self.read("video.mp4"), b"streamed")
+        self.assertEqual(self.read("video-rest.mp4"), b"encoded")
+        self.assertEqual(
+            json.loads(self.read("video-parts.json")),
+            {"complete": False, "parts": ["video.mp4", "video-rest.mp4"]},
+        )
@@ -1,39 +1,185 @@
 import os
-import requests
+import json
+import base64
+import asyncio
+import logging
+
+import httpx
+
+from .metrics import span
 
 url = f'{os.environ.get("WHISPER_SERVICE_URL", "http://localhost:5000")}/predictions'
 base_output_url = os.environ.get("WEB_SERVICE_URL", "http://host.docker.internal:6000/")
 
+WHISPER_TIMEOUT = float(os.environ.get("WHISPER_TIMEOUT", 60))
+WHISPER_CONNECT_TIMEOUT = float(os.environ.get("WHISPER_CONNECT_TIMEOUT", 5))
+WHISPER_MAX_RETRIES = int(os.environ.get("WHISPER_MAX_RETRIES", 2))
+WHISPER_RETRY_BACKOFF = float(os.environ.get("WHISPER_RETRY_BACKOFF", 0.5))
+WHISPER_MAX_IN_FLIGHT = int(os.environ.get("WHISPER_MAX_IN_FLIGHT", 8))
+
+# "url": write a wav file that Whisper downloads through WEB_SERVICE_URL
+# "bytes": send the encoded wav inline in the request body as a data URI
+TRANSCRIPTION_TRANSPORT = os.environ.get("TRANSCRIPTION_TRANSPORT", "url")
+# Reach the transcription service over a unix domain socket instead of TCP
+WHISPER_SERVICE_UDS = os.environ.get("WHISPER_SERVICE_UDS")
+
+WHISPER_OPTIONS = {
+    "batch_size": 16,
+    "language": "en",
+    "initial_prompt": "Include Disfluencies like stutters, uhh, umm, uh, ah, ahh, etc.",
+}
+
+
+logger = logging.getLogger(__name__)
+print = logger.info
+
+
+class TranscriptionError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TranscriptionClient:
+    # One pooled HTTP client per process, shared by every connected interview
+    def __init__(
+        self,
+        service_url=url,
+        timeout=WHISPER_TIMEOUT,
+        connect_timeout=WHISPER_CONNECT_TIMEOUT,
+        max_retries=WHISPER_MAX_RETRIES,
+        retry_backoff=WHISPER_RETRY_BACKOFF,
+        max_in_flight=WHISPER_MAX_IN_FLIGHT,
+        uds=WHISPER_SERVICE_UDS,
+    ):
+        self.service_url = service_url
+        self.uds = uds
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_in_flight = max_in_flight
+
+        self._client = None
+        self._semaphore = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            limits = httpx.Limits(
+                max_connections=self.max_in_flight,
+                max_keepalive_connections=self.max_in_flight,
+            )
+            transport = None
+            if self.uds:
+                transport = httpx.AsyncHTTPTransport(uds=self.uds, limits=limits)
+
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout, limits=limits, transport=transport
+            )
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def encode_request(self, audio_file) -> bytes:
+        if isinstance(audio_file, bytes):
+            # Inline audio is megabytes of base64, which never needs JSON escaping. Splice it
+            # in rather than having json.dumps scan and copy it again.
+            options = json.dumps(WHISPER_OPTIONS).encode()
+            return b'{"input": {"audio_file": "' + audio_file + b'", ' + options[1:] + b"}"
+
+        return json.dumps({"input": {"audio_file": audio_file, **WHISPER_OPTIONS}}).encode()
+
+    async def transcribe(self, audio_file) -> str:
+        # audio_file is either a URL or an ascii-encoded data URI
+        content = self.encode_request(audio_file)
+        headers = {"Content-Type": "application/json"}
 
-def get_transcript(audio_path):
+        client = self.client
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+            try:
+                async with self._semaphore:
+                    response = await client.post(self.service_url, content=content, headers=headers)
+            except httpx.HTTPError as e:
+                last_error = e
+                print(f"Transcription request failed (attempt {attempt + 1}): {e!r}")
+                continue
+
+            if response.status_code >= 500 or response.status_code == 429:
+                last_error = TranscriptionError(
+                    f"Whisper returned {response.status_code}", response.status_code
+                )
+                print(f"Transcription request failed (attempt {attempt + 1}): {last_error}")
+                continue
+
+            if response.status_code != 200:
+                raise TranscriptionError(
+                    f"Whisper returned {response.status_code}: {response.text[:200]}",
+                    response.status_code,
+                )
+
+            try:
+                transcript = response.json()
+                return "".join([i["text"] for i in transcript["output"]["segments"]]).strip()
+            except (ValueError, KeyError, TypeError) as e:
+                raise TranscriptionError(f"Unexpected Whisper response: {e!r}") from e
+
+        raise TranscriptionError(
+            f"Transcription failed after {self.max_retries + 1} attempts"
+        ) from last_error
+
+
+transcription_client = TranscriptionClient()
+
+
+async def get_transcript(audio_path) -> str:
     audio_file = f"{base_output_url}/{audio_path}"
+    return await transcription_client.transcribe(audio_file)
 
-    response = requests.post(
-        url,
-        json={
-            "input": {
-                "audio_file": audio_file,
-                "batch_size": 16,
-                "language": "en",
-                "initial_prompt": "Include Disfluencies like stutters, uhh, umm, uh, ah, ahh, etc.",
-            }
-        },
-    )
-    if response.status_code == 200:
-        try:
 
-            transcript = response.json()
-            transcript = "".join([i["text"] for i in transcript["output"]["segments"]]).strip()
-            return transcript
-        except:
-            pass
+async def get_transcript_from_bytes(wav_bytes: bytes) -> str:
+    audio_file = b"data:audio/wav;base64," + base64.b64encode(wav_bytes)
+    return await transcription_client.transcribe(audio_file)
+
+
+async def transcribe_buffer(buffer, wav_file, speed=1.2, transport=None) -> str:
+    transport = transport or TRANSCRIPTION_TRANSPORT
+
+    if transport == "bytes":
+        # Encode in memory and send the audio with the request, no disk or nginx hop
+        with span("wav_encode"):
+            wav_bytes = await asyncio.to_thread(buffer.to_wav_bytes, speed)
+        try:
+            with span("whisper"):
+                return await get_transcript_from_bytes(wav_bytes)
+        except TranscriptionError as e:
+            # The service rejected the inline audio, fall back to the URL transport
+            if e.status_code is None or not 400 <= e.status_code < 500:
+                raise
+            print(f"Inline transcription rejected ({e}), falling back to url transport")
 
-    # TODO: What to do when transcript fails
-    return ""
+    # Write the buffered audio to a wav file, transcribe it and clean up
+    with span("wav_encode"):
+        await asyncio.to_thread(buffer.create_wav, wav_file, speed)
+    try:
+        with span("whisper"):
+            return await get_transcript(wav_file)
+    finally:
+        os.remove(wav_file)
 
 
 if __name__ == "__main__":
-    t = get_transcript(
-        "https://verbose-tribble-p67wq9p45prc6vq4-8000.preview.app.github.dev/audio.wav"
+    t = asyncio.run(
+        transcription_client.transcribe(
+            "https://verbose-tribble-p67wq9p45prc6vq4-8000.preview.app.github.dev/audio.wav"
+        )
     )
     print(t)
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+
+from django.db import IntegrityError
+
+from django.utils import timezone
+from webapp.database import database_sync_to_async
+
+from .models import TranscriptTurn
+from .utils import Chat
+
+logger = logging.getLogger(__name__)
+print = logger.info
+
+
+class TranscriptWriter:
+    # Turns of one interview. Each completed turn is inserted in a single batch by a background
+    # task, so the conversation never waits on the database; failed batches are retried with
+    # the next one and when the interview ends. Indices continue from start_index, the turn
+    # after the last one stored for the interview.
+    def __init__(self, interview_pk, start_index=0):
+        self.interview_pk = interview_pk
+        self.index = start_index
+
+        self.pending: list[TranscriptTurn] = []
+        self.writing: asyncio.Task = None
+        # Set after a failed batch, whose turns may have been stored after all
+        self.retrying = False
+
+    def add(self, chat: Chat, started_at=None, audio_start_ms=None, audio_end_ms=None):
+        self.pending.append(
+            TranscriptTurn(
+                interview_id=self.interview_pk,
+                index=self.index,
+                chat_id=chat.id,
+                role=chat.role,
+                text=chat.message,
+                interview_ended=chat.interview_ended,
+                started_at=started_at,
+                ended_at=timezone.now(),
+                audio_start_ms=audio_start_ms,
+                audio_end_ms=audio_end_ms,
+            )
+        )
+        self.index += 1
+
+    def flush(self):
+        if self.interview_pk is None:
+            # Sessions without a stored interview have nothing to store
+            self.pending.clear()
+            return
+
+        if self.writing is not None and not self.writing.done():
+            return
+
+        if self.pending:
+            self.writing = asyncio.create_task(self.write())
+
+    async def write(self):
+        batch = self.pending[:]
+        try:
+            # Turns already stored by an attempt that only looked failed are skipped
+            await database_sync_to_async(TranscriptTurn.objects.bulk_create)(
+                batch, ignore_conflicts=self.retrying
+            )
+        except IntegrityError as e:
+            # Another session wrote these indices; retrying would never succeed
+            logger.error(
+                f"Transcript turns {batch[0].index}-{batch[-1].index} of interview"
+                f" {self.interview_pk} are already stored, dropping them: {e!r}"
+            )
+        except Exception as e:
+            logger.error(f"Could not store {len(batch)} transcript turns: {e!r}")
+            self.retrying = True
+            return
+
+        del self.pending[: len(batch)]
+        self.retrying = False
+
+        self.writing = None
+        self.flush()
+
+    async def close(self):
+        if self.interview_pk is None:
+            return
+
+        while self.writing is not None and not self.writing.done():
+            await self.writing
+
+        if self.pending:
+            await self.write()
@@ -0,0 +1,48 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from gtts import gTTS, gTTSError
+
+TTS_MAX_WORKERS = int(os.environ.get("TTS_MAX_WORKERS", 4))
+TTS_TIMEOUT = float(os.environ.get("TTS_TIMEOUT", 15))
+
+# gTTS is blocking (HTTP request plus decoding), so it only ever runs on this pool
+executor = ThreadPoolExecutor(max_workers=TTS_MAX_WORKERS, thread_name_prefix="tts")
+
+
+logger = logging.getLogger(__name__)
+print = logger.info
+
+
+class TTSError(Exception):
+    pass
+
+
+async def synthesize_stream(text: str, timeout=TTS_TIMEOUT):
+    # Yields mp3 chunks as gTTS produces them, one per text part of the utterance
+    if not text or not text.strip():
+        return
+
+    loop = asyncio.get_running_loop()
+    parts = gTTS(text, lang="en", timeout=timeout).stream()
+
+    while True:
+        try:
+            chunk = await asyncio.wait_for(
+                loop.run_in_executor(executor, next, parts, None), timeout
+            )
+        except asyncio.TimeoutError as e:
+            raise TTSError(f"Speech synthesis timed out after {timeout}s") from e
+        except gTTSError as e:
+            raise TTSError(f"Speech synthesis failed: {e}") from e
+
+        if chunk is None:
+            return
+
+        yield chunk
+
+
+async def synthesize(text: str, timeout=TTS_TIMEOUT) -> bytes:
+    return b"".join([chunk async for chunk in synthesize_stream(text, timeout)])
@@ -1,7 +1,22 @@
 from django.urls import path
-from interview.views import CreateInterviewView, GetInterviewView
+from interview.views import (
+    CreateInterviewView,
+    GetInterviewView,
+    GetInterviewDetailView,
+    GetInterviewTurnsView,
+    InterviewStatusView,
+    MetricsView,
+)
 
 urlpatterns = [
     path("create/", CreateInterviewView.as_view(), name="create_interview"),
     path("get/", GetInterviewView.as_view(), name="get_interview"),
+    path("get/<uuid:interview_id>/", GetInterviewDetailView.as_view(), name="get_interview_detail"),
+    path(
+        "get/<uuid:interview_id>/turns/",
+        GetInterviewTurnsView.as_view(),
+        name="get_interview_turns",
+    ),
+    path("status/<uuid:interview_id>/", InterviewStatusView.as_view(), name="interview_status"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
 ]
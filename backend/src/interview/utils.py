@@ -1,45 +1,336 @@
 from datetime import datetime
+from fractions import Fraction
 
+import io
+import os
+import mmap
+import uuid
 import wave
 import numpy as np
 import scipy
+import scipy.signal
+
+# "poly": block-wise polyphase resampling with bounded memory, "fft": whole-buffer FFT
+RESAMPLE_METHOD = os.environ.get("RESAMPLE_METHOD", "poly")
+RESAMPLE_BLOCK_SAMPLES = 1 << 16
+
+# Recordings larger than this many bytes continue in a file next to the session's other output
+MEDIA_SPILL_THRESHOLD = int(os.environ.get("MEDIA_SPILL_THRESHOLD", 8 << 20))
+SPILL_WRITE_BUFFER = 256 << 10
 
 
 class MediaBuffer:
+    # Chunks are kept as immutable bytes objects, so appending never copies what is
+    # already stored and memoryviews handed out never block further appends.
     def __init__(self, SAMPLING_RATE):
-        self.buffer = b""
+        self.chunks: list[bytes] = []
+        self.size = 0
         self.SAMPLING_RATE = SAMPLING_RATE
 
+    def __len__(self):
+        return self.size
+
+    def resident_bytes(self) -> int:
+        return self.size
+
     def append(self, data):
-        self.buffer += data
+        if not data:
+            return
+
+        if not isinstance(data, bytes):
+            data = bytes(data)
+
+        self.chunks.append(data)
+        self.size += len(data)
 
     def clear(self):
-        self.buffer = b""
+        self.chunks = []
+        self.size = 0
+
+    def take(self):
+        # Move the stored chunks into a new buffer and reset this one, without copying
+        taken = MediaBuffer(self.SAMPLING_RATE)
+        taken.chunks, taken.size = self.chunks, self.size
+        self.clear()
+        return taken
+
+    def view(self) -> memoryview:
+        # Collapse the chunks once; later calls reuse the joined chunk until more data arrives
+        if len(self.chunks) > 1:
+            self.chunks = [b"".join(self.chunks)]
+
+        if not self.chunks:
+            return memoryview(b"")
+
+        return memoryview(self.chunks[0])
+
+    def get(self) -> bytes:
+        self.view()
+        return self.chunks[0] if self.chunks else b""
+
+    def read(self, start, end=None) -> bytes:
+        # Copy only the requested byte range, e.g. for a segment of the current answer
+        end = self.size if end is None else min(end, self.size)
+        if start >= end:
+            return b""
+
+        parts = []
+        offset = 0
+        for chunk in self.chunks:
+            chunk_end = offset + len(chunk)
+            if chunk_end > start and offset < end:
+                parts.append(chunk[max(start - offset, 0) : end - offset])
+            if chunk_end >= end:
+                break
+            offset = chunk_end
+
+        return b"".join(parts)
+
+    def as_array(self, dtype=np.int16) -> np.ndarray:
+        # Zero-copy, read-only view of the samples. A trailing partial sample is dropped.
+        view = self.view()
+        itemsize = np.dtype(dtype).itemsize
+        return np.frombuffer(view[: len(view) - len(view) % itemsize], dtype=dtype)
 
-    def get(self):
-        return self.buffer
+    def iter_blocks(self, block_bytes):
+        # Consecutive blocks of block_bytes (the last one may be shorter), without joining
+        pending = bytearray()
+        for chunk in self.chunks:
+            pending += chunk
+            while len(pending) >= block_bytes:
+                yield bytes(pending[:block_bytes])
+                del pending[:block_bytes]
 
-    def create_wav(self, wav_path, speed=1):
-        audio_buffer = np.frombuffer(self.buffer, dtype=np.int16).astype(np.float32) / 32768
+        if pending:
+            yield bytes(pending)
 
-        new_length = int(len(audio_buffer) / speed)
-        resampled_audio = scipy.signal.resample(audio_buffer, new_length)
-        scaled_audio = (resampled_audio * 32768).astype(np.int16)
+    def iter_samples(self, block_samples):
+        # int16 sample blocks; a trailing partial sample is dropped
+        for block in self.iter_blocks(block_samples * 2):
+            yield np.frombuffer(block, dtype=np.int16, count=len(block) // 2)
+
+    def create_wav(self, wav_path, speed=1, method=None):
+        # wav_path may also be a writable file object
+        method = method or RESAMPLE_METHOD
 
         # Write the audio data to a WAV file
         with wave.open(wav_path, "wb") as wf:
             wf.setnchannels(1)  # Mono audio
             wf.setsampwidth(2)  # 16-bit audio
             wf.setframerate(self.SAMPLING_RATE)
-            wf.writeframes(scaled_audio.tobytes())
+            # Declaring the length up front lets the frames go to non-seekable outputs too
+            wf.setnframes(resampled_length(self.size // 2, speed, method))
+
+            if speed == 1:
+                # Nothing to resample, copy the samples straight through
+                for block in self.iter_samples(RESAMPLE_BLOCK_SAMPLES):
+                    wf.writeframes(block)
+            elif method == "fft":
+                wf.writeframes(resample_fft(self.as_array(), speed).tobytes())
+            else:
+                blocks = self.iter_samples(RESAMPLE_BLOCK_SAMPLES)
+                for block in resample_poly_blocks(blocks, speed):
+                    wf.writeframes(block.tobytes())
+
+    def to_wav_bytes(self, speed=1) -> bytes:
+        wav_file = io.BytesIO()
+        self.create_wav(wav_file, speed=speed)
+        return wav_file.getvalue()
 
     def write_bytes(self, file_path):
+        # Write the chunks straight from memory instead of joining them first
         with open(file_path, "wb") as f:
-            f.write(self.buffer)
+            f.writelines(self.chunks)
+
+
+class SpillingMediaBuffer(MediaBuffer):
+    # Holds the first threshold bytes in memory like MediaBuffer, then moves them to spill_path
+    # and appends there. Reads of a spilled buffer go through a memory map of the file, so the
+    # recording lives in the page cache rather than the process heap, however long it gets.
+    # on_spill is called once the memory is given back.
+    def __init__(self, SAMPLING_RATE, spill_path, threshold=MEDIA_SPILL_THRESHOLD, on_spill=None):
+        super().__init__(SAMPLING_RATE)
+        self.spill_path = spill_path
+        self.threshold = threshold
+        self.on_spill = on_spill
+
+        self.spilled = False
+        self.file = None
+        # Map of the file at a given size, replaced once the file has grown
+        self.map: tuple[int, mmap.mmap] = None
+
+    @classmethod
+    def open(cls, file_path, SAMPLING_RATE):
+        # A buffer over a recording already on disk, e.g. audio.raw in the export job
+        buffer = cls(SAMPLING_RATE, file_path)
+        buffer.spilled = True
+        buffer.size = os.path.getsize(file_path)
+        return buffer
+
+    def resident_bytes(self) -> int:
+        return 0 if self.spilled else self.size
+
+    def append(self, data):
+        if not self.spilled:
+            super().append(data)
+            if self.size > self.threshold:
+                self.spill()
+            return
+
+        if data:
+            if self.file is None:
+                self.file = open(self.spill_path, "ab", buffering=SPILL_WRITE_BUFFER)
+            self.file.write(data)
+            self.size += len(data)
+
+    def spill(self):
+        self.file = open(self.spill_path, "wb", buffering=SPILL_WRITE_BUFFER)
+        self.file.writelines(self.chunks)
+        self.chunks = []
+        self.spilled = True
+
+        if self.on_spill is not None:
+            self.on_spill()
+
+    def mapped(self) -> memoryview:
+        if self.size == 0:
+            return memoryview(b"")
+
+        if self.map is None or self.map[0] != self.size:
+            if self.file is not None:
+                self.file.flush()
+            # An older map stays open until the views handed out from it are gone
+            with open(self.spill_path, "rb") as f:
+                self.map = (self.size, mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ))
+
+        return memoryview(self.map[1])
+
+    def clear(self):
+        super().clear()
+        if self.spilled:
+            self.close()
+            if os.path.exists(self.spill_path):
+                os.remove(self.spill_path)
+            self.spilled = False
+            self.map = None
+
+    def take(self):
+        if self.spilled:
+            raise ValueError("A spilled buffer cannot be taken")
+        return super().take()
+
+    def view(self) -> memoryview:
+        if not self.spilled:
+            return super().view()
+        return self.mapped()
+
+    def get(self) -> bytes:
+        if not self.spilled:
+            return super().get()
+        return bytes(self.mapped())
+
+    def read(self, start, end=None) -> bytes:
+        if not self.spilled:
+            return super().read(start, end)
+        return bytes(self.mapped()[start:end])
+
+    def iter_blocks(self, block_bytes):
+        if not self.spilled:
+            yield from super().iter_blocks(block_bytes)
+            return
+
+        view = self.mapped()
+        file_map = self.map[1]
+        released = 0
+        for offset in range(0, len(view), block_bytes):
+            yield bytes(view[offset : offset + block_bytes])
+
+            # Pages already read leave the process; the file stays in the page cache
+            done = (offset + block_bytes) // mmap.PAGESIZE * mmap.PAGESIZE
+            if done > released:
+                file_map.madvise(mmap.MADV_DONTNEED, released, min(done, len(view)) - released)
+                released = done
+
+    def write_bytes(self, file_path):
+        if not self.spilled:
+            return super().write_bytes(file_path)
+
+        # The spill file becomes the output, without copying the recording
+        self.close()
+        os.replace(self.spill_path, file_path)
+        self.spill_path = file_path
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def speed_ratio(speed) -> tuple[int, int]:
+    ratio = Fraction(1 / speed).limit_denominator(100)
+    return ratio.numerator, ratio.denominator
+
+
+def resampled_length(samples, speed, method) -> int:
+    if speed == 1:
+        return samples
+    if method == "fft":
+        return int(samples / speed)
+
+    up, down = speed_ratio(speed)
+    return -(-samples * up // down)
+
+
+def resample_fft(audio: np.ndarray, speed) -> np.ndarray:
+    audio_buffer = audio.astype(np.float32) / 32768
+
+    new_length = int(len(audio_buffer) / speed)
+    resampled_audio = scipy.signal.resample(audio_buffer, new_length)
+    return (resampled_audio * 32768).astype(np.int16)
+
+
+def resample_poly_blocks(blocks, speed, block_samples=RESAMPLE_BLOCK_SAMPLES):
+    """
+    Time-stretch a stream of int16 blocks by speed with a polyphase filter.
+
+    Each block is filtered together with a little context from its neighbours, so the output
+    matches resampling the whole signal at once while only a few blocks are held in memory.
+    """
+    up, down = speed_ratio(speed)
+
+    # Context on each side must cover the half-length of scipy's default filter
+    pad = down * (10 * max(up, down) // (up * down) + 2)
+    # Block boundaries must fall on multiples of down to keep the output phase aligned
+    block_samples = max(pad, block_samples - block_samples % down)
+
+    def resample(left, middle, right):
+        audio = np.concatenate((left, middle, right)).astype(np.float32)
+        resampled = scipy.signal.resample_poly(audio, up, down)
+        start = len(left) * up // down
+        length = -(-len(middle) * up // down)
+        resampled = resampled[start : start + length]
+        return np.clip(resampled, -32768, 32767).astype(np.int16)
+
+    left = pending = np.zeros(0, dtype=np.int16)
+    for block in blocks:
+        pending = np.concatenate((pending, block))
+
+        # Emit a block once its right-hand context has arrived
+        while len(pending) >= block_samples + pad:
+            middle = pending[:block_samples]
+            yield resample(left, middle, pending[block_samples : block_samples + pad])
+            left, pending = middle[-pad:], pending[block_samples:]
+
+    # The end of the signal needs no further context
+    while len(pending):
+        middle = pending[:block_samples]
+        yield resample(left, middle, pending[block_samples : block_samples + pad])
+        left, pending = middle[-pad:], pending[block_samples:]
 
 
 class Chat:
-    def __init__(self, message, role, interview_ended):
+    def __init__(self, message, role, interview_ended, chat_id=None):
+        self.id = chat_id or uuid.uuid4().hex
         self.message = message
         self.role = role
         self.interview_ended = interview_ended
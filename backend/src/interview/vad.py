@@ -0,0 +1,138 @@
+import os
+import logging
+
+import numpy as np
+
+try:
+    import onnxruntime
+except ImportError:  # pragma: no cover
+    onnxruntime = None
+
+
+SILERO_VAD_MODEL_PATH = os.environ.get("SILERO_VAD_MODEL_PATH", "models/silero_vad.onnx")
+SPEECH_THRESHOLD = float(os.environ.get("VAD_SPEECH_THRESHOLD", 0.5))
+ENERGY_THRESHOLD = float(os.environ.get("VAD_ENERGY_THRESHOLD", 0.01))
+# Silence after an answer that ends the turn, and the speech needed before it can end
+END_OF_TURN_SILENCE_MS = int(os.environ.get("END_OF_TURN_SILENCE_MS", 1500))
+END_OF_TURN_MIN_SPEECH_MS = int(os.environ.get("END_OF_TURN_MIN_SPEECH_MS", 500))
+
+
+logger = logging.getLogger(__name__)
+print = logger.info
+
+
+class EnergyVAD:
+    # Fallback detector: RMS energy of the window, scaled so the threshold maps to 0.5
+    def __init__(self, threshold=ENERGY_THRESHOLD):
+        self.threshold = threshold
+
+    def reset_states(self):
+        pass
+
+    def __call__(self, window: np.ndarray, sampling_rate: int) -> float:
+        samples = window.astype(np.float32) / 32768
+        rms = float(np.sqrt(np.mean(samples * samples))) if len(samples) else 0.0
+        return min(rms / (2 * self.threshold), 1.0)
+
+
+class SileroVAD:
+    # The onnx session is shared by every stream; only the recurrent state is per stream
+    _session = None
+
+    def __init__(self, model_path=SILERO_VAD_MODEL_PATH):
+        if SileroVAD._session is None:
+            options = onnxruntime.SessionOptions()
+            options.inter_op_num_threads = 1
+            options.intra_op_num_threads = 1
+            SileroVAD._session = onnxruntime.InferenceSession(
+                model_path, sess_options=options, providers=["CPUExecutionProvider"]
+            )
+        self.session = SileroVAD._session
+        self.reset_states()
+
+    def reset_states(self):
+        self._h = np.zeros((2, 1, 64), dtype=np.float32)
+        self._c = np.zeros((2, 1, 64), dtype=np.float32)
+
+    def __call__(self, window: np.ndarray, sampling_rate: int) -> float:
+        samples = (window.astype(np.float32) / 32768)[np.newaxis, :]
+        output, self._h, self._c = self.session.run(
+            None,
+            {
+                "input": samples,
+                "sr": np.array(sampling_rate, dtype=np.int64),
+                "h": self._h,
+                "c": self._c,
+            },
+        )
+        return float(output[0][0])
+
+
+def get_vad():
+    if onnxruntime is not None and os.path.exists(SILERO_VAD_MODEL_PATH):
+        try:
+            return SileroVAD()
+        except Exception as e:
+            print(f"Could not load the Silero VAD model, using energy VAD: {e}")
+
+    return EnergyVAD()
+
+
+class VoiceActivityTracker:
+    # Splits incoming int16 PCM into fixed windows and keeps track of speech and silence
+    def __init__(self, sampling_rate, window_size_samples, vad=None, threshold=SPEECH_THRESHOLD):
+        self.sampling_rate = sampling_rate
+        self.window_bytes = window_size_samples * 2
+        self.window_ms = window_size_samples * 1000 / sampling_rate
+        self.vad = vad or get_vad()
+        self.threshold = threshold
+
+        self.pending = bytearray()
+        self.reset()
+
+    def reset(self):
+        self.pending.clear()
+        self.vad.reset_states()
+
+        # Bytes that have been run through the detector since the last reset
+        self.processed_bytes = 0
+        self.speech_detected = False
+        self.speech_ms = 0.0
+        self.last_speech_bytes = 0
+        self.trailing_silence_ms = 0.0
+
+    def feed(self, data) -> int:
+        # Returns the number of complete windows that were evaluated
+        self.pending += data
+        windows = 0
+
+        while len(self.pending) >= self.window_bytes:
+            window = bytes(self.pending[: self.window_bytes])
+            del self.pending[: self.window_bytes]
+            probability = self.vad(np.frombuffer(window, dtype=np.int16), self.sampling_rate)
+
+            self.processed_bytes += self.window_bytes
+            windows += 1
+
+            if probability >= self.threshold:
+                self.speech_detected = True
+                self.speech_ms += self.window_ms
+                self.last_speech_bytes = self.processed_bytes
+                self.trailing_silence_ms = 0.0
+            else:
+                self.trailing_silence_ms += self.window_ms
+
+        return windows
+
+
+class EndOfTurnDetector:
+    # The candidate finished answering once enough speech was followed by enough silence
+    def __init__(self, silence_ms=END_OF_TURN_SILENCE_MS, min_speech_ms=END_OF_TURN_MIN_SPEECH_MS):
+        self.silence_ms = silence_ms
+        self.min_speech_ms = min_speech_ms
+
+    def ended(self, tracker: VoiceActivityTracker) -> bool:
+        return (
+            tracker.speech_ms >= self.min_speech_ms
+            and tracker.trailing_silence_ms >= self.silence_ms
+        )
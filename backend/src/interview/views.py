@@ -1,12 +1,73 @@
+import hmac
+import json
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+from django.db.models.functions import Substr
+from django.http import HttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 import jwt
 
-from .models import Interview
+from .models import Interview, TranscriptTurn
+from .metrics import registry, METRICS_TOKEN
 
 
 JWT_ALGORITHM = "HS256"
 
+INTERVIEW_PAGE_SIZE = 20
+INTERVIEW_MAX_PAGE_SIZE = 100
+JOB_DESCRIPTION_PREVIEW_CHARS = 200
+TURN_PAGE_SIZE = 50
+TURN_MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at, pk) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{pk}".encode()).decode()
+
+
+def decode_cursor(cursor) -> tuple[datetime, int]:
+    created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(created_at), int(pk)
+
+
+def load_json(value):
+    return json.loads(value) if value else None
+
+
+def get_page_params(request, page_size, max_page_size) -> tuple[int, str | None]:
+    limit = int(request.query_params.get("limit", page_size))
+    return min(max(limit, 1), max_page_size), request.query_params.get("cursor")
+
+
+def get_turns(interview_pk, after=-1, limit=TURN_PAGE_SIZE) -> dict:
+    # In interview order; the cursor is the index of the last turn of the previous page
+    turns = TranscriptTurn.objects.filter(interview_id=interview_pk, index__gt=after)
+    turns = list(turns.order_by("index")[: limit + 1])
+
+    next_cursor = None
+    if len(turns) > limit:
+        turns = turns[:limit]
+        next_cursor = str(turns[-1].index)
+
+    data = [
+        {
+            "index": turn.index,
+            "id": turn.chat_id,
+            "message": turn.text,
+            "role": turn.role,
+            "interview_ended": turn.interview_ended,
+            "timestamp": turn.ended_at,
+            "started_at": turn.started_at,
+            "audio_start_ms": turn.audio_start_ms,
+            "audio_end_ms": turn.audio_end_ms,
+        }
+        for turn in turns
+    ]
+    return {"results": data, "nextCursor": next_cursor}
+
 
 class CreateInterviewView(APIView):
     def post(self, request):
@@ -44,14 +105,128 @@ class CreateInterviewView(APIView):
 
 class GetInterviewView(APIView):
     def get(self, request):
+        # Newest first, one page at a time. The cursor is the position of the last interview
+        # of the previous page, so pages stay stable while new interviews are created.
         user = request.user
-        interviews = Interview.objects.order_by("-created_at").filter(user=user)
+
+        try:
+            limit, cursor = get_page_params(request, INTERVIEW_PAGE_SIZE, INTERVIEW_MAX_PAGE_SIZE)
+            if cursor:
+                created_at, pk = decode_cursor(cursor)
+        except (ValueError, binascii.Error, UnicodeDecodeError):
+            return Response({"detail": "Invalid Request"}, status=400)
+
+        interviews = Interview.objects.filter(user=user)
+        if cursor:
+            interviews = interviews.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+            )
+
+        # Only the listed columns are read, never the transcript or feedback
+        interviews = list(
+            interviews.order_by("-created_at", "-pk")
+            .annotate(
+                job_description_preview=Substr("job_description", 1, JOB_DESCRIPTION_PREVIEW_CHARS)
+            )
+            .values(
+                "pk",
+                "uid",
+                "company_name",
+                "job_description_preview",
+                "created_at",
+                "completed",
+            )[: limit + 1]
+        )
+
+        next_cursor = None
+        if len(interviews) > limit:
+            interviews = interviews[:limit]
+            next_cursor = encode_cursor(interviews[-1]["created_at"], interviews[-1]["pk"])
+
         data = [
+            {
+                "company_name": interview["company_name"],
+                "job_description": interview["job_description_preview"],
+                "interviewId": interview["uid"],
+                "created_at": interview["created_at"],
+                "completed": interview["completed"],
+            }
+            for interview in interviews
+        ]
+        return Response({"results": data, "nextCursor": next_cursor})
+
+
+class GetInterviewDetailView(APIView):
+    def get(self, request, interview_id):
+        # The transcript comes from the stored turns, its first page included here
+        interview = (
+            Interview.objects.filter(user=request.user, uid=interview_id)
+            .defer("transcript")
+            .first()
+        )
+        if interview is None:
+            return Response({"detail": "Not Found"}, status=404)
+
+        return Response(
             {
                 "company_name": interview.company_name,
                 "job_description": interview.job_description,
                 "interviewId": interview.uid,
+                "created_at": interview.created_at,
+                "started": interview.started,
+                "completed": interview.completed,
+                "status": interview.processing_status,
+                "transcript": get_turns(interview.pk),
+                "feedback": load_json(interview.feedback),
             }
-            for interview in interviews
-        ]
-        return Response(data)
+        )
+
+
+class GetInterviewTurnsView(APIView):
+    def get(self, request, interview_id):
+        try:
+            limit, cursor = get_page_params(request, TURN_PAGE_SIZE, TURN_MAX_PAGE_SIZE)
+            after = int(cursor) if cursor else -1
+        except ValueError:
+            return Response({"detail": "Invalid Request"}, status=400)
+
+        interview = Interview.objects.filter(user=request.user, uid=interview_id).only("pk").first()
+        if interview is None:
+            return Response({"detail": "Not Found"}, status=404)
+
+        return Response(get_turns(interview.pk, after, limit))
+
+
+class InterviewStatusView(APIView):
+    def get(self, request, interview_id):
+        # Polled by the client after the interview until the feedback is ready
+        interview = (
+            Interview.objects.filter(user=request.user, uid=interview_id)
+            .only("uid", "completed", "processing_status")
+            .first()
+        )
+        if interview is None:
+            return Response({"detail": "Not Found"}, status=404)
+
+        return Response(
+            {
+                "interviewId": interview.uid,
+                "completed": interview.completed,
+                "status": interview.processing_status,
+                "feedbackReady": interview.processing_status == Interview.ProcessingStatus.READY,
+            }
+        )
+
+
+class MetricsView(APIView):
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        # Labels carry interview uids and socket ids, so only a scraper holding the token gets them
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not METRICS_TOKEN or not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            return Response({"detail": "Not Found"}, status=404)
+
+        # Prometheus text exposition of this worker's interview latencies
+        return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4")
@@ -3,6 +3,7 @@ from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.core.management.utils import get_random_secret_key
 from .managers import UserManager
+from .secret_keys import secret_key_cache
 
 
 class User(AbstractUser):
@@ -32,7 +33,8 @@ class User(AbstractUser):
 
     def regenerate_secret_key(self):
         self.secret_key = get_random_secret_key()
-        self.save()
+        self.save(update_fields=["secret_key"])
+        secret_key_cache.invalidate(self.email)
 
     def __str__(self):
         return self.email
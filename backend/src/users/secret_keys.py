@@ -0,0 +1,54 @@
+import os
+import time
+import threading
+
+# Short enough that a key regenerated on another worker stops being accepted soon after
+SECRET_KEY_CACHE_TTL = float(os.environ.get("SECRET_KEY_CACHE_TTL", 30))
+SECRET_KEY_CACHE_SIZE = int(os.environ.get("SECRET_KEY_CACHE_SIZE", 10000))
+# A token that fails against a key loaded less than this many seconds ago is rejected outright;
+# an older key is reloaded once, as it may have been regenerated on another worker
+SECRET_KEY_RECHECK_AFTER = float(os.environ.get("SECRET_KEY_RECHECK_AFTER", 5))
+
+
+class SecretKeyCache:
+    # Per-process cache of the secret keys interview tokens are signed with, keyed by email
+    def __init__(self, ttl=SECRET_KEY_CACHE_TTL, max_size=SECRET_KEY_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        # email -> (when the key was loaded, key)
+        self.keys: dict[str, tuple[float, str]] = {}
+        self.lock = threading.Lock()
+
+    def get(self, email) -> str | None:
+        entry = self.entry(email)
+        return None if entry is None else entry[0]
+
+    def entry(self, email) -> tuple[str, float] | None:
+        # The cached key and its age in seconds
+        entry = self.keys.get(email)
+        if entry is None:
+            return None
+
+        loaded, secret_key = entry
+        age = time.monotonic() - loaded
+        if age > self.ttl:
+            self.invalidate(email)
+            return None
+        return secret_key, age
+
+    def set(self, email, secret_key):
+        with self.lock:
+            if len(self.keys) >= self.max_size:
+                oldest = time.monotonic() - self.ttl
+                self.keys = {k: v for k, v in self.keys.items() if v[0] >= oldest}
+                if len(self.keys) >= self.max_size:
+                    self.keys.clear()
+
+            self.keys[email] = (time.monotonic(), secret_key)
+
+    def invalidate(self, email):
+        with self.lock:
+            self.keys.pop(email, None)
+
+
+secret_key_cache = SecretKeyCache()
@@ -1,3 +1,44 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+
+from .models import User
+from .secret_keys import SecretKeyCache, secret_key_cache
+
+
+class SecretKeyCacheTests(SimpleTestCase):
+    def test_entries_expire(self):
+        cache = SecretKeyCache(ttl=30)
+        with mock.patch("time.monotonic", return_value=100):
+            cache.set("a@example.com", "key")
+        with mock.patch("time.monotonic", return_value=110):
+            self.assertEqual(cache.entry("a@example.com"), ("key", 10))
+        with mock.patch("time.monotonic", return_value=131):
+            self.assertIsNone(cache.get("a@example.com"))
+        self.assertEqual(cache.keys, {})
+
+    def test_size_is_bounded(self):
+        cache = SecretKeyCache(ttl=30, max_size=2)
+        with mock.patch("time.monotonic", return_value=100):
+            cache.set("a@example.com", "a")
+        with mock.patch("time.monotonic", return_value=120):
+            cache.set("b@example.com", "b")
+        # The expired entry makes room first
+        with mock.patch("time.monotonic", return_value=140):
+            cache.set("c@example.com", "c")
+            self.assertEqual(set(cache.keys), {"b@example.com", "c@example.com"})
+            cache.set("d@example.com", "d")
+            self.assertEqual(set(cache.keys), {"d@example.com"})
+
+
+class RegenerateSecretKeyTests(TestCase):
+    def test_drops_the_cached_key(self):
+        user = User.objects.create_user("a@example.com")
+        secret_key_cache.set(user.email, user.secret_key)
+        self.addCleanup(secret_key_cache.invalidate, user.email)
+
+        old_key = user.secret_key
+        user.regenerate_secret_key()
+
+        self.assertIsNone(secret_key_cache.get(user.email))
+        self.assertNotEqual(User.objects.get(pk=user.pk).secret_key, old_key)
@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 # myproject/asgi.py
 import os
+import asyncio
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "webapp.settings")
@@ -16,6 +17,14 @@ django_asgi_app = get_asgi_application()
 
 from socketio import ASGIApp
 from interview.socket_server import sio
+from interview.jobs import start_workers
+from interview.llm_client import warm_up
 
 
-application = ASGIApp(sio, django_asgi_app)
+async def on_startup():
+    start_workers()
+    # Create the pooled LLM clients in the background, before the first interview needs them
+    asyncio.get_running_loop().run_in_executor(None, warm_up)
+
+
+application = ASGIApp(sio, django_asgi_app, on_startup=on_startup)